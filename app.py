@@ -4,15 +4,26 @@ import streamlit as st
 import pandas as pd
 from pydantic import ValidationError
 import logging
-from typing import Dict
+import io
+import os
+import time
+from datetime import date
+from typing import Dict, Optional, Tuple
 
-from models.patient import Patient
+from models.patient import Patient, PATIENT_INPUT_LIMITS
 from models.solution import Solution
 from models.additive import Additive
 from models.infusion_mix import InfusionMix
-from utils.data_loader import load_solutions, load_additives
+from models.infusion_line import LineSpec
+from models.compatibility import CompatibilityLimits
+from utils.data_loader import get_catalog, get_catalog_version
 from utils.logging_config import setup_logging
-from calculation.infusion_calculator import calculate_infusion
+from utils.result_store import ResultStore, ResultStoreError
+from utils.profiling import ProfileReport, maybe_profile, profiling_enabled
+from utils.exporters import MIX_COLUMNS, iter_mix_rows, write_csv, write_jsonl, write_worksheet
+from calculation.infusion_calculator import calculate_infusion, compile_composition
+from calculation.explain import detailed_report_markdown
+from calculation.recipe_atlas import DEFAULT_ATLAS_PATH, RecipeAtlas
 
 # ログ設定
 setup_logging()
@@ -50,9 +61,19 @@ def initialize_session_state():
         'fat_input': 0.0,
         'weight': 1.50,
         'twi': 110.0,
+        'two_line': False,
+        'main_max_rate': 0.0,
+        'main_max_glucose': 0.0,
+        'lipid_hours': 24.0,
+        'lipid_max_rate': 0.0,
+        'max_osmolarity': 0.0,
+        'max_ca_p_sum': 0.0,
+        'patient_id': '',
+        'order_date': date.today(),
         'selected_solution': None,
         'patient': None,
-        'infusion_mix': None
+        'infusion_mix': None,
+        'export_files': None
     }
     for k, v in defaults.items():
         if k not in st.session_state:
@@ -60,20 +81,74 @@ def initialize_session_state():
 
 def reset_values():
     """
-    セッションステートのリセット
+    セッションステートのリセット（ボタンのon_clickコールバックとして実行）
     """
     keys_to_keep = {
         'gir_checkbox', 'gir_input', 'amino_acid_checkbox', 'amino_acid_input',
         'na_checkbox', 'na_input', 'k_checkbox', 'k_input', 'cl_checkbox', 'cl_input',
         'ca_checkbox', 'ca_input', 'mg_checkbox', 'mg_input', 'zn_checkbox', 'zn_input',
         'fat_checkbox', 'fat_input',
-        'weight', 'twi', 'selected_solution'
+        'weight', 'twi', 'selected_solution', 'patient_id', 'order_date',
+        'two_line', 'main_max_rate', 'main_max_glucose', 'lipid_hours', 'lipid_max_rate',
+        'max_osmolarity', 'max_ca_p_sum'
     }
     for k in list(st.session_state.keys()):
         if k not in keys_to_keep:
             del st.session_state[k]
     initialize_session_state()
-    st.experimental_rerun()
+
+@st.cache_resource
+def get_result_store() -> ResultStore:
+    """
+    計算結果ストアをプロセス内で1つだけ作成する
+    """
+    return ResultStore()
+
+@st.cache_resource
+def get_recipe_atlas() -> Optional[RecipeAtlas]:
+    """
+    事前計算した配合表（tools/build_atlas.py で作成）。無ければNoneで、常に最適化を行う
+    """
+    return RecipeAtlas() if os.path.exists(DEFAULT_ATLAS_PATH) else None
+
+def load_previous_order():
+    """
+    患者IDの最新の保存済みオーダーを入力欄と計算結果に読み込む（再計算はしない）
+    """
+    patient_id = st.session_state.patient_id.strip()
+    if not patient_id:
+        st.session_state.load_message = ("warning", "患者IDを入力してください。")
+        return
+    record = get_result_store().latest(patient_id)
+    if record is None:
+        st.session_state.load_message = ("warning", f"患者ID {patient_id} の保存済みオーダーはありません。")
+        return
+
+    patient = record.patient
+    st.session_state.weight = patient.weight
+    st.session_state.twi = patient.twi
+    for field in ['gir', 'amino_acid', 'na', 'k', 'cl', 'ca', 'mg', 'zn', 'fat']:
+        included = getattr(patient, f"{field}_included")
+        st.session_state[f"{field}_checkbox"] = included
+        if included and getattr(patient, field) is not None:
+            st.session_state[f"{field}_input"] = getattr(patient, field)
+    catalog = get_catalog()
+    notes = []
+    # 現在のカタログに無いベース製剤を選択肢に設定すると、次の再実行で selectbox がエラーになる
+    if catalog is not None and catalog.solution_by_name(record.base_solution_name) is not None:
+        st.session_state.base_solution_selectbox = record.base_solution_name
+    else:
+        notes.append(f"ベース製剤「{record.base_solution_name}」は現在のカタログに無いため、選択は変更していません。")
+    st.session_state.patient = patient
+    st.session_state.infusion_mix = record.infusion_mix
+    st.session_state.order_loaded = True
+    if record.catalog_version and catalog is not None and record.catalog_version != catalog.version:
+        notes.append(f"このオーダーは旧カタログ（{record.catalog_version}）で計算されています。")
+    st.session_state.load_message = (
+        "warning" if notes else "success",
+        f"{record.order_date} のオーダーを読み込みました。" + "".join(notes),
+    )
+    logging.info(f"保存済みオーダーの読み込み: patient_id={patient_id}, id={record.id}")
 
 def create_patient_object() -> Patient:
     """
@@ -251,24 +326,148 @@ def display_calculation_results(infusion_mix: InfusionMix, patient: Patient, add
     infusion_detail_df = pd.DataFrame(table_data, columns=table_headers)
     st.dataframe(infusion_detail_df.style.set_properties(**{'text-align': 'left'}))
 
-    # 計算ステップの表示
-    with st.expander("詳細計算ステップを表示"):
-        st.markdown(f"**計算ステップ:**\n\n{infusion_mix.calculation_steps}")
+    if infusion_mix.lines:
+        display_line_rates(infusion_mix)
 
-def main():
-    initialize_session_state()
-    
-    st.title("Neonatal TPN 配合計算ツール")
-    st.markdown("---")
-    st.header("ベース製剤選択")
+    if infusion_mix.osmolarity is not None:
+        st.caption(
+            f"混合液（脂肪乳剤を除く）の浸透圧: {infusion_mix.osmolarity:.0f} mOsm/L、"
+            f"Ca+P: {infusion_mix.ca_p_sum:.1f}"
+        )
 
-    solutions = load_solutions()
-    additives = load_additives()
+    display_export_buttons(infusion_mix)
 
-    if not solutions or not additives:
-        st.error("データロード失敗。ファイルを確認してください。")
-        st.stop()
+    # 計算ステップの表示（説明文は表示する時だけ生成する）
+    if st.toggle("詳細計算ステップを表示", key="show_calculation_steps"):
+        display_calculation_steps(infusion_mix)
 
+def display_line_rates(infusion_mix: InfusionMix):
+    """
+    ライン毎の投与量・投与速度・糖濃度を表示
+    """
+    st.subheader("投与ライン別")
+    rows = []
+    for line in infusion_mix.lines:
+        rows.append({
+            'ライン': line.label,
+            '製剤': "、".join(name for name, volume in line.volumes.items() if volume > 0),
+            '投与量 (mL/day)': f"{line.total_volume:.2f}",
+            '投与時間 (h)': f"{line.hours:g}",
+            '速度 (mL/h)': f"{line.rate:.2f}",
+            '糖濃度 (%)': f"{line.concentrations.get('Glucose', 0.0) * 100:.1f}",
+        })
+    st.dataframe(pd.DataFrame(rows), hide_index=True)
+
+def display_calculation_steps(infusion_mix: InfusionMix):
+    """
+    計算ステップと、制約の状況（拘束の有無・双対価格）・処理時間を表示
+    """
+    if infusion_mix.report is None:
+        st.info("この計算結果には計算ステップが記録されていません。")
+        return
+    st.markdown(f"**計算ステップ:**\n\n{infusion_mix.calculation_steps}")
+    # 制約の詳細は計算時と同じカタログの組成でのみ求める（現在のカタログで代用すると含量の変更が反映されない）
+    catalog = get_catalog_version(infusion_mix.catalog_version) if infusion_mix.catalog_version else None
+    solution = catalog.solution_by_name(infusion_mix.report.base_solution_name) if catalog else None
+    if solution is None:
+        st.caption(f"制約の詳細は表示できません: 計算時のカタログ（バージョン {infusion_mix.catalog_version or '不明'}）が見つかりません。")
+        return
+    product_names, coefficients = compile_composition(solution, catalog.additives)
+    try:
+        st.markdown(detailed_report_markdown(infusion_mix, product_names, coefficients))
+    except ValueError as ve:
+        st.caption(f"制約の詳細は表示できません: {ve}")
+
+def build_export_files(infusion_mix: InfusionMix, label: str) -> Tuple[bytes, bytes, bytes]:
+    """
+    ダウンロード用のCSV / JSONL / 調製指示書を作成する。
+    同じ計算結果とラベルの間はセッションに保持したものを返し、再実行の度に作り直さない。
+    """
+    cached = st.session_state.export_files
+    if cached is not None and cached[0] is infusion_mix and cached[1] == label:
+        return cached[2]
+    csv_buffer, jsonl_buffer, worksheet_buffer = io.StringIO(), io.StringIO(), io.StringIO()
+    write_csv(iter_mix_rows(infusion_mix, label), csv_buffer, MIX_COLUMNS)
+    write_jsonl(iter_mix_rows(infusion_mix, label), jsonl_buffer)
+    write_worksheet([(label, infusion_mix)], worksheet_buffer)
+    files = (
+        csv_buffer.getvalue().encode('utf-8-sig'),
+        jsonl_buffer.getvalue().encode('utf-8'),
+        worksheet_buffer.getvalue().encode('utf-8'),
+    )
+    st.session_state.export_files = (infusion_mix, label, files)
+    return files
+
+def display_export_buttons(infusion_mix: InfusionMix):
+    """
+    計算結果のダウンロードボタン（CSV / JSONL / 調製指示書）を表示
+    """
+    label = f"{st.session_state.patient_id.strip() or '患者ID未入力'} {st.session_state.order_date}"
+    csv_data, jsonl_data, worksheet_data = build_export_files(infusion_mix, label)
+
+    export_cols = st.columns(3)
+    with export_cols[0]:
+        st.download_button("CSVで保存", csv_data, "tpn_mix.csv", "text/csv")
+    with export_cols[1]:
+        st.download_button("JSONLで保存", jsonl_data, "tpn_mix.jsonl", "application/jsonl")
+    with export_cols[2]:
+        st.download_button("調製指示書", worksheet_data, "tpn_worksheet.txt", "text/plain")
+
+def profiling_active() -> bool:
+    """
+    プロファイルモードの判定（環境変数 TPN_PROFILE または URLの ?profile=1）
+    """
+    return profiling_enabled() or st.query_params.get("profile") == "1"
+
+def display_profile_reports(reports: Dict[str, ProfileReport]):
+    """
+    計算・描画のプロファイル結果と、.prof / 要約のダウンロードボタンを表示
+    """
+    with st.expander("プロファイル（デバッグ）"):
+        for name, report in reports.items():
+            if report is None:
+                continue
+            st.text(report.summary_text())
+            cols = st.columns(2)
+            with cols[0]:
+                st.download_button(f"{report.label}.prof", report.prof_data, f"{report.label}.prof",
+                                   "application/octet-stream", key=f"profile_prof_{name}")
+            with cols[1]:
+                st.download_button(f"{report.label}.txt", report.summary_text().encode('utf-8'), f"{report.label}.txt",
+                                   "text/plain", key=f"profile_txt_{name}")
+
+# 入力欄の定義: (キー接頭辞, チェックボックスのラベル, 入力欄のラベル, 刻み)。範囲は PATIENT_INPUT_LIMITS
+BASIC_INPUTS = [
+    ('gir', "GIR条件", "GIR (mg/kg/min)", 0.1),
+    ('amino_acid', "アミノ酸条件", "アミノ酸量 (g/kg/day)", 0.1),
+    ('fat', "脂肪条件", "脂肪量 (g/kg/day)", 0.1),
+]
+ELECTROLYTE_INPUTS = [
+    ('na', "Na条件", "Na量 (mEq/kg/day)", 0.1),
+    ('k', "K条件", "K量 (mEq/kg/day)", 0.1),
+    ('cl', "Cl条件", "Cl量 (mEq/kg/day)", 0.1),
+    ('ca', "Ca条件", "Ca量 (mEq/kg/day)", 0.1),
+    ('mg', "Mg条件", "Mg量 (mEq/kg/day)", 0.1),
+    ('zn', "Zn条件", "Zn量 (mmol/kg/day)", 0.1),
+]
+
+def nutrient_inputs(inputs):
+    """
+    条件のチェックボックスと目標値の入力欄を並べて表示（フォーム内では表示を切り替えられないため常に両方を表示）
+    """
+    for prefix, checkbox_label, input_label, step in inputs:
+        min_value, max_value = PATIENT_INPUT_LIMITS[prefix]
+        check_col, input_col = st.columns([1, 2])
+        with check_col:
+            st.checkbox(checkbox_label, key=f"{prefix}_checkbox")
+        with input_col:
+            st.number_input(input_label, min_value=min_value, max_value=max_value, step=step, key=f"{prefix}_input")
+
+@st.fragment
+def base_solution_section(solutions):
+    """
+    ベース製剤の選択と詳細表。選択を変えてもこのフラグメントだけが再実行される
+    """
     selected_solution_name = st.selectbox(
         "ベース製剤を選択",
         [sol.name for sol in solutions],
@@ -279,77 +478,189 @@ def main():
     if st.session_state.selected_solution:
         display_solution_details(st.session_state.selected_solution)
 
-    st.markdown("---")
-    st.header("患者情報・目標値入力")
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.subheader("基本設定")
-        st.number_input("体重 (kg)", min_value=0.1, max_value=150.0, step=0.01, key="weight")
-        st.number_input("TWI (mL/kg/day)", min_value=50.0, max_value=200.0, step=1.0, key="twi")
-        gir_included = st.checkbox("GIR条件", key="gir_checkbox")
-        if gir_included:
-            st.number_input("GIR (mg/kg/min)", min_value=4.0, max_value=10.0, step=0.1, key="gir_input")
-        amino_acid_included = st.checkbox("アミノ酸条件", key="amino_acid_checkbox", value=False)
-        if amino_acid_included:
-            st.number_input("アミノ酸量 (g/kg/day)", min_value=2.0, max_value=4.0, step=0.1, key="amino_acid_input")
-        fat_included = st.checkbox("脂肪条件", key="fat_checkbox")
-        if fat_included:
-            st.number_input("脂肪量 (g/kg/day)", min_value=0.0, max_value=5.0, step=0.1, key="fat_input")
-
-    with col2:
-        st.subheader("電解質等条件")
-        na_included = st.checkbox("Na条件", key="na_checkbox")
-        if na_included:
-            st.number_input("Na量 (mEq/kg/day)", min_value=2.0, max_value=4.0, step=0.1, key="na_input")
-        k_included = st.checkbox("K条件", key="k_checkbox")
-        if k_included:
-            st.number_input("K量 (mEq/kg/day)", min_value=1.0, max_value=3.0, step=0.1, key="k_input")
-        cl_included = st.checkbox("Cl条件", key="cl_checkbox")
-        if cl_included:
-            st.number_input("Cl量 (mEq/kg/day)", min_value=0.0, max_value=5.0, step=0.1, key="cl_input")
-        ca_included = st.checkbox("Ca条件", value=False, key="ca_checkbox")
-        if ca_included:
-            st.number_input("Ca量 (mEq/kg/day)", min_value=0.0, max_value=5.0, step=0.1, key="ca_input")
-        mg_included = st.checkbox("Mg条件", value=False, key="mg_checkbox")
-        if mg_included:
-            st.number_input("Mg量 (mEq/kg/day)", min_value=0.0, max_value=5.0, step=0.1, key="mg_input")
-        zn_included = st.checkbox("Zn条件", value=False, key="zn_checkbox")
-        if zn_included:
-            st.number_input("Zn量 (mmol/kg/day)", min_value=0.0, max_value=10.0, step=0.1, key="zn_input")
+@st.fragment
+def order_lookup_section():
+    """
+    患者ID・オーダー日と前回オーダーの読み込み
+    """
+    id_cols = st.columns([2, 2, 1])
+    with id_cols[0]:
+        st.text_input("患者ID", key="patient_id")
+    with id_cols[1]:
+        st.date_input("オーダー日", key="order_date")
+    with id_cols[2]:
+        st.button("前回オーダー読込", on_click=load_previous_order)
+    if st.session_state.pop('order_loaded', False):
+        # 入力フォームと計算結果も読み込んだ内容で描き直す
+        st.rerun()
+    if 'load_message' in st.session_state:
+        level, message = st.session_state.pop('load_message')
+        getattr(st, level)(message)
+
+def patient_form() -> bool:
+    """
+    患者情報・目標値の入力フォーム。入力中は再実行されず、送信時にのみ計算する。
+    計算ボタンが押された場合にTrueを返す
+    """
+    with st.form("patient_form", border=False):
+        col1, col2 = st.columns(2)
+        with col1:
+            st.subheader("基本設定")
+            weight_min, weight_max = PATIENT_INPUT_LIMITS['weight']
+            twi_min, twi_max = PATIENT_INPUT_LIMITS['twi']
+            st.number_input("体重 (kg)", min_value=weight_min, max_value=weight_max, step=0.01, key="weight")
+            st.number_input("TWI (mL/kg/day)", min_value=twi_min, max_value=twi_max, step=1.0, key="twi")
+            nutrient_inputs(BASIC_INPUTS)
+        with col2:
+            st.subheader("電解質等条件")
+            nutrient_inputs(ELECTROLYTE_INPUTS)
+
+        with st.expander("投与ライン"):
+            st.checkbox("メインバッグと脂肪乳剤シリンジを分けて計算（2ライン）", key="two_line")
+            line_cols = st.columns(4)
+            with line_cols[0]:
+                st.number_input("メイン 最大速度 (mL/h, 0=制限なし)", min_value=0.0, max_value=100.0, step=0.1, key="main_max_rate")
+            with line_cols[1]:
+                st.number_input("メイン 最大糖濃度 (%, 0=制限なし)", min_value=0.0, max_value=50.0, step=0.5, key="main_max_glucose")
+            with line_cols[2]:
+                st.number_input("脂肪 投与時間 (h)", min_value=1.0, max_value=24.0, step=1.0, key="lipid_hours")
+            with line_cols[3]:
+                st.number_input("脂肪 最大速度 (mL/h, 0=制限なし)", min_value=0.0, max_value=20.0, step=0.1, key="lipid_max_rate")
+
+        with st.expander("配合変化・浸透圧"):
+            compat_cols = st.columns(2)
+            with compat_cols[0]:
+                st.number_input("最大浸透圧 (mOsm/L, 0=制限なし)", min_value=0.0, max_value=3000.0, step=10.0, key="max_osmolarity")
+            with compat_cols[1]:
+                st.number_input("最大 Ca+P (mEq/L + mmol/L, 0=制限なし)", min_value=0.0, max_value=200.0, step=1.0, key="max_ca_p_sum")
+
+        st.markdown("---")
+        button_cols = st.columns([1, 1, 4])
+        with button_cols[0]:
+            st.form_submit_button('リセット', type="secondary", on_click=reset_values)
+        with button_cols[1]:
+            calc_button = st.form_submit_button("配合を計算", type="primary")
+    return calc_button
+
+def create_line_specs() -> Optional[Tuple[LineSpec, ...]]:
+    """
+    2ラインで計算する場合のライン条件（0は制限なし）。1ラインの場合はNone
+    """
+    if not st.session_state.two_line:
+        return None
+    main = LineSpec(
+        name='main', label='メインバッグ',
+        max_rate=st.session_state.main_max_rate or None,
+        max_concentration={'Glucose': st.session_state.main_max_glucose / 100.0} if st.session_state.main_max_glucose else {},
+    )
+    lipid = LineSpec(
+        name='lipid', label='脂肪乳剤シリンジ', lipid=True,
+        hours=st.session_state.lipid_hours,
+        max_rate=st.session_state.lipid_max_rate or None,
+    )
+    return main, lipid
 
-    st.markdown("---")
-    button_cols = st.columns([1, 1, 4])
-    with button_cols[0]:
-        if st.button('リセット', type="secondary"):
-            reset_values()
-    with button_cols[1]:
-        calc_button = st.button("配合を計算", type="primary")
-    
-    if calc_button:
-        with st.spinner("計算中..."):
-            try:
-                if st.session_state.selected_solution is None:
-                    st.error("ベース製剤を選択してください。")
-                    raise ValueError("selected_solution is None")
-                patient = create_patient_object()
-                st.session_state.patient = patient
-                infusion_mix = calculate_infusion(patient, st.session_state.selected_solution, additives)
-                st.session_state.infusion_mix = infusion_mix
-            except ValidationError as ve:
-                st.error("入力値にエラーがあります。再確認してください。")
-                logging.error(f"ValidationError: {ve}")
-            except ValueError as ve:
-                st.error(str(ve))
-                logging.error(f"ValueError: {ve}")
-            except Exception as e:
-                st.error(f"計算中にエラーが発生しました: {e}")
-                logging.error(f"Exception: {e}")
+def create_compatibility_limits() -> Optional[CompatibilityLimits]:
+    """
+    脂肪乳剤以外の混合液の浸透圧・Ca+Pの上限（0は制限なし）。上限を設定しない場合はNone
+    """
+    if not (st.session_state.max_osmolarity or st.session_state.max_ca_p_sum):
+        return None
+    return CompatibilityLimits(
+        max_osmolarity=st.session_state.max_osmolarity or None,
+        max_ca_p_sum=st.session_state.max_ca_p_sum or None,
+    )
 
+def run_calculation(catalog):
+    """
+    入力値から配合を計算し、結果をセッションステートと結果ストアに保存
+    """
+    additives = catalog.additives
+    with st.spinner("計算中..."):
+        try:
+            if st.session_state.selected_solution is None:
+                st.error("ベース製剤を選択してください。")
+                raise ValueError("selected_solution is None")
+            patient = create_patient_object()
+            st.session_state.patient = patient
+            profiling = profiling_active()
+            start = time.perf_counter()
+            with maybe_profile(profiling, "calculate_infusion") as profile:
+                infusion_mix = calculate_infusion(
+                    patient, st.session_state.selected_solution, additives,
+                    catalog_version=catalog.version, atlas=get_recipe_atlas(), lines=create_line_specs(),
+                    compatibility=create_compatibility_limits(),
+                )
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            st.session_state.infusion_mix = infusion_mix
+            st.session_state.profile_reports = {'calculate': profile.report} if profiling else {}
+            if st.session_state.patient_id.strip():
+                try:
+                    get_result_store().record(
+                        patient_id=st.session_state.patient_id.strip(),
+                        order_date=st.session_state.order_date,
+                        patient=patient,
+                        base_solution_name=st.session_state.selected_solution.name,
+                        infusion_mix=infusion_mix,
+                        elapsed_ms=elapsed_ms,
+                        catalog_version=catalog.version,
+                    )
+                except ResultStoreError as e:
+                    # 計算結果の表示は続ける。停止したストアは破棄し、次の計算で作り直す
+                    st.warning(f"計算結果を保存できませんでした: {e}")
+                    logging.error(f"ResultStoreError: {e}")
+                    get_result_store.clear()
+        except ValidationError as ve:
+            st.error("入力値にエラーがあります。再確認してください。")
+            logging.error(f"ValidationError: {ve}")
+        except ValueError as ve:
+            st.error(str(ve))
+            logging.error(f"ValueError: {ve}")
+        except Exception as e:
+            st.error(f"計算中にエラーが発生しました: {e}")
+            logging.error(f"Exception: {e}")
+
+@st.fragment
+def results_section(additives: Dict[str, Additive]):
+    """
+    計算結果の表示。ダウンロード等の操作ではこのフラグメントだけが再実行される
+    """
     if 'infusion_mix' in st.session_state and st.session_state['infusion_mix'] is not None:
         infusion_mix = st.session_state['infusion_mix']
         patient = st.session_state['patient']
-        display_calculation_results(infusion_mix, patient, additives)
+        profiling = profiling_active()
+        with maybe_profile(profiling, "display_calculation_results") as profile:
+            display_calculation_results(infusion_mix, patient, additives)
+        if profiling:
+            reports = st.session_state.setdefault('profile_reports', {})
+            reports['render'] = profile.report
+            display_profile_reports(reports)
+
+def main():
+    initialize_session_state()
+    
+    st.title("Neonatal TPN 配合計算ツール")
+    st.markdown("---")
+    st.header("ベース製剤選択")
+
+    # ファイル更新時は再起動なしで新しいカタログバージョンに切り替わる
+    catalog = get_catalog()
+
+    if catalog is None or not catalog.solutions or not catalog.additives:
+        st.error("データロード失敗。ファイルを確認してください。")
+        st.stop()
+    st.caption(f"カタログバージョン: {catalog.version}")
+
+    base_solution_section(catalog.solutions)
+
+    st.markdown("---")
+    st.header("患者情報・目標値入力")
+    order_lookup_section()
+
+    if patient_form():
+        run_calculation(catalog)
+
+    results_section(catalog.additives)
 
 if __name__ == "__main__":
     main()
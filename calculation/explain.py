@@ -0,0 +1,137 @@
+# calculation/explain.py
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+from pydantic import BaseModel
+
+from models.infusion_mix import InfusionMix
+from calculation.model_template import NUTRIENTS, CapRow, compatibility_cap_rows, line_cap_rows
+from calculation.recipe_atlas import BINDING_TOLERANCE, extract_basis
+
+class ConstraintDetail(BaseModel):
+    nutrient: str  # 栄養素、または上限制約の表示名
+    target: float
+    lower: Optional[float]  # 上限制約はNone
+    upper: float
+    supply: float  # 供給量（上限制約は投与量・濃度）
+    slack: float  # 近い方の境界までの余裕
+    binding: Optional[str] = None  # 'L' 下限で拘束 / 'U' 上限で拘束
+    shadow_price: Optional[float] = None  # 境界を1単位動かした時の総投与量の変化（mL/day）
+    kind: str = 'nutrient'  # 'nutrient' 供給量 / 'cap' 投与ライン・浸透圧等の上限
+
+def constraint_details(
+    infusion_mix: InfusionMix,
+    product_names: Sequence[str],
+    coefficients: Sequence[Sequence[float]],
+) -> List[ConstraintDetail]:
+    """
+    計算結果の各制約（栄養素の供給量、投与ラインの投与量・濃度の上限、浸透圧・Ca/Pの上限）について、余裕・拘束の有無・双対価格を求める。
+    双対価格は最適解の基底から求める（CBCの再実行はしない）。
+    """
+    report = infusion_mix.report
+    if report is None:
+        raise ValueError("計算過程が記録されていない計算結果です。")
+    if list(product_names) != list(infusion_mix.detailed_mix):
+        raise ValueError("計算時と製剤の構成が異なります。")
+
+    targets = infusion_mix.input_amounts
+    volumes = [infusion_mix.detailed_mix[name] for name in product_names]
+    basic, binding = extract_basis(coefficients, targets, report.active_nutrients, volumes)
+    cap_rows = line_cap_rows(coefficients, report.line_specs) + compatibility_cap_rows(
+        coefficients, report.compatibility, report.osmolarities or None,
+    )
+
+    # 等号で効いている行を「a·x = 右辺」の形で集め、基底変数の被約費用が0になる双対変数を求める（退化時は最小二乗解）
+    x = np.asarray(volumes, dtype=float)
+    matrix = np.asarray(coefficients, dtype=float).T
+    active_rows = [matrix[i] for i, _ in binding]
+    binding_caps = {}
+    for k, row in enumerate(cap_rows):
+        a = _cap_vector(row, len(product_names))
+        rhs = 0.0 if row.concentration else row.limit
+        scale = max(1.0, float(np.abs(a) @ x), abs(rhs))
+        if abs(float(a @ x) - rhs) <= BINDING_TOLERANCE * scale:
+            binding_caps[k] = len(active_rows)
+            active_rows.append(a)
+    duals = np.zeros(len(active_rows))
+    if basic and active_rows:
+        duals = np.linalg.lstsq(np.array(active_rows)[:, list(basic)].T, np.ones(len(basic)), rcond=None)[0]
+    shadow_prices = {i: float(dual) for (i, _), dual in zip(binding, duals)}
+    sides = dict(binding)
+
+    details = []
+    for nutrient in report.active_nutrients:
+        i = NUTRIENTS.index(nutrient)
+        lower = report.lower_ratio * targets[nutrient]
+        upper = report.upper_ratio * targets[nutrient]
+        supply = infusion_mix.nutrient_totals[nutrient]
+        details.append(ConstraintDetail(
+            nutrient=nutrient,
+            target=targets[nutrient],
+            lower=lower,
+            upper=upper,
+            supply=supply,
+            slack=min(supply - lower, upper - supply),
+            binding=sides.get(i),
+            shadow_price=shadow_prices.get(i),
+        ))
+    for k, row in enumerate(cap_rows):
+        members = [j for j, _ in row.contents]
+        member_volume = float(x[members].sum())
+        amount = sum(content * x[j] for j, content in row.contents)
+        value = (amount / member_volume if member_volume > 0 else 0.0) if row.concentration else amount
+        shadow_price = None
+        if k in binding_caps:
+            # 濃度の上限 c を δ 上げると Σ(含量 - c)x <= 0 の右辺が δ×(ラインの容量) 上がるのと同じ
+            dual = float(duals[binding_caps[k]])
+            shadow_price = dual * member_volume if row.concentration else dual
+        details.append(ConstraintDetail(
+            nutrient=row.label,
+            target=row.limit,
+            lower=None,
+            upper=row.limit,
+            supply=value,
+            slack=row.limit - value,
+            binding='U' if k in binding_caps else None,
+            shadow_price=shadow_price,
+            kind='cap',
+        ))
+    return details
+
+def _cap_vector(row: CapRow, size: int) -> np.ndarray:
+    a = np.zeros(size)
+    for j, content in row.contents:
+        a[j] = content - row.limit if row.concentration else content
+    return a
+
+def detailed_report_markdown(
+    infusion_mix: InfusionMix,
+    product_names: Sequence[str],
+    coefficients: Sequence[Sequence[float]],
+) -> str:
+    """
+    拘束している制約と双対価格、処理時間を含む詳細な説明（Markdown）。
+    """
+    report = infusion_mix.report
+    units = infusion_mix.input_units
+    lines = [
+        "4. **制約の状況**",
+        "",
+        "| 栄養素 | 下限 | 上限 | 供給量 | 余裕 | 状態 | 双対価格 (mL/day per 単位) |",
+        "|---|---|---|---|---|---|---|",
+    ]
+    for detail in constraint_details(infusion_mix, product_names, coefficients):
+        state = {'L': "下限で拘束", 'U': "上限で拘束"}.get(detail.binding, "—")
+        price = f"{detail.shadow_price:.3f}" if detail.shadow_price is not None else "—"
+        unit = units.get(detail.nutrient, '')
+        # 濃度の上限（g/mL等）は桁が小さいため有効数字で表示する
+        spec = '.2f' if detail.kind == 'nutrient' else '.4g'
+        lower = f"{detail.lower:{spec}} {unit}" if detail.lower is not None else "—"
+        lines.append(
+            f"| {detail.nutrient} | {lower} | {detail.upper:{spec}} {unit} | {detail.supply:{spec}} {unit} "
+            f"| {max(detail.slack, 0.0):{spec}} | {state} | {price} |"
+        )
+    lines += ["", f"5. **処理時間** (解法: {report.solver})"]
+    lines += [f"   - {stage}: {elapsed:.2f} ms" for stage, elapsed in report.timings_ms.items()]
+    return "\n".join(lines) + "\n"
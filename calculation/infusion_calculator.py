@@ -4,9 +4,16 @@ from models.patient import Patient
 from models.solution import Solution
 from models.additive import Additive
 from models.infusion_mix import InfusionMix
-from typing import Dict
+from models.calculation_report import CalculationReport
+from models.infusion_line import LineResult, LineSpec
+from models.compatibility import CompatibilityLimits
+from calculation.model_template import (
+    LOWER_RATIO, UPPER_RATIO, NUTRIENTS, assign_lines, compute_nutrient_totals, estimate_osmolarity, get_model_template,
+)
+from calculation.recipe_atlas import Basis, RecipeAtlas, extract_basis, solve_basis
+from typing import Dict, List, Optional, Sequence, Tuple
 import logging
-import pulp
+import time
 
 def get_nutrient_contribution(nutrient: str, solution: Solution) -> float:
     """
@@ -64,95 +71,202 @@ def get_nutrient_unit(nutrient: str) -> str:
     }
     return units.get(nutrient, '')
 
-def calculate_infusion(patient: Patient, base_solution: Solution, additives: Dict[str, Additive]) -> InfusionMix:
-    try:
-        logging.info("計算開始")
-        logging.debug(f"患者データ: {patient}")
-        logging.debug(f"選択されたベース製剤: {base_solution}")
-        logging.debug(f"選択された添加剤: {additives}")
-
-        # 目標栄養素の設定
-        targets = {
-            'Glucose': 0.0,  # GIRから計算後に設定
-            'Amino Acids': patient.amino_acid * patient.weight if patient.amino_acid_included and patient.amino_acid else 0.0,  # g/day
-            'Na': patient.na * patient.weight if patient.na_included and patient.na else 0.0,  # mEq/day
-            'K': patient.k * patient.weight if patient.k_included and patient.k else 0.0,  # mEq/day
-            'Cl': patient.cl * patient.weight if patient.cl_included and patient.cl else 0.0,  # mEq/day
-            'Ca': patient.ca * patient.weight if patient.ca_included and patient.ca else 0.0,  # mEq/day
-            'Mg': patient.mg * patient.weight if patient.mg_included and patient.mg else 0.0,  # mEq/day
-            'Zn': patient.zn * patient.weight if patient.zn_included and patient.zn else 0.0,  # mmol/day
-            'P': 0.0,  # 未使用
-            'Fats': patient.fat * patient.weight if patient.fat_included and patient.fat else 0.0  # g/day
-        }
+def compile_composition(base_solution: Solution, additives: Dict[str, Additive]) -> Tuple[List[str], List[List[float]]]:
+    """
+    製剤名の一覧と、製剤毎の1mLあたりの栄養素量（NUTRIENTSの順）を返す。
+    先頭はベース製剤（「ベース製剤（名称）」）。
+    """
+    product_names = [f"ベース製剤（{base_solution.name}）"]
+    coefficients = [[get_nutrient_contribution(nutrient, base_solution) for nutrient in NUTRIENTS]]
+    for name, additive in additives.items():
+        product_names.append(name)
+        coefficients.append([get_additive_nutrient_contribution(nutrient, additive) for nutrient in NUTRIENTS])
+    return product_names, coefficients
 
-        # GIRからGlucoseの目標を計算
-        if patient.gir_included and patient.gir:
-            # GIR (mg/kg/min) × 1440 min/day = mg/kg/day
-            # mg/kg/day × kg = mg/day → g/day
-            targets['Glucose'] = (patient.gir * patient.weight * 1440) / 1000.0  # g/day
+def compile_osmolarity(base_solution: Solution, additives: Dict[str, Additive], coefficients: Sequence[Sequence[float]]) -> List[float]:
+    """
+    compile_composition() と同じ順の製剤毎の浸透圧（mOsm/L）。カタログに値が無い製剤は組成（coefficients）から推定する。
+    """
+    products = [base_solution, *additives.values()]
+    return [
+        product.osmolarity if product.osmolarity is not None else estimate_osmolarity(row)
+        for product, row in zip(products, coefficients)
+    ]
 
-        logging.debug(f"目標栄養素: {targets}")
+def mixture_compatibility(
+    coefficients: Sequence[Sequence[float]],
+    osmolarities: Sequence[float],
+    volumes: Sequence[float],
+) -> Tuple[Optional[float], Optional[float]]:
+    """
+    脂肪乳剤以外の混合液の (浸透圧 mOsm/L, Ca (mEq/L) + P (mmol/L)) を返す。混合液が無い場合はNone。
+    """
+    fats, ca, p = NUTRIENTS.index('Fats'), NUTRIENTS.index('Ca'), NUTRIENTS.index('P')
+    total = osmoles = ca_p = 0.0
+    for row, osmolarity, volume in zip(coefficients, osmolarities, volumes):
+        if row[fats] > 0 or not volume:
+            continue
+        total += volume
+        osmoles += osmolarity * volume
+        ca_p += (row[ca] + row[p]) * 1000.0 * volume
+    if total <= 0:
+        return None, None
+    return osmoles / total, ca_p / total
 
-        # 使用可能な製剤のリスト（ベース製剤と添加剤）
-        available_solutions = {f"ベース製剤（{base_solution.name}）": base_solution}
-        available_solutions.update(additives)
+def compute_targets(patient: Patient) -> Dict[str, float]:
+    """
+    患者の目標栄養素（1日量）を返す。計算対象外の栄養素は0。
+    """
+    targets = {
+        'Glucose': 0.0,  # GIRから計算後に設定
+        'Amino Acids': patient.amino_acid * patient.weight if patient.amino_acid_included and patient.amino_acid else 0.0,  # g/day
+        'Na': patient.na * patient.weight if patient.na_included and patient.na else 0.0,  # mEq/day
+        'K': patient.k * patient.weight if patient.k_included and patient.k else 0.0,  # mEq/day
+        'Cl': patient.cl * patient.weight if patient.cl_included and patient.cl else 0.0,  # mEq/day
+        'Ca': patient.ca * patient.weight if patient.ca_included and patient.ca else 0.0,  # mEq/day
+        'Mg': patient.mg * patient.weight if patient.mg_included and patient.mg else 0.0,  # mEq/day
+        'Zn': patient.zn * patient.weight if patient.zn_included and patient.zn else 0.0,  # mmol/day
+        'P': 0.0,  # 未使用
+        'Fats': patient.fat * patient.weight if patient.fat_included and patient.fat else 0.0  # g/day
+    }
 
-        # PuLPの最適化問題を定義
-        prob = pulp.LpProblem("TPN_Infusion_Optimization", pulp.LpMinimize)
+    # GIRからGlucoseの目標を計算
+    if patient.gir_included and patient.gir:
+        # GIR (mg/kg/min) × 1440 min/day = mg/kg/day
+        # mg/kg/day × kg = mg/day → g/day
+        targets['Glucose'] = (patient.gir * patient.weight * 1440) / 1000.0  # g/day
+    return targets
 
-        # 各製剤の使用量（mL/day）の変数を定義
-        solution_vars = {name: pulp.LpVariable(name, lowBound=0, cat='Continuous') for name in available_solutions}
+def summarize_lines(
+    product_names: Sequence[str],
+    coefficients: Sequence[Sequence[float]],
+    detailed_mix: Dict[str, float],
+    lines: Sequence[LineSpec],
+) -> List[LineResult]:
+    """
+    配合量をライン毎に分け、1日量・投与速度（mL/h）・1mLあたりの栄養素量を求める。
+    """
+    line_of_product = assign_lines(coefficients, lines)
+    results = []
+    for line in lines:
+        members = [k for k, name in enumerate(line_of_product) if name == line.name]
+        volumes = {product_names[k]: detailed_mix[product_names[k]] for k in members}
+        total = sum(volumes.values())
+        supplies = compute_nutrient_totals([product_names[k] for k in members], [coefficients[k] for k in members], volumes)
+        results.append(LineResult(
+            name=line.name,
+            label=line.label,
+            volumes=volumes,
+            total_volume=total,
+            hours=line.hours,
+            rate=total / line.hours,
+            concentrations={n: amount / total for n, amount in supplies.items() if amount} if total > 0 else {},
+        ))
+    return results
 
-        # 目的関数: 総投与量の最小化
-        prob += pulp.lpSum([var for var in solution_vars.values()]), "Total_Infusion_Volume"
+def calculate_infusion(
+    patient: Patient,
+    base_solution: Solution,
+    additives: Dict[str, Additive],
+    warm_start: Optional[Basis] = None,
+    catalog_version: Optional[str] = None,
+    atlas: Optional[RecipeAtlas] = None,
+    lines: Optional[Sequence[LineSpec]] = None,
+    compatibility: Optional[CompatibilityLimits] = None,
+) -> InfusionMix:
+    """
+    患者の目標栄養素を満たす配合量を線形計画法で計算する。
+    warm_startに前回の最適基底（InfusionMix.report.basis）を渡すと、その基底で最適性を検証できた場合は最適化を省略する。
+    catalog_versionは結果のInfusionMixにそのまま記録される。
+    atlasを渡すと、事前計算した基底で最適解が得られる場合は最適化を省略する。
+    lines（例: TWO_LINES）を渡すと、メインバッグと脂肪乳剤のラインを1つのモデルで同時に最適化する。
+    compatibilityを渡すと、浸透圧とCa・Pの濃度の上限を最適化の制約に加える。
+    """
+    logging.debug(f"選択されたベース製剤: {base_solution}")
+    logging.debug(f"選択された添加剤: {additives}")
+    # 使用可能な製剤（ベース製剤と添加剤）の組成
+    product_names, coefficients = compile_composition(base_solution, additives)
+    return calculate_from_composition(
+        patient, base_solution.name, product_names, coefficients,
+        warm_start=warm_start, catalog_version=catalog_version, atlas=atlas, lines=lines,
+        compatibility=compatibility, osmolarities=compile_osmolarity(base_solution, additives, coefficients),
+    )
 
-        # 栄養素の供給量制約
-        nutrients = ['Glucose', 'Amino Acids', 'Na', 'K', 'Cl', 'Ca', 'Mg', 'Zn', 'P', 'Fats']
+def calculate_from_composition(
+    patient: Patient,
+    base_solution_name: str,
+    product_names: Sequence[str],
+    coefficients: Sequence[Sequence[float]],
+    warm_start: Optional[Basis] = None,
+    catalog_version: Optional[str] = None,
+    atlas: Optional[RecipeAtlas] = None,
+    lines: Optional[Sequence[LineSpec]] = None,
+    compatibility: Optional[CompatibilityLimits] = None,
+    osmolarities: Optional[Sequence[float]] = None,
+) -> InfusionMix:
+    """
+    compile_composition() 済みの組成から配合量を計算する（calculate_infusion() の本体）。
+    共有メモリのカタログを使うワーカープロセスは製剤モデルを持たず、こちらを直接呼ぶ。
+    osmolarities（製剤毎のmOsm/L）を省略した場合、浸透圧は組成から推定する。
+    """
+    try:
+        logging.info("計算開始")
+        logging.debug(f"患者データ: {patient}")
+        started = time.perf_counter()
 
-        for nutrient in nutrients:
-            if targets.get(nutrient, 0.0) > 0:
-                # 各栄養素の供給量を計算
-                supply = []
-                for sol_name, sol in available_solutions.items():
-                    if sol_name.startswith("ベース製剤"):
-                        supply.append(get_nutrient_contribution(nutrient, sol) * solution_vars[sol_name])
-                    else:
-                        additive = additives.get(sol_name)
-                        if additive:
-                            supply.append(get_additive_nutrient_contribution(nutrient, additive) * solution_vars[sol_name])
-                # 目標値の90%〜110%を満たすように制約
-                prob += pulp.lpSum(supply) >= 0.9 * targets[nutrient], f"{nutrient}_lower_bound"
-                prob += pulp.lpSum(supply) <= 1.1 * targets[nutrient], f"{nutrient}_upper_bound"
+        # 目標栄養素の設定
+        targets = compute_targets(patient)
 
-        # 最適化を実行
-        prob_status = prob.solve()
+        logging.debug(f"目標栄養素: {targets}")
 
-        logging.debug(f"PuLPのステータス: {pulp.LpStatus[prob.status]}")
+        # 栄養素の供給量制約は目標が設定された栄養素のみ
+        nutrients = NUTRIENTS
+        active_nutrients = [nutrient for nutrient in nutrients if targets.get(nutrient, 0.0) > 0]
 
-        if pulp.LpStatus[prob.status] != 'Optimal':
-            # 最適解が見つからない場合
-            logging.error("最適化問題が解けませんでした。入力値を見直してください。")
-            raise ValueError("最適化問題が解けませんでした。入力値を見直してください。")
+        timings_ms = {'targets': (time.perf_counter() - started) * 1000.0}
 
-        # 結果の取得
-        detailed_mix = {name: solution_vars[name].varValue for name in solution_vars}
+        # 前回の最適基底、または事前計算した配合表の基底で最適性を検証できれば、最適化は不要
+        # いずれも追加の制約が無い1ラインの基底のみ（上限の行は検証の対象外）
+        detailed_mix = None
+        plain = not lines and compatibility is None
+        solver = 'warm_start'
+        if warm_start is not None and plain and all(j < len(product_names) for j in warm_start[0]):
+            lap = time.perf_counter()
+            volumes = solve_basis(coefficients, targets, active_nutrients, warm_start)
+            detailed_mix = dict(zip(product_names, volumes)) if volumes is not None else None
+            timings_ms['warm_start'] = (time.perf_counter() - lap) * 1000.0
+        if detailed_mix is None and atlas is not None and catalog_version and plain:
+            solver = 'atlas'
+            lap = time.perf_counter()
+            detailed_mix = atlas.lookup(catalog_version, base_solution_name, patient, product_names, coefficients, targets)
+            timings_ms['atlas'] = (time.perf_counter() - lap) * 1000.0
+        if detailed_mix is None:
+            solver = 'cbc'
+            # モデルは (カタログ, ベース製剤, 有効な栄養素) 毎に一度だけ構築し、右辺のみ更新して解く
+            lap = time.perf_counter()
+            template_key = (catalog_version, base_solution_name, tuple(product_names[1:])) if catalog_version else None
+            template = get_model_template(
+                product_names, coefficients, active_nutrients, key=template_key,
+                lines=lines or (), compatibility=compatibility, osmolarities=osmolarities,
+            )
+            timings_ms['model'] = (time.perf_counter() - lap) * 1000.0
+            lap = time.perf_counter()
+            try:
+                detailed_mix = template.solve(targets)
+            except ValueError as ve:
+                hints = []
+                if lines:
+                    hints.append("投与ライン毎の上限（投与量・速度・濃度）")
+                if compatibility is not None:
+                    hints.append("浸透圧・Ca/Pの上限")
+                if hints:
+                    raise ValueError(f"{ve} {'、'.join(hints)}も確認してください。") from ve
+                raise
+            timings_ms['solve'] = (time.perf_counter() - lap) * 1000.0
         logging.debug(f"詳細配合量: {detailed_mix}")
 
         # 栄養素の総供給量を計算
-        nutrient_totals = {}
-        for nutrient in nutrients:
-            total = 0.0
-            for sol_name, sol in available_solutions.items():
-                if sol_name.startswith("ベース製剤"):
-                    contribution = get_nutrient_contribution(nutrient, sol) * detailed_mix[sol_name]
-                else:
-                    additive = additives.get(sol_name)
-                    if additive:
-                        contribution = get_additive_nutrient_contribution(nutrient, additive) * detailed_mix[sol_name]
-                    else:
-                        contribution = 0.0
-                total += contribution
-            nutrient_totals[nutrient] = total
+        nutrient_totals = compute_nutrient_totals(product_names, coefficients, detailed_mix)
 
         logging.debug(f"栄養素の総供給量: {nutrient_totals}")
 
@@ -193,18 +307,28 @@ def calculate_infusion(patient: Patient, base_solution: Solution, additives: Dic
                 status_message = "一部の栄養素が30%を超えています。数値を見直してください。"
                 logging.warning(status_message)
 
-        # 計算ステップの記録
-        calculation_steps = "### 計算ステップ\n"
-        calculation_steps += "1. **目標栄養素の設定**\n"
-        for nutrient, target in targets.items():
-            calculation_steps += f"   - {nutrient}: {target:.2f} {get_nutrient_unit(nutrient)}\n"
-        calculation_steps += "2. **最適化モデルの構築**\n"
-        calculation_steps += "   - 製剤の使用量を変数として定義。\n"
-        calculation_steps += "   - 目的関数: 総投与量の最小化。\n"
-        calculation_steps += "   - 栄養素の供給量が目標の±10%を満たすよう制約を設定。\n"
-        calculation_steps += "3. **最適化の実行**\n"
-        calculation_steps += f"   - 総投与量: {sum(detailed_mix.values()):.2f} mL/day\n"
-        calculation_steps += f"   - {status_message}\n"
+        # 脂肪乳剤以外の混合液の浸透圧・Ca+P濃度（薬剤師の確認用）
+        if osmolarities is None:
+            osmolarities = [estimate_osmolarity(row) for row in coefficients]
+        osmolarity, ca_p_sum = mixture_compatibility(coefficients, osmolarities, [detailed_mix[name] for name in product_names])
+
+        # 計算過程は構造化データのみ記録し、説明文は参照時に生成する
+        timings_ms['total'] = (time.perf_counter() - started) * 1000.0
+        report = CalculationReport(
+            base_solution_name=base_solution_name,
+            active_nutrients=active_nutrients,
+            lower_ratio=LOWER_RATIO,
+            upper_ratio=UPPER_RATIO,
+            total_volume=sum(detailed_mix.values()),
+            status_message=status_message,
+            solver=solver,
+            timings_ms=timings_ms,
+            line_specs=list(lines or ()),
+            compatibility=compatibility,
+            osmolarities=[float(osm) for osm in osmolarities] if compatibility is not None else [],
+            basis=extract_basis(coefficients, targets, active_nutrients, [detailed_mix[name] for name in product_names])
+            if plain else None,
+        )
 
         infusion_mix = InfusionMix(
             gir=patient.gir if patient.gir_included else None,
@@ -218,7 +342,6 @@ def calculate_infusion(patient: Patient, base_solution: Solution, additives: Dic
             zn=patient.zn if patient.zn_included else None,
             cl=patient.cl if patient.cl_included else None,
             detailed_mix=detailed_mix,
-            calculation_steps=calculation_steps,
             nutrient_totals=nutrient_totals,
             nutrient_units={
                 'Glucose': 'g/day',
@@ -244,7 +367,12 @@ def calculate_infusion(patient: Patient, base_solution: Solution, additives: Dic
                 'Zn': 'mmol/day',
                 'P': 'mmol/day',
                 'Fats': 'g/day'
-            }
+            },
+            catalog_version=catalog_version,
+            report=report,
+            osmolarity=osmolarity,
+            ca_p_sum=ca_p_sum,
+            lines=summarize_lines(product_names, coefficients, detailed_mix, lines) if lines else None,
         )
 
         logging.info("計算完了")
@@ -0,0 +1,271 @@
+# calculation/model_template.py
+
+from collections import OrderedDict
+from typing import Dict, Hashable, List, NamedTuple, Optional, Sequence, Tuple
+import logging
+import threading
+import pulp
+
+from models.compatibility import CompatibilityLimits
+from models.infusion_line import LineSpec
+from utils.data_loader import on_catalog_change
+
+# 最適化モデルで扱う栄養素（行の順序）
+NUTRIENTS = ['Glucose', 'Amino Acids', 'Na', 'K', 'Cl', 'Ca', 'Mg', 'Zn', 'P', 'Fats']
+
+# 目標値に対する許容範囲
+LOWER_RATIO = 0.9
+UPPER_RATIO = 1.1
+
+MAX_CACHED_TEMPLATES = 64
+MAX_IDLE_MODELS = 4  # テンプレート毎に保持する構築済みモデルの上限（同時に解く数を超えた分は解いた後に破棄）
+
+# 浸透圧の推定係数（mOsm / 栄養素の単位）。ブドウ糖 1000/180、アミノ酸 約10/g、
+# 1価の陽イオンは対になる陰イオンを含めて2/mEq、2価の陽イオンは1/mEq、リン酸 1/mmol、脂肪乳剤 約1.75/g
+OSMOLARITY_FACTORS = {
+    'Glucose': 1000.0 / 180.0,
+    'Amino Acids': 10.0,
+    'Na': 2.0,
+    'K': 2.0,
+    'Ca': 1.0,
+    'Mg': 1.0,
+    'P': 1.0,
+    'Fats': 1.75,
+}
+
+def estimate_osmolarity(row: Sequence[float]) -> float:
+    """
+    1mLあたりの組成から浸透圧（mOsm/L）を推定する（概算）。
+    """
+    return 1000.0 * sum(factor * row[NUTRIENTS.index(nutrient)] for nutrient, factor in OSMOLARITY_FACTORS.items())
+
+def assign_lines(coefficients: Sequence[Sequence[float]], lines: Sequence[LineSpec]) -> Tuple[str, ...]:
+    """
+    製剤毎の投与ライン名を返す。脂肪を含む製剤は脂肪乳剤のライン、それ以外はもう一方のラインに割り当てる。
+    """
+    main_lines = [line.name for line in lines if not line.lipid]
+    lipid_lines = [line.name for line in lines if line.lipid]
+    if len(main_lines) != 1 or len(lipid_lines) > 1:
+        raise ValueError("投与ラインは、脂肪乳剤以外のライン1本と脂肪乳剤のライン（0〜1本）で指定してください。")
+    fats = NUTRIENTS.index('Fats')
+    return tuple(lipid_lines[0] if lipid_lines and row[fats] > 0 else main_lines[0] for row in coefficients)
+
+class CapRow(NamedTuple):
+    """
+    上限制約の1行。concentration=True は濃度の上限（Σ(含量 - 上限)x <= 0）、False は量の上限（Σ含量·x <= 上限）。
+    ModelTemplateと計算結果の説明（calculation/explain.py）で同じ行を使う。
+    """
+    name: str  # PuLPの制約名
+    label: str  # 表示名
+    contents: Tuple[Tuple[int, float], ...]  # (製剤の添字, 1mLあたりの含量)
+    limit: float
+    concentration: bool
+
+def line_cap_rows(coefficients: Sequence[Sequence[float]], lines: Sequence[LineSpec]) -> List[CapRow]:
+    """
+    ライン毎の投与量（max_volume と max_rate × 投与時間の小さい方）と濃度の上限の行。
+    """
+    if not lines:
+        return []
+    line_of_product = assign_lines(coefficients, lines)
+    rows = []
+    for k, line in enumerate(lines):
+        members = [j for j, name in enumerate(line_of_product) if name == line.name]
+        limits = [limit for limit in (line.max_volume, line.max_rate * line.hours if line.max_rate is not None else None) if limit is not None]
+        if limits:
+            rows.append(CapRow(f"line{k}_volume", f"{line.label} 投与量 (mL/day)", tuple((j, 1.0) for j in members), min(limits), False))
+        for nutrient, limit in line.max_concentration.items():
+            i = NUTRIENTS.index(nutrient)
+            rows.append(CapRow(
+                f"line{k}_n{i}_concentration", f"{line.label} {nutrient}濃度 (/mL)",
+                tuple((j, coefficients[j][i]) for j in members), limit, True,
+            ))
+    return rows
+
+def compatibility_cap_rows(
+    coefficients: Sequence[Sequence[float]],
+    compatibility: Optional[CompatibilityLimits],
+    osmolarities: Optional[Sequence[float]] = None,
+) -> List[CapRow]:
+    """
+    脂肪乳剤以外の混合液の浸透圧（osmolarities: 製剤毎のmOsm/L、省略時は組成から推定）とCa・P濃度の上限の行。
+    """
+    if compatibility is None:
+        return []
+    if osmolarities is None:
+        osmolarities = [estimate_osmolarity(row) for row in coefficients]
+    fats, ca, p = NUTRIENTS.index('Fats'), NUTRIENTS.index('Ca'), NUTRIENTS.index('P')
+    # 脂肪乳剤は別ライン（または混合前）として扱う。濃度は1Lあたりに揃える
+    mixed = [j for j, row in enumerate(coefficients) if row[fats] <= 0]
+    caps = [
+        ("osmolarity", "浸透圧 (mOsm/L)", [float(osmolarities[j]) for j in mixed], compatibility.max_osmolarity),
+        ("ca_concentration", "Ca (mEq/L)", [coefficients[j][ca] * 1000.0 for j in mixed], compatibility.max_ca),
+        ("p_concentration", "P (mmol/L)", [coefficients[j][p] * 1000.0 for j in mixed], compatibility.max_p),
+        ("ca_p_sum", "Ca+P (mEq/L + mmol/L)", [(coefficients[j][ca] + coefficients[j][p]) * 1000.0 for j in mixed],
+         compatibility.max_ca_p_sum),
+    ]
+    return [
+        CapRow(name, label, tuple(zip(mixed, contents)), limit, True)
+        for name, label, contents, limit in caps if limit is not None
+    ]
+
+class CompiledModel(NamedTuple):
+    """
+    ModelTemplate が保持する構築済みのPuLPモデル1つ分。
+    """
+    problem: pulp.LpProblem
+    variables: List[pulp.LpVariable]
+    bounds: Dict[str, Tuple[pulp.LpConstraint, pulp.LpConstraint]]  # 栄養素 -> (下限, 上限) の制約
+
+class ModelTemplate:
+    """
+    (カタログバージョン, ベース製剤, 有効な栄養素の組, 投与ライン) 毎に一度だけ構築するPuLPモデル。
+    変数名はASCII（x0, x1, ...）とし、製剤名のサニタイズを避ける。
+    solve() では制約の右辺だけを書き換えて再利用する。
+    同時に呼ばれた solve() が互いを待たないよう、構築済みのモデルを最大 MAX_IDLE_MODELS 個まで使い回す
+    （空きが無ければ同じモデルをもう1つ構築する）。CBCの実行中はロックを保持しない。
+    linesを指定すると、全ラインを1つのモデルで解き、ライン毎の投与量・速度・濃度の上限を制約に加える。
+    compatibilityを指定すると、脂肪乳剤以外の混合液の浸透圧（osmolarities: 製剤毎のmOsm/L）とCa・Pの濃度に上限を設ける。
+    """
+
+    def __init__(self, product_names: Sequence[str], coefficients: Sequence[Sequence[float]], active_nutrients: Sequence[str],
+                 lines: Sequence[LineSpec] = (), compatibility: Optional[CompatibilityLimits] = None,
+                 osmolarities: Optional[Sequence[float]] = None):
+        self.product_names: Tuple[str, ...] = tuple(product_names)
+        # coefficients[j][i]: 製剤jの1mLあたりの栄養素NUTRIENTS[i]の量
+        self.coefficients: Tuple[Tuple[float, ...], ...] = tuple(tuple(row) for row in coefficients)
+        self.active_nutrients: Tuple[str, ...] = tuple(active_nutrients)
+        self.lines: Tuple[LineSpec, ...] = tuple(lines)
+        self.cap_rows: Tuple[CapRow, ...] = tuple(
+            line_cap_rows(self.coefficients, self.lines) + compatibility_cap_rows(self.coefficients, compatibility, osmolarities)
+        )
+        self._lock = threading.Lock()
+        self._idle: List[CompiledModel] = [self._build()]
+
+    def _build(self) -> CompiledModel:
+        problem = pulp.LpProblem("TPN_Infusion_Optimization", pulp.LpMinimize)
+        variables = [pulp.LpVariable(f"x{j}", lowBound=0, cat='Continuous') for j in range(len(self.product_names))]
+        problem += pulp.lpSum(variables), "Total_Infusion_Volume"
+
+        bounds = {}
+        for nutrient in self.active_nutrients:
+            i = NUTRIENTS.index(nutrient)
+            supply = pulp.LpAffineExpression(
+                [(var, row[i]) for var, row in zip(variables, self.coefficients) if row[i] != 0.0]
+            )
+            # 右辺はsolve()毎に設定する
+            lower = supply >= 0.0
+            upper = supply <= 0.0
+            problem += lower, f"n{i}_lower_bound"
+            problem += upper, f"n{i}_upper_bound"
+            bounds[nutrient] = (lower, upper)
+
+        for row in self.cap_rows:
+            contents = [(variables[j], content) for j, content in row.contents]
+            if row.concentration:
+                # 濃度の上限: 含量の合計 <= 上限 × 容量 を線形の形（Σ(含量 - 上限)x <= 0）で追加する
+                problem += pulp.LpAffineExpression(
+                    [(var, content - row.limit) for var, content in contents if content != row.limit]
+                ) <= 0.0, row.name
+            else:
+                problem += pulp.LpAffineExpression(contents) <= row.limit, row.name
+        return CompiledModel(problem, variables, bounds)
+
+    def solve(self, targets: Dict[str, float]) -> Dict[str, float]:
+        """
+        目標値の90%〜110%を満たす総投与量最小の配合量（製剤名 -> mL/day）を返す。
+        """
+        with self._lock:
+            model = self._idle.pop() if self._idle else None
+        if model is None:
+            model = self._build()
+        try:
+            for nutrient, (lower, upper) in model.bounds.items():
+                lower.changeRHS(LOWER_RATIO * targets[nutrient])
+                upper.changeRHS(UPPER_RATIO * targets[nutrient])
+
+            model.problem.solve(pulp.PULP_CBC_CMD(msg=False))
+            status = pulp.LpStatus[model.problem.status]
+            logging.debug(f"PuLPのステータス: {status}")
+            if status != 'Optimal':
+                logging.error("最適化問題が解けませんでした。入力値を見直してください。")
+                raise ValueError("最適化問題が解けませんでした。入力値を見直してください。")
+            return {name: var.varValue for name, var in zip(self.product_names, model.variables)}
+        finally:
+            with self._lock:
+                if len(self._idle) < MAX_IDLE_MODELS:
+                    self._idle.append(model)
+
+def compute_nutrient_totals(
+    product_names: Sequence[str],
+    coefficients: Sequence[Sequence[float]],
+    volumes: Dict[str, float],
+) -> Dict[str, float]:
+    """
+    配合量（製剤名 -> mL/day）から各栄養素の総供給量を計算する。
+    """
+    totals = [0.0] * len(NUTRIENTS)
+    for name, row in zip(product_names, coefficients):
+        volume = volumes.get(name, 0.0)
+        if volume:
+            for i, coefficient in enumerate(row):
+                totals[i] += coefficient * volume
+    return dict(zip(NUTRIENTS, totals))
+
+_template_lock = threading.Lock()
+_templates: "OrderedDict[Hashable, ModelTemplate]" = OrderedDict()
+
+def get_model_template(
+    product_names: Sequence[str],
+    coefficients: Sequence[Sequence[float]],
+    active_nutrients: Sequence[str],
+    key: Optional[Hashable] = None,
+    lines: Sequence[LineSpec] = (),
+    compatibility: Optional[CompatibilityLimits] = None,
+    osmolarities: Optional[Sequence[float]] = None,
+) -> ModelTemplate:
+    """
+    キャッシュ済みのテンプレートを返し、無ければ構築する。
+    keyを省略した場合は製剤名と組成そのものをキーとする。
+    keyの先頭要素がカタログバージョンであれば、カタログ更新時にそのバージョンのテンプレートだけを破棄する。
+    """
+    active = tuple(active_nutrients)
+    if key is None:
+        key = (None, tuple(product_names), tuple(tuple(row) for row in coefficients))
+    cache_key = (
+        key,
+        active,
+        tuple(line.model_dump_json() for line in lines),
+        (compatibility.model_dump_json(), tuple(osmolarities or ())) if compatibility is not None else None,
+    )
+
+    with _template_lock:
+        template = _templates.get(cache_key)
+        if template is not None:
+            _templates.move_to_end(cache_key)
+            return template
+
+    template = ModelTemplate(product_names, coefficients, active, lines, compatibility, osmolarities)
+    with _template_lock:
+        template = _templates.setdefault(cache_key, template)
+        _templates.move_to_end(cache_key)
+        while len(_templates) > MAX_CACHED_TEMPLATES:
+            _templates.popitem(last=False)
+    return template
+
+def clear_model_templates(catalog_version: Optional[str] = None):
+    """
+    テンプレートのキャッシュを破棄する。catalog_versionを指定するとそのバージョンのものだけを破棄する。
+    """
+    with _template_lock:
+        if catalog_version is None:
+            _templates.clear()
+            return
+        for cache_key in [k for k in _templates if k[0][0] == catalog_version]:
+            del _templates[cache_key]
+
+def _evict_old_catalog(previous, current):
+    if previous is not None:
+        clear_model_templates(previous.version)
+
+on_catalog_change(_evict_old_catalog)
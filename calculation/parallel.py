@@ -0,0 +1,112 @@
+# calculation/parallel.py
+
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Deque, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel
+
+from models.patient import Patient
+from models.infusion_mix import InfusionMix
+from models.infusion_line import LineSpec
+from models.compatibility import CompatibilityLimits
+from calculation.infusion_calculator import calculate_from_composition
+from calculation.recipe_atlas import RecipeAtlas
+from calculation.shared_catalog import SharedCatalog, SharedCatalogHandle, SharedCatalogView, attach_shared_catalog
+from utils.data_loader import CatalogVersion
+
+class BatchResult(BaseModel):
+    index: int  # 入力の順番
+    infusion_mix: Optional[InfusionMix] = None
+    error: Optional[str] = None
+
+# ワーカープロセス毎の状態（_init_worker() で設定）
+_worker_catalog: Optional[SharedCatalogView] = None
+_worker_atlas: Optional[RecipeAtlas] = None
+_worker_options: dict = {}
+
+def _init_worker(handle: SharedCatalogHandle, atlas_path: Optional[str], lines: Optional[Tuple[LineSpec, ...]],
+                 compatibility: Optional[CompatibilityLimits]):
+    global _worker_catalog, _worker_atlas, _worker_options
+    _worker_catalog = attach_shared_catalog(handle)
+    _worker_atlas = RecipeAtlas(atlas_path) if atlas_path else None
+    _worker_options = {'lines': lines, 'compatibility': compatibility}
+
+def _calculate(task: Tuple[int, Patient, str]) -> BatchResult:
+    index, patient, base_solution_name = task
+    try:
+        product_names, coefficients = _worker_catalog.composition(base_solution_name)
+        infusion_mix = calculate_from_composition(
+            patient, base_solution_name, product_names, coefficients,
+            catalog_version=_worker_catalog.catalog_version, atlas=_worker_atlas,
+            osmolarities=_worker_catalog.osmolarities(base_solution_name).tolist(), **_worker_options,
+        )
+        return BatchResult(index=index, infusion_mix=infusion_mix)
+    except ValueError as e:
+        return BatchResult(index=index, error=str(e))
+
+def _calculate_chunk(chunk: List[Tuple[int, Patient, str]]) -> List[BatchResult]:
+    return [_calculate(task) for task in chunk]
+
+class ParallelCalculator:
+    """
+    プロセスプールで配合を計算する。カタログの組成は共有メモリに一度だけ公開し、
+    ワーカーはそれを読み取り専用で参照する（JSONの再読み込み・検証、製剤モデルの複製をしない）。
+    lines / compatibility は全ての患者に同じ条件で適用する（calculate_infusion() と同じ）。
+
+        with ParallelCalculator(get_catalog(), jobs=4) as calculator:
+            for result in calculator.map((patient, "ソルデム3AG") for patient in patients):
+                ...
+    """
+
+    def __init__(self, catalog: CatalogVersion, jobs: Optional[int] = None, atlas_path: Optional[str] = None,
+                 lines: Optional[Sequence[LineSpec]] = None, compatibility: Optional[CompatibilityLimits] = None):
+        self.catalog_version = catalog.version
+        self.jobs = jobs or os.cpu_count()
+        self.shared = SharedCatalog(catalog)
+        try:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.jobs,
+                initializer=_init_worker,
+                initargs=(self.shared.handle, atlas_path, tuple(lines) if lines else None, compatibility),
+            )
+        except Exception:
+            self.shared.close()
+            raise
+
+    def map(self, tasks: Iterable[Tuple[Patient, str]], chunksize: int = 16,
+            max_pending: Optional[int] = None) -> Iterator[BatchResult]:
+        """
+        (患者, ベース製剤名) 毎の結果を入力の順に返す。計算できなかった患者は error に理由を設定する。
+        tasks は chunksize 件ずつ、未完了が max_pending チャンク（既定はワーカー数の2倍）を超えない範囲で
+        読み進めるため、巨大な入力や終わりの無いジェネレータでもメモリを使い切らない。
+        """
+        window = max_pending or 2 * self.jobs
+        indexed = ((index, patient, base_solution_name) for index, (patient, base_solution_name) in enumerate(tasks))
+        pending: Deque[Future] = deque()
+        try:
+            while True:
+                while len(pending) < window:
+                    chunk = list(islice(indexed, chunksize))
+                    if not chunk:
+                        break
+                    pending.append(self.pool.submit(_calculate_chunk, chunk))
+                if not pending:
+                    return
+                # 入力の順に返すため、先頭のチャンクの完了を待つ
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        self.pool.shutdown()
+        self.shared.close()
+
+    def __enter__(self) -> "ParallelCalculator":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,281 @@
+# calculation/recipe_atlas.py
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from models.patient import Patient
+from calculation.model_template import NUTRIENTS, LOWER_RATIO, UPPER_RATIO
+
+DEFAULT_ATLAS_PATH = os.environ.get(
+    'TPN_ATLAS_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'recipe_atlas.db'),
+)
+
+# グリッドの軸（Patientの項目, 1kgあたり）。体重は軸に含めない:
+# 目標値は体重に比例し、右辺を一律に定数倍しても最適基底は変わらないため。
+ATLAS_FIELDS = ['gir', 'amino_acid', 'na', 'k', 'cl', 'fat']
+
+# 各軸の格子点。0は「計算対象外」
+DEFAULT_GRID: Dict[str, List[float]] = {
+    'gir': [0.0, 4.0, 5.0, 6.0, 7.0, 8.0, 10.0],
+    'amino_acid': [0.0, 2.0, 3.0, 4.0],
+    'na': [0.0, 2.0, 3.0, 4.0],
+    'k': [0.0, 1.0, 2.0, 3.0],
+    'cl': [0.0, 2.0, 3.0, 4.0],
+    'fat': [0.0, 1.0, 2.0, 3.0],
+}
+
+# 基底の判定・検証の許容誤差
+POSITIVE_TOLERANCE = 1e-9
+BINDING_TOLERANCE = 1e-6
+FEASIBILITY_TOLERANCE = 1e-7
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS atlas_grid (
+    catalog_version TEXT NOT NULL,
+    field TEXT NOT NULL,
+    grid_values TEXT NOT NULL,
+    PRIMARY KEY (catalog_version, field)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS atlas_products (
+    catalog_version TEXT NOT NULL,
+    base_solution_name TEXT NOT NULL,
+    product_names TEXT NOT NULL,
+    PRIMARY KEY (catalog_version, base_solution_name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS recipe_atlas (
+    catalog_version TEXT NOT NULL,
+    base_solution_name TEXT NOT NULL,
+    gir REAL NOT NULL,
+    amino_acid REAL NOT NULL,
+    na REAL NOT NULL,
+    k REAL NOT NULL,
+    cl REAL NOT NULL,
+    fat REAL NOT NULL,
+    basic_products TEXT NOT NULL,
+    binding_constraints TEXT NOT NULL,
+    total_volume REAL NOT NULL,
+    PRIMARY KEY (catalog_version, base_solution_name, gir, amino_acid, na, k, cl, fat)
+) WITHOUT ROWID;
+"""
+
+# 基底: (正の値をとる製剤の添字, 等号で効いている制約 (栄養素の添字, 'L' 下限 / 'U' 上限))
+Basis = Tuple[Tuple[int, ...], Tuple[Tuple[int, str], ...]]
+
+def extract_basis(
+    coefficients: Sequence[Sequence[float]],
+    targets: Dict[str, float],
+    active_nutrients: Sequence[str],
+    volumes: Sequence[float],
+) -> Basis:
+    """
+    最適解から基底（正の製剤と等号で効いている制約）を取り出す。
+    """
+    basic = tuple(j for j, volume in enumerate(volumes) if volume > POSITIVE_TOLERANCE)
+    binding = []
+    for nutrient in active_nutrients:
+        i = NUTRIENTS.index(nutrient)
+        supply = sum(row[i] * volumes[j] for j, row in enumerate(coefficients))
+        lower = LOWER_RATIO * targets[nutrient]
+        upper = UPPER_RATIO * targets[nutrient]
+        if abs(supply - lower) <= BINDING_TOLERANCE * max(1.0, lower):
+            binding.append((i, 'L'))
+        elif abs(supply - upper) <= BINDING_TOLERANCE * max(1.0, upper):
+            binding.append((i, 'U'))
+    return basic, tuple(binding)
+
+def solve_basis(
+    coefficients: Sequence[Sequence[float]],
+    targets: Dict[str, float],
+    active_nutrients: Sequence[str],
+    basis: Basis,
+) -> Optional[List[float]]:
+    """
+    基底を固定して配合量を求め、最適性を検証する。
+    主実行可能（配合量が非負で全制約を満たす）かつ双対実行可能（双対変数の符号と被約費用が非負）
+    であれば、その配合量はLPの最適解である。検証できない場合はNoneを返す。
+    """
+    basic, binding = basis
+    # 基底の行が今回の制約に無い（前回と有効な栄養素の組が異なる）場合は最適性の根拠にならない
+    if len(basic) != len(binding) or any(NUTRIENTS[i] not in active_nutrients for i, _ in binding):
+        return None
+    matrix = np.asarray(coefficients, dtype=float).T  # 栄養素 × 製剤
+    rows = [i for i, _ in binding]
+    rhs = np.array([(LOWER_RATIO if side == 'L' else UPPER_RATIO) * targets[NUTRIENTS[i]] for i, side in binding])
+    volumes = np.zeros(matrix.shape[1])
+    duals = np.zeros(0)
+    if basic:
+        square = matrix[np.ix_(rows, basic)]
+        try:
+            volumes[list(basic)] = np.linalg.solve(square, rhs)
+            duals = np.linalg.solve(square.T, np.ones(len(basic)))
+        except np.linalg.LinAlgError:
+            return None
+    if (volumes < -FEASIBILITY_TOLERANCE).any():
+        return None
+    volumes = np.clip(volumes, 0.0, None)
+
+    for nutrient in active_nutrients:
+        supply = matrix[NUTRIENTS.index(nutrient)] @ volumes
+        lower = LOWER_RATIO * targets[nutrient]
+        upper = UPPER_RATIO * targets[nutrient]
+        if supply < lower - FEASIBILITY_TOLERANCE * max(1.0, lower) or supply > upper + FEASIBILITY_TOLERANCE * max(1.0, upper):
+            return None
+
+    # 下限制約(>=)の双対は非負、上限制約(<=)の双対は非正
+    for dual, (_, side) in zip(duals, binding):
+        if (side == 'L' and dual < -FEASIBILITY_TOLERANCE) or (side == 'U' and dual > FEASIBILITY_TOLERANCE):
+            return None
+    reduced_costs = 1.0 - matrix[rows].T @ duals if rows else np.ones(matrix.shape[1])
+    if (reduced_costs < -FEASIBILITY_TOLERANCE).any():
+        return None
+    return volumes.tolist()
+
+def grid_point(patient: Patient, grid: Dict[str, List[float]]) -> Optional[Tuple[float, ...]]:
+    """
+    患者の入力に最も近い格子点を返す。計算対象外の項目は0の格子点に対応させる。
+    """
+    point = []
+    for field in ATLAS_FIELDS:
+        value = getattr(patient, field)
+        values = grid[field]
+        if not (getattr(patient, f"{field}_included") and value):
+            if 0.0 not in values:
+                return None
+            point.append(0.0)
+            continue
+        candidates = [v for v in values if v > 0]
+        if not candidates:
+            return None
+        point.append(min(candidates, key=lambda v: abs(v - value)))
+    return tuple(point)
+
+class RecipeAtlas:
+    """
+    格子点毎の最適基底を保存したオフラインの配合表（SQLite）。
+    lookup() は最も近い格子点の基底で連立方程式を解き、最適性を検証できた場合だけ結果を返す。
+    検証に失敗した場合はNoneを返し、呼び出し側で通常の最適化を行う。結果は常に厳密なLP最適解。
+    """
+
+    def __init__(self, db_path: str = DEFAULT_ATLAS_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._grids: Dict[str, Optional[Dict[str, List[float]]]] = {}
+        self._products: Dict[Tuple[str, str], Optional[Tuple[str, ...]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=10.0)
+
+    def store(
+        self,
+        catalog_version: str,
+        base_solution_name: str,
+        product_names: Sequence[str],
+        grid: Dict[str, List[float]],
+        points: List[Tuple[Tuple[float, ...], Basis, float]],
+    ):
+        """
+        1つのベース製剤の格子点 (格子点, 基底, 総投与量) を保存する。既存の同じ格子点は置き換える。
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO atlas_grid (catalog_version, field, grid_values) VALUES (?, ?, ?)",
+                [(catalog_version, field, json.dumps(sorted(grid[field]))) for field in ATLAS_FIELDS],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO atlas_products (catalog_version, base_solution_name, product_names) VALUES (?, ?, ?)",
+                (catalog_version, base_solution_name, json.dumps(list(product_names), ensure_ascii=False)),
+            )
+            conn.executemany(
+                f"INSERT OR REPLACE INTO recipe_atlas (catalog_version, base_solution_name, {', '.join(ATLAS_FIELDS)}, "
+                "basic_products, binding_constraints, total_volume) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (catalog_version, base_solution_name, *point, json.dumps(basis[0]), json.dumps(basis[1]), total_volume)
+                    for point, basis, total_volume in points
+                ],
+            )
+        with self._lock:
+            self._grids.pop(catalog_version, None)
+            self._products.pop((catalog_version, base_solution_name), None)
+
+    def _grid(self, catalog_version: str) -> Optional[Dict[str, List[float]]]:
+        with self._lock:
+            if catalog_version in self._grids:
+                return self._grids[catalog_version]
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT field, grid_values FROM atlas_grid WHERE catalog_version = ?", (catalog_version,)
+            ).fetchall()
+        grid = {field: json.loads(values) for field, values in rows} if rows else None
+        with self._lock:
+            self._grids[catalog_version] = grid
+        return grid
+
+    def _product_names(self, catalog_version: str, base_solution_name: str) -> Optional[Tuple[str, ...]]:
+        key = (catalog_version, base_solution_name)
+        with self._lock:
+            if key in self._products:
+                return self._products[key]
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT product_names FROM atlas_products WHERE catalog_version = ? AND base_solution_name = ?", key
+            ).fetchone()
+        names = tuple(json.loads(row[0])) if row else None
+        with self._lock:
+            self._products[key] = names
+        return names
+
+    def find_basis(self, catalog_version: str, base_solution_name: str, point: Tuple[float, ...]) -> Optional[Basis]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT basic_products, binding_constraints FROM recipe_atlas WHERE catalog_version = ? "
+                f"AND base_solution_name = ? AND {' AND '.join(f'{field} = ?' for field in ATLAS_FIELDS)}",
+                (catalog_version, base_solution_name, *point),
+            ).fetchone()
+        if row is None:
+            return None
+        return tuple(json.loads(row[0])), tuple((i, side) for i, side in json.loads(row[1]))
+
+    def lookup(
+        self,
+        catalog_version: str,
+        base_solution_name: str,
+        patient: Patient,
+        product_names: Sequence[str],
+        coefficients: Sequence[Sequence[float]],
+        targets: Dict[str, float],
+    ) -> Optional[Dict[str, float]]:
+        """
+        最も近い格子点の基底を検証し、最適であれば配合量（製剤名 -> mL/day）を返す。
+        格子に無い栄養素（Ca, Mg, Zn, P）を指定した場合、製剤の組が異なる場合もNone。
+        """
+        volumes = None
+        grid = self._grid(catalog_version)
+        if (grid is not None
+                and not any(targets.get(n, 0.0) > 0 for n in ['Ca', 'Mg', 'Zn', 'P'])
+                and self._product_names(catalog_version, base_solution_name) == tuple(product_names)):
+            point = grid_point(patient, grid)
+            basis = self.find_basis(catalog_version, base_solution_name, point) if point is not None else None
+            if basis is not None:
+                active_nutrients = [n for n in NUTRIENTS if targets.get(n, 0.0) > 0]
+                volumes = solve_basis(coefficients, targets, active_nutrients, basis)
+
+        if volumes is None:
+            self.misses += 1
+            logging.debug("配合表に該当する基底がありません。最適化を実行します。")
+            return None
+        self.hits += 1
+        logging.debug(f"配合表の基底を使用しました: {point}")
+        return dict(zip(product_names, volumes))
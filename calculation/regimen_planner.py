@@ -0,0 +1,58 @@
+# calculation/regimen_planner.py
+
+from models.patient import Patient
+from models.solution import Solution
+from models.additive import Additive
+from models.regimen_plan import AdvancementRule, DailyRecipe, RegimenPlan
+from calculation.infusion_calculator import calculate_infusion
+from calculation.recipe_atlas import Basis, RecipeAtlas
+from typing import Dict, List, Optional
+import logging
+
+def patient_for_day(patient: Patient, rules: List[AdvancementRule], day: int, weight: float) -> Patient:
+    """
+    漸増スケジュールを適用したday日目のPatientを返す。
+    スケジュールで指定された栄養素は自動的に計算対象（*_included=True）になる。
+    """
+    updates = {'weight': weight}
+    for rule in rules:
+        updates[rule.field] = rule.value_on(day)
+        if rule.field != 'twi':
+            updates[f"{rule.field}_included"] = True
+    return Patient(**{**patient.model_dump(), **updates})
+
+def plan_regimen(
+    patient: Patient,
+    base_solution: Solution,
+    additives: Dict[str, Additive],
+    rules: List[AdvancementRule],
+    weights: List[float],
+    warm_start: Optional[Basis] = None,
+    catalog_version: Optional[str] = None,
+    atlas: Optional[RecipeAtlas] = None,
+) -> RegimenPlan:
+    """
+    複数日の配合計画を作成する。
+    日数はweights（日毎の体重）の長さで決まる。各日はまず前日の最適基底（warm_start は初日に使う基底）で
+    最適性を検証し、検証できない日だけ最適化を行う。
+    """
+    if not weights:
+        raise ValueError("体重の推移を1日分以上指定してください。")
+
+    logging.info(f"配合計画の作成開始: {len(weights)}日分")
+    days = []
+    previous_basis = warm_start
+    for day, weight in enumerate(weights):
+        daily_patient = patient_for_day(patient, rules, day, weight)
+        try:
+            infusion_mix = calculate_infusion(
+                daily_patient, base_solution, additives,
+                warm_start=previous_basis, catalog_version=catalog_version, atlas=atlas,
+            )
+        except ValueError as ve:
+            raise ValueError(f"{day + 1}日目: {ve}") from ve
+        days.append(DailyRecipe(day=day, weight=weight, patient=daily_patient, infusion_mix=infusion_mix))
+        previous_basis = infusion_mix.report.basis
+
+    logging.info("配合計画の作成完了")
+    return RegimenPlan(base_solution_name=base_solution.name, days=days)
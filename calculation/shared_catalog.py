@@ -0,0 +1,113 @@
+# calculation/shared_catalog.py
+
+import logging
+import sys
+from multiprocessing import shared_memory
+from typing import Dict, Tuple
+
+import numpy as np
+from pydantic import BaseModel, ConfigDict
+
+from utils.data_loader import CatalogVersion
+from calculation.infusion_calculator import compile_composition, compile_osmolarity
+
+class SharedCatalogHandle(BaseModel):
+    """
+    ワーカープロセスに渡す共有メモリの識別情報（名前と配列の形、製剤名）。pickleしても小さい。
+    """
+    model_config = ConfigDict(frozen=True)
+
+    shm_name: str
+    catalog_version: str
+    base_solution_names: Tuple[str, ...]
+    product_names: Dict[str, Tuple[str, ...]]  # ベース製剤名 -> 製剤名（compile_composition() の順）
+    shape: Tuple[int, int, int]  # (ベース製剤, 製剤, 栄養素)。組成の後ろに製剤毎の浸透圧 (ベース製剤, 製剤) が続く
+
+class SharedCatalogView:
+    """
+    共有メモリ上の組成行列と浸透圧を読み取り専用で参照する。製剤のモデルは生成しない。
+    """
+
+    def __init__(self, handle: SharedCatalogHandle, shm: shared_memory.SharedMemory):
+        self.handle = handle
+        self._shm = shm
+        self.matrix = np.ndarray(handle.shape, dtype=np.float64, buffer=shm.buf)
+        self.matrix.flags.writeable = False
+        self.osmolarity_matrix = np.ndarray(handle.shape[:2], dtype=np.float64, buffer=shm.buf, offset=self.matrix.nbytes)
+        self.osmolarity_matrix.flags.writeable = False
+        self._index = {name: k for k, name in enumerate(handle.base_solution_names)}
+
+    @property
+    def catalog_version(self) -> str:
+        return self.handle.catalog_version
+
+    def composition(self, base_solution_name: str) -> Tuple[Tuple[str, ...], np.ndarray]:
+        """
+        compile_composition() と同じ (製剤名, 製剤毎の1mLあたりの栄養素量) を返す。組成はコピーしない。
+        """
+        if base_solution_name not in self._index:
+            raise ValueError(f"ベース製剤が見つかりません: {base_solution_name}")
+        return self.handle.product_names[base_solution_name], self.matrix[self._index[base_solution_name]]
+
+    def osmolarities(self, base_solution_name: str) -> np.ndarray:
+        """
+        compile_osmolarity() と同じ製剤毎の浸透圧（mOsm/L。カタログの値、未設定の製剤は推定値）を返す。
+        """
+        if base_solution_name not in self._index:
+            raise ValueError(f"ベース製剤が見つかりません: {base_solution_name}")
+        return self.osmolarity_matrix[self._index[base_solution_name]]
+
+    def close(self):
+        self.matrix = None
+        self.osmolarity_matrix = None
+        self._shm.close()
+
+class SharedCatalog:
+    """
+    カタログの組成行列と製剤毎の浸透圧を共有メモリに一度だけ書き込み、ワーカーからは attach_shared_catalog() で参照させる。
+    作成したプロセスが close() で解放する。
+    """
+
+    def __init__(self, catalog: CatalogVersion):
+        compositions = [compile_composition(solution, catalog.additives) for solution in catalog.solutions]
+        matrix = np.array([coefficients for _, coefficients in compositions], dtype=np.float64)
+        # カタログに浸透圧が記載された製剤はその値を使う（組成からの推定で置き換えない）
+        osmolarity_matrix = np.array([
+            compile_osmolarity(solution, catalog.additives, coefficients)
+            for solution, (_, coefficients) in zip(catalog.solutions, compositions)
+        ], dtype=np.float64).reshape(matrix.shape[:2])
+        self._shm = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes + osmolarity_matrix.nbytes, 1))
+        np.ndarray(matrix.shape, dtype=np.float64, buffer=self._shm.buf)[...] = matrix
+        np.ndarray(osmolarity_matrix.shape, dtype=np.float64, buffer=self._shm.buf, offset=matrix.nbytes)[...] = osmolarity_matrix
+        self.handle = SharedCatalogHandle(
+            shm_name=self._shm.name,
+            catalog_version=catalog.version,
+            base_solution_names=tuple(solution.name for solution in catalog.solutions),
+            product_names={solution.name: tuple(names) for solution, (names, _) in zip(catalog.solutions, compositions)},
+            shape=matrix.shape,
+        )
+        logging.debug(f"カタログ {catalog.version} を共有メモリに公開しました: {self._shm.name} ({matrix.nbytes} bytes)")
+
+    def close(self):
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "SharedCatalog":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def attach_shared_catalog(handle: SharedCatalogHandle) -> SharedCatalogView:
+    """
+    公開済みの共有メモリに接続する。JSONの読み込み・検証は行わない。
+    """
+    if sys.version_info >= (3, 13):
+        # 解放は作成したプロセスが行う
+        shm = shared_memory.SharedMemory(name=handle.shm_name, track=False)
+    else:
+        shm = shared_memory.SharedMemory(name=handle.shm_name)
+    return SharedCatalogView(handle, shm)
@@ -1,6 +1,7 @@
 # models/additive.py
 
 from pydantic import BaseModel
+from typing import Optional
 
 class Additive(BaseModel):
     name: str
@@ -22,3 +23,4 @@ class Additive(BaseModel):
     mg_concentration_unit: str
     fat_concentration: float
     fat_concentration_unit: str
+    osmolarity: Optional[float] = None  # 浸透圧 (mOsm/L)。未設定の場合は組成から推定
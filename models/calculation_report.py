@@ -0,0 +1,26 @@
+# models/calculation_report.py
+
+from pydantic import BaseModel
+from typing import Dict, List, Optional, Tuple
+
+from models.compatibility import CompatibilityLimits
+from models.infusion_line import LineSpec
+
+class CalculationReport(BaseModel):
+    """
+    計算過程の構造化データ（目標値はInfusionMix.input_amounts）。説明文は参照時に生成する。
+    """
+    base_solution_name: str
+    active_nutrients: List[str]  # 供給量制約を設定した栄養素
+    lower_ratio: float  # 目標値に対する下限
+    upper_ratio: float  # 目標値に対する上限
+    total_volume: float  # mL/day
+    status_message: str
+    solver: str  # 'cbc'（最適化）/ 'atlas'（事前計算した基底）/ 'warm_start'（前回の最適基底）
+    timings_ms: Dict[str, float]  # 処理段階 -> 所要時間
+    line_specs: List[LineSpec] = []  # 複数ラインで計算した場合のライン条件（上限を含む）
+    compatibility: Optional[CompatibilityLimits] = None  # 浸透圧・Ca/Pの上限
+    osmolarities: List[float] = []  # 上限を設定した場合の製剤毎の浸透圧（mOsm/L、compile_composition() の順）
+    # 最適基底（recipe_atlas.Basis: 正の製剤の添字, 等号で効いている制約）。次の計算の warm_start に渡す。
+    # 追加の制約が無い1ラインの計算で、基底を特定できた場合のみ
+    basis: Optional[Tuple[Tuple[int, ...], Tuple[Tuple[int, str], ...]]] = None
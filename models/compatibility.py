@@ -0,0 +1,16 @@
+# models/compatibility.py
+
+from pydantic import BaseModel, ConfigDict
+from typing import Optional
+
+class CompatibilityLimits(BaseModel):
+    """
+    配合変化・浸透圧の上限。脂肪乳剤以外の製剤（2ラインの場合はメインバッグ）の混合液に適用する。
+    Ca×Pの溶解度は線形の近似（Ca + P の濃度の和）で扱う。
+    """
+    model_config = ConfigDict(frozen=True)
+
+    max_osmolarity: Optional[float] = None  # mOsm/L（末梢ラインでは900前後）
+    max_ca: Optional[float] = None  # Ca (mEq/L)
+    max_p: Optional[float] = None  # P (mmol/L)
+    max_ca_p_sum: Optional[float] = None  # Ca (mEq/L) + P (mmol/L)
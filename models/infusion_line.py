@@ -0,0 +1,34 @@
+# models/infusion_line.py
+
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Dict, Optional
+
+class LineSpec(BaseModel):
+    """
+    投与ライン（メインバッグ、脂肪乳剤シリンジ等）の条件。
+    lipid=True のラインには脂肪を含む製剤を、それ以外のラインにはその他の製剤を割り当てる。
+    """
+    model_config = ConfigDict(frozen=True)
+
+    name: str
+    label: str
+    lipid: bool = False
+    hours: float = Field(24.0, gt=0, le=24)  # 1日の投与時間
+    max_volume: Optional[float] = None  # mL/day
+    max_rate: Optional[float] = None  # mL/h
+    max_concentration: Dict[str, float] = {}  # 栄養素 -> 1mLあたりの上限（g/mL, mEq/mL等）
+
+class LineResult(BaseModel):
+    name: str
+    label: str
+    volumes: Dict[str, float]  # 製剤名 -> mL/day
+    total_volume: float  # mL/day
+    hours: float
+    rate: float  # mL/h
+    concentrations: Dict[str, float]  # 栄養素 -> 1mLあたりの量
+
+# メインバッグ（ベース製剤・アミノ酸・電解質）と脂肪乳剤シリンジの2ライン（上限なし）
+TWO_LINES = (
+    LineSpec(name='main', label='メインバッグ'),
+    LineSpec(name='lipid', label='脂肪乳剤シリンジ', lipid=True),
+)
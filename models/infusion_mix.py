@@ -1,7 +1,10 @@
 # models/infusion_mix.py
 
 from pydantic import BaseModel
-from typing import Optional, Dict
+from typing import Optional, Dict, List
+
+from models.calculation_report import CalculationReport
+from models.infusion_line import LineResult
 
 class InfusionMix(BaseModel):
     gir: Optional[float] = None
@@ -15,8 +18,64 @@ class InfusionMix(BaseModel):
     zn: Optional[float] = None
     cl: Optional[float] = None
     detailed_mix: Dict[str, float]
-    calculation_steps: str
     nutrient_totals: Dict[str, float]
     nutrient_units: Dict[str, str]
     input_amounts: Dict[str, float]
     input_units: Dict[str, str]
+    catalog_version: Optional[str] = None  # 計算に使用したカタログのバージョン
+    report: Optional[CalculationReport] = None
+    lines: Optional[List[LineResult]] = None  # 投与ライン毎の内訳（複数ラインで計算した場合）
+    osmolarity: Optional[float] = None  # 脂肪乳剤以外の混合液の浸透圧 (mOsm/L)
+    ca_p_sum: Optional[float] = None  # 同 Ca (mEq/L) + P (mmol/L)
+
+    @property
+    def calculation_steps(self) -> str:
+        """
+        計算ステップの説明（Markdown）。参照時に report から生成する。
+        """
+        if self.report is None:
+            return ""
+        lines = ["### 計算ステップ", "1. **目標栄養素の設定**"]
+        lines += [
+            f"   - {nutrient}: {target:.2f} {self.input_units.get(nutrient, '')}"
+            for nutrient, target in self.input_amounts.items()
+        ]
+        lines += [
+            "2. **最適化モデルの構築**",
+            "   - 製剤の使用量を変数として定義。",
+            "   - 目的関数: 総投与量の最小化。",
+            "   - 栄養素の供給量が目標の±10%を満たすよう制約を設定。",
+        ]
+        for line in self.report.line_specs:
+            caps = []
+            if line.max_volume is not None:
+                caps.append(f"投与量 {line.max_volume:g} mL/day")
+            if line.max_rate is not None:
+                caps.append(f"速度 {line.max_rate:g} mL/h")
+            caps += [f"{nutrient}濃度 {limit:g} /mL" for nutrient, limit in line.max_concentration.items()]
+            if caps:
+                lines.append(f"   - {line.label}の上限: {'、'.join(caps)}。")
+        compatibility = self.report.compatibility
+        if compatibility is not None:
+            caps = [
+                f"{label} {limit:g}"
+                for label, limit in [
+                    ("浸透圧 (mOsm/L)", compatibility.max_osmolarity),
+                    ("Ca (mEq/L)", compatibility.max_ca),
+                    ("P (mmol/L)", compatibility.max_p),
+                    ("Ca+P", compatibility.max_ca_p_sum),
+                ]
+                if limit is not None
+            ]
+            if caps:
+                lines.append(f"   - 脂肪乳剤以外の混合液の上限: {'、'.join(caps)}。")
+        lines += [
+            "3. **最適化の実行**",
+            f"   - 総投与量: {self.report.total_volume:.2f} mL/day",
+            f"   - {self.report.status_message}",
+        ]
+        for line in self.lines or []:
+            lines.append(f"   - {line.label}: {line.total_volume:.2f} mL/day（{line.hours:g}時間, {line.rate:.2f} mL/h）")
+        if self.osmolarity is not None:
+            lines.append(f"   - 脂肪乳剤以外の混合液: 浸透圧 {self.osmolarity:.0f} mOsm/L、Ca+P {self.ca_p_sum:.1f}")
+        return "\n".join(lines) + "\n"
@@ -1,7 +1,7 @@
 # models/patient.py
 
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 class Patient(BaseModel):
     weight: float  # kg
@@ -26,3 +26,18 @@ class Patient(BaseModel):
     zn_included: bool = False
     cl: Optional[float] = None  # mEq/kg/day
     cl_included: bool = False
+
+# 入力画面（app.py）と一括入力の検証で共通に使う入力範囲: 項目 -> (最小値, 最大値)
+PATIENT_INPUT_LIMITS: Dict[str, Tuple[float, float]] = {
+    'weight': (0.1, 150.0),
+    'twi': (50.0, 200.0),
+    'gir': (4.0, 10.0),
+    'amino_acid': (2.0, 4.0),
+    'fat': (0.0, 5.0),
+    'na': (2.0, 4.0),
+    'k': (1.0, 3.0),
+    'cl': (0.0, 5.0),
+    'ca': (0.0, 5.0),
+    'mg': (0.0, 5.0),
+    'zn': (0.0, 10.0),
+}
@@ -0,0 +1,60 @@
+# models/regimen_plan.py
+
+from pydantic import BaseModel
+from typing import Dict, Iterator, List, Literal, Optional, Any
+
+from models.patient import Patient
+from models.infusion_mix import InfusionMix
+
+# Pは compute_targets() で目標を設定しない（最適化の対象外）ため、漸増スケジュールにも指定できない
+AdvanceableField = Literal['twi', 'gir', 'amino_acid', 'na', 'k', 'fat', 'ca', 'mg', 'zn', 'cl']
+
+class AdvancementRule(BaseModel):
+    """
+    1項目の漸増スケジュール。day日目の値は min(start + step * day, limit)。
+    """
+    field: AdvanceableField
+    start: float
+    step: float = 0.0
+    limit: Optional[float] = None
+
+    def value_on(self, day: int) -> float:
+        value = self.start + self.step * day
+        if self.limit is not None:
+            value = min(value, self.limit) if self.step >= 0 else max(value, self.limit)
+        return value
+
+class DailyRecipe(BaseModel):
+    day: int  # 0始まり
+    weight: float  # kg
+    patient: Patient
+    infusion_mix: InfusionMix
+
+class RegimenPlan(BaseModel):
+    base_solution_name: str
+    days: List[DailyRecipe]
+
+    def table_rows(self) -> Iterator[Dict[str, Any]]:
+        """
+        日毎・製剤毎に1行の辞書を返す（エクスポート用）。
+        """
+        for recipe in self.days:
+            mix = recipe.infusion_mix
+            for product, volume in mix.detailed_mix.items():
+                yield {
+                    'day': recipe.day + 1,
+                    'weight': recipe.weight,
+                    'twi': recipe.patient.twi,
+                    'gir': mix.gir,
+                    'amino_acid': mix.amino_acid,
+                    'fat': mix.fat,
+                    'product': product,
+                    'volume_ml_per_day': volume,
+                }
+
+    def to_dataframe(self):
+        """
+        計画全体を1つのDataFrameとして返す。
+        """
+        import pandas as pd
+        return pd.DataFrame(list(self.table_rows()))
@@ -1,6 +1,7 @@
 # models/solution.py
 
 from pydantic import BaseModel
+from typing import Optional
 
 class Solution(BaseModel):
     name: str
@@ -24,3 +25,4 @@ class Solution(BaseModel):
     zn_unit: str
     fat_concentration: float  # 脂肪濃度 (g/mL)
     fat_concentration_unit: str  # 脂肪濃度の単位 (例: "g/mL")
+    osmolarity: Optional[float] = None  # 浸透圧 (mOsm/L)。未設定の場合は組成から推定
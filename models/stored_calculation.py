@@ -0,0 +1,19 @@
+# models/stored_calculation.py
+
+from pydantic import BaseModel
+from typing import Optional
+from datetime import date, datetime
+
+from models.patient import Patient
+from models.infusion_mix import InfusionMix
+
+class StoredCalculation(BaseModel):
+    id: int
+    patient_id: str
+    order_date: date
+    created_at: datetime
+    catalog_version: Optional[str] = None
+    base_solution_name: str
+    patient: Patient
+    infusion_mix: InfusionMix
+    elapsed_ms: float  # 計算に要した時間
@@ -0,0 +1,21 @@
+# tests/conftest.py
+import pytest
+from models.patient import Patient
+from utils.data_loader import load_solutions, load_additives
+
+@pytest.fixture
+def catalog():
+    """先頭の基本輸液と添加剤カタログ"""
+    return load_solutions()[0], load_additives()
+
+@pytest.fixture
+def make_patient():
+    """
+    体重1.8kgの標準的な患者を作るファクトリ。
+    キーワードで指定した栄養素は値を上書きし、計算対象（*_included=True）にする。
+    """
+    def factory(**nutrients: float) -> Patient:
+        values = {'gir': 6.0, 'amino_acid': 2.5, 'na': 3.0, 'k': 2.0, **nutrients}
+        included = {f"{name}_included": True for name in values}
+        return Patient(weight=1.8, twi=120, **values, **included)
+    return factory
@@ -0,0 +1,63 @@
+# tests/test_compatibility.py
+import pytest
+from models.compatibility import CompatibilityLimits
+from models.infusion_line import LineSpec
+from calculation.infusion_calculator import calculate_infusion, compile_composition, compile_osmolarity
+from calculation.explain import constraint_details
+from calculation.model_template import NUTRIENTS, estimate_osmolarity
+
+def test_estimate_osmolarity():
+    row = [0.0] * len(NUTRIENTS)
+    row[NUTRIENTS.index('Glucose')] = 0.05  # 5%ブドウ糖
+    row[NUTRIENTS.index('Na')] = 0.077  # 0.45%食塩水相当
+    assert estimate_osmolarity(row) == pytest.approx(1000.0 * (0.05 * 1000.0 / 180.0 + 0.077 * 2.0))
+
+def test_catalog_osmolarity_overrides_estimate(catalog):
+    base_solution, additives = catalog
+    product_names, coefficients = compile_composition(base_solution, additives)
+    unlabelled = base_solution.model_copy(update={'osmolarity': None})
+    osmolarities = compile_osmolarity(base_solution, additives, coefficients)
+    estimated = compile_osmolarity(unlabelled, additives, coefficients)
+    assert osmolarities[0] == base_solution.osmolarity
+    assert estimated[0] == pytest.approx(estimate_osmolarity(coefficients[0]))
+    assert osmolarities[1:] == estimated[1:]
+    assert osmolarities[product_names.index('生理食塩水')] == additives['生理食塩水'].osmolarity
+
+def test_compatibility_limits_are_enforced(catalog, make_patient):
+    base_solution, additives = catalog
+    free = calculate_infusion(make_patient(ca=2.0, fat=2.0), base_solution, additives)
+    assert free.osmolarity > 600.0 and free.ca_p_sum > 30.0
+    limits = CompatibilityLimits(max_osmolarity=600.0, max_ca_p_sum=30.0)
+    mix = calculate_infusion(make_patient(ca=2.0, fat=2.0), base_solution, additives, compatibility=limits)
+    assert mix.osmolarity <= 600.0 + 1e-6
+    assert mix.ca_p_sum <= 30.0 + 1e-6
+    assert sum(mix.detailed_mix.values()) > sum(free.detailed_mix.values())
+    assert "   - 脂肪乳剤以外の混合液の上限: 浸透圧 (mOsm/L) 600、Ca+P 30。\n" in mix.calculation_steps
+    assert f"浸透圧 {mix.osmolarity:.0f} mOsm/L" in mix.calculation_steps
+
+def test_compatibility_caps_in_explanation(catalog, make_patient):
+    base_solution, additives = catalog
+    product_names, coefficients = compile_composition(base_solution, additives)
+
+    def solve(max_osmolarity):
+        limits = CompatibilityLimits(max_osmolarity=max_osmolarity, max_ca_p_sum=60.0)
+        return calculate_infusion(make_patient(ca=2.0, fat=2.0), base_solution, additives, compatibility=limits)
+
+    mix = solve(600.0)
+    caps = {d.nutrient: d for d in constraint_details(mix, product_names, coefficients) if d.kind == 'cap'}
+    assert set(caps) == {"浸透圧 (mOsm/L)", "Ca+P (mEq/L + mmol/L)"}
+    assert caps["浸透圧 (mOsm/L)"].supply == pytest.approx(mix.osmolarity)
+    assert caps["浸透圧 (mOsm/L)"].binding == 'U'
+    assert caps["Ca+P (mEq/L + mmol/L)"].binding is None
+    # 双対価格は上限を動かした時の総投与量の変化と一致する
+    delta = 0.5
+    change = sum(solve(600.0 + delta).detailed_mix.values()) - sum(mix.detailed_mix.values())
+    assert change == pytest.approx(caps["浸透圧 (mOsm/L)"].shadow_price * delta, rel=1e-2)
+
+def test_infeasible_limit_is_reported(catalog, make_patient):
+    base_solution, additives = catalog
+    # 蒸留水で希釈できるため、浸透圧の上限はメインバッグの容量の上限と組み合わせて初めて解が無くなる
+    lines = (LineSpec(name='main', label='メイン', max_volume=100.0), LineSpec(name='lipid', label='脂肪', lipid=True))
+    with pytest.raises(ValueError, match="投与ライン毎の上限.*浸透圧"):
+        calculate_infusion(make_patient(ca=2.0, fat=2.0), base_solution, additives, lines=lines,
+                           compatibility=CompatibilityLimits(max_osmolarity=50.0))
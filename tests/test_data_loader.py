@@ -0,0 +1,100 @@
+# tests/test_data_loader.py
+import json
+import os
+import shutil
+import pytest
+from utils import data_loader
+from utils.data_loader import get_catalog, get_catalog_version, on_catalog_change
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+@pytest.fixture
+def catalog_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, 'SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    monkeypatch.setattr(data_loader, '_current_catalog', None)
+    monkeypatch.setattr(data_loader, '_current_signature', None)
+    monkeypatch.setattr(data_loader, '_catalog_listeners', [])
+    monkeypatch.setattr(data_loader, '_catalog_versions', {})
+    solutions_path = tmp_path / 'base_solutions.json'
+    additives_path = tmp_path / 'additives.json'
+    shutil.copy(os.path.join(DATA_DIR, 'base_solutions.json'), solutions_path)
+    shutil.copy(os.path.join(DATA_DIR, 'additives.json'), additives_path)
+    return str(solutions_path), str(additives_path)
+
+def test_catalog_is_reused_while_files_are_unchanged(catalog_files):
+    first = get_catalog(*catalog_files)
+    second = get_catalog(*catalog_files)
+    assert first is second
+    assert len(first.version) == 12
+    assert get_catalog_version(first.version) is first
+    assert os.path.isdir(os.path.join(data_loader.SNAPSHOT_DIR, first.version))
+
+def test_catalog_hot_reload_swaps_version(catalog_files):
+    solutions_path, additives_path = catalog_files
+    changes = []
+    on_catalog_change(lambda old, new: changes.append((old.version, new.version)))
+    old = get_catalog(*catalog_files)
+
+    with open(additives_path, encoding='utf-8') as f:
+        data = json.load(f)
+    data['リン酸Na']['na_concentration'] = 0.6
+    with open(additives_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.utime(additives_path, ns=(0, 1))
+
+    new = get_catalog(*catalog_files)
+    assert new.version != old.version
+    assert new.additives['リン酸Na'].na_concentration == 0.6
+    assert old.additives['リン酸Na'].na_concentration == 0.75
+    assert changes == [(old.version, new.version)]
+
+def test_broken_catalog_keeps_previous_version(catalog_files):
+    solutions_path, additives_path = catalog_files
+    current = get_catalog(*catalog_files)
+    with open(additives_path, 'w', encoding='utf-8') as f:
+        f.write('{broken')
+    assert get_catalog(*catalog_files) is current
+
+def test_catalog_version_is_loaded_from_snapshot(catalog_files, monkeypatch):
+    current = get_catalog(*catalog_files)
+    # 再起動後（このプロセスで未ロード）を模擬する
+    monkeypatch.setattr(data_loader, '_catalog_versions', {})
+    restored = get_catalog_version(current.version)
+    assert restored is not current
+    assert restored.version == current.version
+    assert restored.additives == current.additives
+    assert get_catalog_version(current.version) is restored
+    assert get_catalog_version('000000000000') is None
+
+def test_tampered_snapshot_is_rejected(catalog_files, monkeypatch):
+    current = get_catalog(*catalog_files)
+    monkeypatch.setattr(data_loader, '_catalog_versions', {})
+    with open(os.path.join(data_loader.SNAPSHOT_DIR, current.version, 'additives.json'), 'a', encoding='utf-8') as f:
+        f.write(' ')
+    assert get_catalog_version(current.version) is None
+
+def test_snapshot_archived_by_another_process_is_kept(catalog_files, monkeypatch):
+    solutions_path, additives_path = catalog_files
+    with open(solutions_path, 'rb') as f:
+        solutions_bytes = f.read()
+    with open(additives_path, 'rb') as f:
+        additives_bytes = f.read()
+    version = data_loader.compute_catalog_hash(solutions_bytes, additives_bytes)
+    target_dir = os.path.join(data_loader.SNAPSHOT_DIR, version)
+    # 存在確認の後、置き換えの前に別のプロセスが同じバージョンを保存した状況
+    os.makedirs(target_dir)
+    with open(os.path.join(target_dir, 'base_solutions.json'), 'wb') as f:
+        f.write(solutions_bytes)
+    isdir = os.path.isdir
+    checked = []
+
+    def isdir_after_race(path):
+        if path == target_dir and not checked:
+            checked.append(path)
+            return False
+        return isdir(path)
+
+    with monkeypatch.context() as m:
+        m.setattr(data_loader.os.path, 'isdir', isdir_after_race)
+        data_loader._archive_snapshot(version, solutions_bytes, additives_bytes)
+    assert os.listdir(data_loader.SNAPSHOT_DIR) == [version]
@@ -0,0 +1,90 @@
+# tests/test_differential_check.py
+import random
+import pytest
+from calculation.infusion_calculator import (
+    calculate_from_composition, compile_composition, compile_osmolarity, compute_targets,
+)
+from tools.differential_check import (
+    compare, find_slowdowns, random_constraints, random_patient, reference_solve, run_differential_check,
+)
+from utils.data_loader import get_catalog
+
+TINY_GRID = {
+    'gir': [0.0, 6.0],
+    'amino_acid': [0.0, 3.0],
+    'na': [0.0, 3.0],
+    'k': [0.0, 2.0],
+    'cl': [0.0],
+    'fat': [0.0, 2.0],
+}
+
+def test_all_engines_agree_with_reference():
+    catalog = get_catalog()
+    summary = run_differential_check(
+        cases=24, catalogs=2, seed=3, jobs=2, grid=TINY_GRID,
+        base_solution_names=[catalog.solutions[0].name, catalog.solutions[2].name],
+    )
+    assert summary['mismatches'] == []
+    assert set(summary['engines']) == {
+        'template', 'warm_start', 'atlas', 'two_lines', 'capped', 'parallel', 'parallel_capped',
+    }
+    assert all(counts['compared'] == 24 for counts in summary['engines'].values())
+    assert all(counts['feasible'] == summary['feasible'] for counts in summary['engines'].values())
+    assert summary['timings_ms']['reference']['count'] == 24
+    # 解なしの症例は引き直すため、大半の症例で配合を比較できる
+    assert summary['feasible'] >= 18
+    assert summary['atlas_hits'] > 0
+
+@pytest.fixture
+def feasible_case():
+    catalog = get_catalog()
+    base_solution = catalog.solutions[0]
+    product_names, coefficients = compile_composition(base_solution, catalog.additives)
+    osmolarities = compile_osmolarity(base_solution, catalog.additives, coefficients)
+    rng = random.Random(0)
+    while True:
+        patient = random_patient(rng)
+        reference = reference_solve(product_names, coefficients, compute_targets(patient))
+        if reference is not None:
+            break
+    return patient, base_solution.name, product_names, coefficients, osmolarities, reference
+
+def test_compare_detects_suboptimal_and_infeasible_recipes(feasible_case):
+    patient, base_solution_name, product_names, coefficients, osmolarities, reference = feasible_case
+    targets = compute_targets(patient)
+    mix = calculate_from_composition(patient, base_solution_name, product_names, coefficients, osmolarities=osmolarities)
+    assert compare(reference, mix, product_names, coefficients, targets, osmolarities)[0] is None
+    # 蒸留水を加えると供給量は変わらず総投与量だけが増える
+    diluted = mix.model_copy(update={'detailed_mix': {**mix.detailed_mix, '蒸留水': mix.detailed_mix['蒸留水'] + 1.0}})
+    assert compare(reference, diluted, product_names, coefficients, targets, osmolarities)[0].startswith("総投与量")
+    assert compare(reference, None, product_names, coefficients, targets, osmolarities)[0] == "高速経路のみ解なし"
+    # 配合量と合わない浸透圧の報告
+    wrong = mix.model_copy(update={'osmolarity': mix.osmolarity + 1.0})
+    assert compare(reference, wrong, product_names, coefficients, targets, osmolarities)[0].startswith("osmolarity")
+
+def test_compare_checks_line_rates_and_caps(feasible_case):
+    patient, base_solution_name, product_names, coefficients, osmolarities, _ = feasible_case
+    targets = compute_targets(patient)
+    constraints = random_constraints(random.Random(1))
+    assert constraints.lines[1].hours != 24.0
+    reference = reference_solve(product_names, coefficients, targets, constraints, osmolarities)
+    mix = calculate_from_composition(patient, base_solution_name, product_names, coefficients, lines=constraints.lines,
+                                     compatibility=constraints.compatibility, osmolarities=osmolarities)
+    assert compare(reference, mix, product_names, coefficients, targets, osmolarities, constraints)[0] is None
+    # 投与時間を24時間とした速度の報告
+    lines = [line.model_copy(update={'rate': line.total_volume / 24.0}) for line in mix.lines]
+    wrong = mix.model_copy(update={'lines': lines})
+    assert "速度" in compare(reference, wrong, product_names, coefficients, targets, osmolarities, constraints)[0]
+    # 上限を下げると同じ配合は上限違反になる
+    tighter = constraints._replace(compatibility=constraints.compatibility.model_copy(
+        update={'max_osmolarity': mix.osmolarity - 10.0}))
+    reason, _ = compare(reference, mix, product_names, coefficients, targets, osmolarities, tighter)
+    assert reason.startswith("osmolarity") and "上限" in reason
+
+def stats(p50: float) -> dict:
+    return {'count': 10, 'p50': p50}
+
+def test_find_slowdowns():
+    baseline = {'timings_ms': {'template': stats(3.0), 'atlas': stats(1.0)}}
+    summary = {'timings_ms': {'template': stats(6.0), 'atlas': stats(1.4)}}
+    assert [s['engine'] for s in find_slowdowns(summary, baseline, 1.5)] == ['template']
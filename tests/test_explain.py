@@ -0,0 +1,44 @@
+# tests/test_explain.py
+import pytest
+from calculation.infusion_calculator import calculate_infusion, compile_composition
+from calculation.explain import constraint_details, detailed_report_markdown
+from utils.data_loader import load_solutions
+
+def test_calculation_steps_generated_from_report(catalog, make_patient):
+    base_solution, additives = catalog
+    mix = calculate_infusion(make_patient(), base_solution, additives)
+    assert 'calculation_steps' not in mix.model_dump()
+    assert mix.report.solver == 'cbc'
+    assert set(mix.report.timings_ms) >= {'targets', 'model', 'solve', 'total'}
+    steps = mix.calculation_steps
+    assert steps.startswith("### 計算ステップ\n1. **目標栄養素の設定**\n")
+    assert f"   - Na: {mix.input_amounts['Na']:.2f} mEq/day\n" in steps
+    assert f"   - 総投与量: {sum(mix.detailed_mix.values()):.2f} mL/day\n" in steps
+
+def test_shadow_price_matches_finite_difference(catalog, make_patient):
+    base_solution, additives = catalog
+    product_names, coefficients = compile_composition(base_solution, additives)
+    mix = calculate_infusion(make_patient(), base_solution, additives)
+    details = {d.nutrient: d for d in constraint_details(mix, product_names, coefficients)}
+    assert set(details) == set(mix.report.active_nutrients)
+    for detail in details.values():
+        assert detail.slack >= -1e-6
+        assert (detail.binding is None) == (detail.shadow_price is None)
+
+    binding = [d for d in details.values() if d.binding == 'L' and d.nutrient == 'Na']
+    if binding:
+        delta = 0.01  # mEq/kg/day
+        perturbed = calculate_infusion(make_patient(na=3.0 + delta), base_solution, additives)
+        change = sum(perturbed.detailed_mix.values()) - sum(mix.detailed_mix.values())
+        expected = binding[0].shadow_price * mix.report.lower_ratio * delta * 1.8
+        assert change == pytest.approx(expected, rel=1e-3, abs=1e-6)
+
+def test_detailed_report_rejects_other_composition(catalog, make_patient):
+    base_solution, additives = catalog
+    mix = calculate_infusion(make_patient(), base_solution, additives)
+    product_names, coefficients = compile_composition(base_solution, additives)
+    markdown = detailed_report_markdown(mix, product_names, coefficients)
+    assert "4. **制約の状況**" in markdown and "5. **処理時間** (解法: cbc)" in markdown
+    other_names, other_coefficients = compile_composition(load_solutions()[1], additives)
+    with pytest.raises(ValueError):
+        detailed_report_markdown(mix, other_names, other_coefficients)
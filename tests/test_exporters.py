@@ -0,0 +1,69 @@
+# tests/test_exporters.py
+import csv
+import io
+import json
+import pytest
+from models.infusion_mix import InfusionMix
+from utils.exporters import (
+    MIX_COLUMNS, iter_batch_rows, iter_mix_rows, parquet_available,
+    write_csv, write_jsonl, write_parquet, write_worksheet,
+)
+
+def make_mix(volume: float) -> InfusionMix:
+    return InfusionMix(
+        gir=7.0,
+        detailed_mix={"ベース製剤（ソルデム3AG）": volume, "KCl": 1.2, "蒸留水": 0.0},
+        nutrient_totals={},
+        nutrient_units={},
+        input_amounts={},
+        input_units={},
+        catalog_version="abc123",
+    )
+
+def many_results(n: int):
+    for i in range(n):
+        yield f"case-{i}", make_mix(float(i))
+
+def test_write_csv_streams_batch_rows():
+    buffer = io.StringIO()
+    count = write_csv(iter_batch_rows(many_results(100)), buffer, MIX_COLUMNS)
+    assert count == 300
+    rows = list(csv.DictReader(io.StringIO(buffer.getvalue())))
+    assert rows[3]['label'] == 'case-1'
+    assert float(rows[3]['volume_ml_per_day']) == 1.0
+    assert float(rows[4]['rate_ml_per_hour']) == pytest.approx(0.05)
+
+def test_write_jsonl_one_object_per_line():
+    buffer = io.StringIO()
+    assert write_jsonl(iter_mix_rows(make_mix(24.0), "A001"), buffer) == 3
+    first = json.loads(buffer.getvalue().splitlines()[0])
+    assert first['product'] == "ベース製剤（ソルデム3AG）"
+    assert first['rate_ml_per_hour'] == 1.0
+    assert first['catalog_version'] == "abc123"
+
+def test_worksheet_skips_unused_products():
+    buffer = io.StringIO()
+    assert write_worksheet(many_results(2), buffer) == 2
+    text = buffer.getvalue()
+    assert text.count("調製指示書") == 2
+    assert "KCl" in text
+    assert "蒸留水" not in text
+
+@pytest.mark.skipif(not parquet_available(), reason="pyarrow not installed")
+def test_write_parquet_in_batches(tmp_path):
+    import pyarrow.parquet as pq
+    path = tmp_path / "sweep.parquet"
+    count = write_parquet(iter_batch_rows(many_results(50)), str(path), MIX_COLUMNS, batch_size=7)
+    assert count == 150
+    table = pq.read_table(path)
+    assert table.num_rows == 150
+    assert table.column_names == MIX_COLUMNS
+
+@pytest.mark.skipif(not parquet_available(), reason="pyarrow not installed")
+def test_write_parquet_column_empty_in_first_batch(tmp_path):
+    import pyarrow.parquet as pq
+    later = make_mix(1.0).model_copy(update={"amino_acid": 3.0})
+    results = [("a", make_mix(1.0)), ("b", later)]
+    path = tmp_path / "mixed.parquet"
+    write_parquet(iter_batch_rows(results), str(path), MIX_COLUMNS, batch_size=3)
+    assert pq.read_table(path).column('amino_acid').to_pylist()[-1] == 3.0
@@ -0,0 +1,77 @@
+# tests/test_infusion_lines.py
+import pytest
+from pydantic import ValidationError
+from models.infusion_line import LineSpec, TWO_LINES
+from calculation.infusion_calculator import calculate_infusion, compile_composition
+from calculation.explain import constraint_details
+from calculation.model_template import assign_lines
+from utils.exporters import iter_mix_rows
+
+def test_two_lines_without_limits_match_single_line(catalog, make_patient):
+    base_solution, additives = catalog
+    single = calculate_infusion(make_patient(fat=2.0), base_solution, additives)
+    joint = calculate_infusion(make_patient(fat=2.0), base_solution, additives, lines=TWO_LINES)
+    assert single.lines is None
+    assert sum(joint.detailed_mix.values()) == pytest.approx(sum(single.detailed_mix.values()), rel=1e-6)
+    main, lipid = joint.lines
+    assert all(additives[name].fat_concentration > 0 for name in lipid.volumes)
+    assert not any(name in additives and additives[name].fat_concentration > 0 for name in main.volumes)
+    assert main.total_volume + lipid.total_volume == pytest.approx(sum(joint.detailed_mix.values()))
+    assert lipid.rate == pytest.approx(lipid.total_volume / 24.0)
+
+def test_line_limits_are_enforced(catalog, make_patient):
+    base_solution, additives = catalog
+    lines = (
+        LineSpec(name='main', label='メイン', max_rate=20.0, max_concentration={'Glucose': 0.08}),
+        LineSpec(name='lipid', label='脂肪', lipid=True, hours=20.0, max_rate=2.0),
+    )
+    mix = calculate_infusion(make_patient(fat=2.0), base_solution, additives, lines=lines)
+    main, lipid = mix.lines
+    assert main.concentrations['Glucose'] <= 0.08 + 1e-7
+    assert main.rate <= 20.0 + 1e-7
+    assert lipid.rate <= 2.0 + 1e-7 and lipid.hours == 20.0
+    assert "脂肪: " in mix.calculation_steps
+
+def test_infeasible_line_limits(catalog, make_patient):
+    base_solution, additives = catalog
+    lines = (LineSpec(name='main', label='メイン'), LineSpec(name='lipid', label='脂肪', lipid=True, max_rate=0.1))
+    with pytest.raises(ValueError, match="投与ライン"):
+        calculate_infusion(make_patient(fat=2.0), base_solution, additives, lines=lines)
+
+def test_assign_lines_requires_one_main_line():
+    with pytest.raises(ValueError):
+        assign_lines([[0.0] * 10], [LineSpec(name='a', label='A', lipid=True)])
+
+def test_line_hours_must_be_positive():
+    with pytest.raises(ValidationError):
+        LineSpec(name='lipid', label='脂肪', lipid=True, hours=0.0)
+    with pytest.raises(ValidationError):
+        LineSpec(name='lipid', label='脂肪', lipid=True, hours=25.0)
+
+def test_export_rows_use_line_hours(catalog, make_patient):
+    base_solution, additives = catalog
+    lines = (LineSpec(name='main', label='メイン'), LineSpec(name='lipid', label='脂肪', lipid=True, hours=20.0))
+    mix = calculate_infusion(make_patient(fat=2.0), base_solution, additives, lines=lines)
+    rows = list(iter_mix_rows(mix))
+    assert len(rows) == len(mix.detailed_mix)
+    for row in rows:
+        hours = 20.0 if row['line'] == 'lipid' else 24.0
+        assert row['rate_ml_per_hour'] == pytest.approx(row['volume_ml_per_day'] / hours)
+    lipid_rate = sum(row['rate_ml_per_hour'] for row in rows if row['line'] == 'lipid')
+    assert lipid_rate == pytest.approx(mix.lines[1].rate)
+
+def test_binding_line_cap_shadow_price(catalog, make_patient):
+    base_solution, additives = catalog
+    product_names, coefficients = compile_composition(base_solution, additives)
+
+    def solve(glucose_cap):
+        lines = (LineSpec(name='main', label='メイン', max_concentration={'Glucose': glucose_cap}),
+                 LineSpec(name='lipid', label='脂肪', lipid=True))
+        return calculate_infusion(make_patient(fat=2.0), base_solution, additives, lines=lines)
+
+    mix = solve(0.08)
+    caps = [d for d in constraint_details(mix, product_names, coefficients) if d.kind == 'cap']
+    assert [d.binding for d in caps] == ['U']
+    delta = 1e-4
+    change = sum(solve(0.08 + delta).detailed_mix.values()) - sum(mix.detailed_mix.values())
+    assert change == pytest.approx(caps[0].shadow_price * delta, rel=1e-2)
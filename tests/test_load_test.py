@@ -0,0 +1,31 @@
+# tests/test_load_test.py
+from tools.load_test import current_rss_mb, distribution, format_summary, percentile, run_load_test
+
+def test_percentile_uses_nearest_rank():
+    values = [float(v) for v in range(1, 11)]
+    assert percentile(values, 50) == 5.0
+    assert percentile(values, 95) == 10.0
+    assert percentile(values, 0) == 1.0
+    assert percentile([], 50) == 0.0
+
+def test_distribution():
+    stats = distribution([3.0, 1.0, 2.0])
+    assert stats == {'count': 3, 'mean': 2.0, 'p50': 2.0, 'p95': 3.0, 'p99': 3.0, 'max': 3.0}
+    assert distribution([])['count'] == 0
+
+def test_current_rss_mb_tracks_allocation():
+    before = current_rss_mb()
+    block = bytearray(64 * 1024 * 1024)
+    assert current_rss_mb() - before > 32.0
+    del block
+
+def test_run_load_test_smoke(tmp_path, monkeypatch):
+    # 利用者プロセスは作業ディレクトリと環境変数を引き継ぐ（app.log と計算結果は一時ディレクトリへ）
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('TPN_RESULT_DB', str(tmp_path / 'results.db'))
+    summary = run_load_test(users=2, iterations=1, edits_per_calculation=1, timeout=60.0)
+    assert summary['errors'] == []
+    assert {kind: stats['count'] for kind, stats in summary['latency_ms'].items()} == {'load': 2, 'edit': 2, 'calculate': 2}
+    assert summary['requests'] == 6
+    assert summary['rss_start_mb'] > 0 and summary['rss_growth_per_user_mb']['count'] == 2
+    assert "RSS（利用者プロセスの合計）" in format_summary(summary)
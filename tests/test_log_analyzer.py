@@ -0,0 +1,63 @@
+# tests/test_log_analyzer.py
+import gzip
+import pytest
+from tools.log_analyzer import LatencyHistogram, analyze, expand_log_paths
+
+SAMPLE_LOG = """\
+2024-12-08 09:00:00,000 - INFO - アプリケーションの起動
+2024-12-08 09:00:01,000 - INFO - 計算開始
+2024-12-08 09:00:01,000 - DEBUG - 患者データ: weight=1.5 twi=110.0
+2024-12-08 09:00:01,050 - INFO - 計算完了
+2024-12-08 09:00:02,000 - INFO - 計算開始
+2024-12-08 09:00:02,010 - ERROR - 最適化問題が解けませんでした。入力値を見直してください。
+2024-12-08 09:00:02,010 - ERROR - ValueError: 最適化問題が解けませんでした。入力値を見直してください。
+2024-12-08 09:00:02,011 - ERROR - ValueError: 最適化問題が解けませんでした。入力値を見直してください。
+2024-12-08 09:00:03,000 - INFO - 計算開始
+2024-12-08 09:00:03,020 - ERROR - Amino Acids の供給量が目標と200%以上異なります。目標: 3.0, 実測: 10.0
+2024-12-08 09:00:03,020 - ERROR - ValueError: Amino Acids の供給量が目標と200%以上異なります。数値を見直してください。
+2024-12-08 09:00:04,000 - INFO - 計算開始
+2024-12-08 09:00:04,100 - WARNING - 一部の栄養素が10%を超えていますが、30%以内に収まっています。注意してご確認ください。
+2024-12-08 09:00:04,150 - INFO - 計算完了
+2024-12-08 09:00:05,000 - ERROR - ValidationError: 1 validation error for Patient
+weight
+  Input should be a valid number
+"""
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text(SAMPLE_LOG, encoding="utf-8")
+    return path
+
+def test_pairs_calculations_and_classifies_failures(log_file):
+    summary = analyze([str(log_file)]).summary()
+    assert summary['startups'] == 1
+    assert summary['calculations_started'] == 4
+    assert summary['calculations_finished'] == 2
+    assert summary['calculations_failed'] == 2
+    assert summary['infeasible'] == 1
+    assert summary['deviation_200_by_nutrient'] == {'Amino Acids': 1}
+    assert summary['validation_errors'] == 1
+    assert summary['latency_ms']['count'] == 2
+    assert summary['latency_ms']['max'] == pytest.approx(150.0)
+    assert summary['latency_ms']['min'] == pytest.approx(50.0)
+
+def test_rotated_archives_are_read_oldest_first(log_file, tmp_path):
+    with gzip.open(tmp_path / "app.log.2.gz", "wt", encoding="utf-8") as f:
+        f.write("2024-12-06 09:00:00,000 - INFO - アプリケーションの起動\n")
+    (tmp_path / "app.log.1").write_text("2024-12-07 09:00:00,000 - INFO - アプリケーションの起動\n", encoding="utf-8")
+
+    paths = expand_log_paths([str(log_file)])
+    assert [p.rsplit("/", 1)[-1] for p in paths] == ["app.log.2.gz", "app.log.1", "app.log"]
+    summary = analyze([str(log_file)]).summary()
+    assert summary['startups'] == 3
+    assert summary['first_timestamp'].startswith("2024-12-06")
+    assert analyze([str(log_file)], include_rotated=False).summary()['startups'] == 1
+
+def test_histogram_percentiles_are_within_bucket_error():
+    histogram = LatencyHistogram()
+    for value in range(1, 1001):
+        histogram.add(float(value))
+    assert histogram.percentile(50) == pytest.approx(500, rel=0.05)
+    assert histogram.percentile(99) == pytest.approx(990, rel=0.05)
+    assert histogram.summary()['max'] == 1000.0
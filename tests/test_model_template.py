@@ -0,0 +1,70 @@
+# tests/test_model_template.py
+import threading
+import pulp
+import pytest
+from models.patient import Patient
+from calculation.infusion_calculator import calculate_infusion, compile_composition
+from calculation.model_template import get_model_template, clear_model_templates, _templates
+
+@pytest.fixture(autouse=True)
+def fresh_templates():
+    clear_model_templates()
+
+def test_template_is_reused_for_same_key(catalog):
+    base_solution, additives = catalog
+    names, coefficients = compile_composition(base_solution, additives)
+    first = get_model_template(names, coefficients, ['Glucose', 'Na'], key=('v1', base_solution.name))
+    second = get_model_template(names, coefficients, ['Glucose', 'Na'], key=('v1', base_solution.name))
+    other = get_model_template(names, coefficients, ['Glucose', 'K'], key=('v1', base_solution.name))
+    assert first is second
+    assert other is not first
+
+def test_clear_templates_by_catalog_version(catalog):
+    base_solution, additives = catalog
+    names, coefficients = compile_composition(base_solution, additives)
+    get_model_template(names, coefficients, ['Glucose'], key=('v1', base_solution.name))
+    kept = get_model_template(names, coefficients, ['Glucose'], key=('v2', base_solution.name))
+    clear_model_templates('v1')
+    assert list(_templates.values()) == [kept]
+
+def test_reused_template_updates_bounds(catalog):
+    base_solution, additives = catalog
+    results = []
+    for gir in [5.0, 8.0, 5.0]:
+        patient = Patient(weight=1.5, twi=110, gir=gir, gir_included=True, k=1.5, k_included=True)
+        results.append(calculate_infusion(patient, base_solution, additives, catalog_version='v1'))
+    assert len(_templates) == 1
+    glucose = [mix.nutrient_totals['Glucose'] for mix in results]
+    assert glucose[1] > glucose[0]
+    assert glucose[2] == pytest.approx(glucose[0])
+    for mix, gir in zip(results, [5.0, 8.0, 5.0]):
+        target = gir * 1.5 * 1440 / 1000.0
+        assert 0.9 * target - 1e-6 <= mix.nutrient_totals['Glucose'] <= 1.1 * target + 1e-6
+
+def test_infeasible_targets_raise_value_error(catalog):
+    base_solution, _ = catalog
+    patient = Patient(weight=1.5, twi=110, fat=3.0, fat_included=True)
+    with pytest.raises(ValueError):
+        calculate_infusion(patient, base_solution, {})
+
+def test_concurrent_solves_do_not_wait_for_each_other(catalog, monkeypatch):
+    base_solution, additives = catalog
+    names, coefficients = compile_composition(base_solution, additives)
+    template = get_model_template(names, coefficients, ['Glucose'], key=('v1', base_solution.name))
+    # 2つの solve() が同時にCBCを実行していなければ、Barrierはタイムアウトする
+    barrier = threading.Barrier(2, timeout=10.0)
+    solve = pulp.LpProblem.solve
+
+    def solve_together(problem, *args, **kwargs):
+        barrier.wait()
+        return solve(problem, *args, **kwargs)
+
+    monkeypatch.setattr(pulp.LpProblem, 'solve', solve_together)
+    results = []
+    threads = [threading.Thread(target=lambda g=g: results.append(template.solve({'Glucose': g}))) for g in [5.0, 10.0]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    totals = sorted(sum(result.values()) for result in results)
+    assert len(totals) == 2 and totals[0] < totals[1]
@@ -0,0 +1,47 @@
+# tests/test_patient_validation.py
+import pandas as pd
+from models.patient import Patient
+from utils.patient_validation import validate_patient_rows
+
+def test_valid_rows_become_patients():
+    result = validate_patient_rows([
+        {'weight': 1.2, 'twi': 120, 'gir': 6.0, 'na': 3.0},
+        {'weight': "2.5", 'twi': 150, 'k': 2.0},
+    ])
+    assert result.ok
+    assert result.rows == [0, 1]
+    first, second = result.patients
+    assert isinstance(first, Patient)
+    assert first.gir_included and first.na_included and not first.k_included
+    assert first.k is None
+    assert second.weight == 2.5 and second.k_included
+
+def test_all_row_errors_reported_in_one_pass():
+    frame = pd.DataFrame({
+        'weight': [1.0, None, 200.0, 1.5],
+        'twi': [100, 100, 100, "abc"],
+        'gir': [12.0, 6.0, 6.0, 6.0],
+    })
+    result = validate_patient_rows(frame)
+    assert not result.ok
+    assert result.patients == []
+    assert [(e.row, e.field) for e in result.errors] == [
+        (0, 'gir'), (1, 'weight'), (2, 'weight'), (3, 'twi'),
+    ]
+    assert result.errors[3].value == "abc"
+
+def test_explicit_included_column_controls_checks():
+    frame = pd.DataFrame({
+        'weight': [1.0, 1.0],
+        'twi': [100, 100],
+        'gir': [20.0, None],
+        'gir_included': [False, True],
+    })
+    result = validate_patient_rows(frame)
+    assert result.rows == [0]
+    assert not result.patients[0].gir_included and result.patients[0].gir is None
+    assert [(e.row, e.field) for e in result.errors] == [(1, 'gir')]
+
+def test_missing_required_column():
+    result = validate_patient_rows([{'weight': 1.0}])
+    assert [(e.row, e.field) for e in result.errors] == [(0, 'twi')]
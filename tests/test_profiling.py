@@ -0,0 +1,67 @@
+# tests/test_profiling.py
+import marshal
+from utils.profiling import maybe_profile, profile_section, profiling_enabled
+
+def build_lists():
+    return [list(range(100)) for _ in range(200)]
+
+def test_profile_section_records_hotspots_and_allocations():
+    with profile_section("build", top_n=5) as profile:
+        data = build_lists()
+    report = profile.report
+    assert len(data) == 200
+    assert report.label == "build"
+    assert 0 < len(report.hotspots) <= 5
+    assert any("build_lists" in h.function for h in report.hotspots)
+    assert report.allocations
+    assert isinstance(marshal.loads(report.prof_data), dict)
+    assert "build_lists" in report.summary_text()
+
+def test_maybe_profile_disabled_is_noop():
+    with maybe_profile(False, "noop") as profile:
+        build_lists()
+    assert profile is None
+
+def test_profiling_enabled_by_env(monkeypatch):
+    monkeypatch.delenv("TPN_PROFILE", raising=False)
+    assert not profiling_enabled()
+    monkeypatch.setenv("TPN_PROFILE", "1")
+    assert profiling_enabled()
+
+def test_overlapping_sections_in_threads():
+    import threading
+    import tracemalloc
+    errors, reports = [], []
+    entered = threading.Event()
+
+    def slow_section():
+        try:
+            with profile_section("slow") as profile:
+                entered.set()
+                build_lists()
+            reports.append(profile.report)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=slow_section)
+    thread.start()
+    entered.wait()
+    with profile_section("fast") as profile:
+        build_lists()
+    thread.join()
+    assert errors == []
+    assert reports[0] is not None and profile.report is not None
+    assert not tracemalloc.is_tracing()
+
+def test_profiling_failure_does_not_fail_block(monkeypatch):
+    import tracemalloc
+
+    def broken_snapshot():
+        raise RuntimeError("the tracemalloc module must be tracing memory allocations to take a snapshot")
+
+    monkeypatch.setattr(tracemalloc, "take_snapshot", broken_snapshot)
+    with profile_section("broken") as profile:
+        data = build_lists()
+    assert len(data) == 200
+    assert profile.report is None
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,55 @@
+# tests/test_recipe_atlas.py
+import pytest
+from models.patient import Patient
+from calculation.infusion_calculator import calculate_infusion
+from calculation.recipe_atlas import DEFAULT_GRID, RecipeAtlas, grid_point
+from tools.build_atlas import build_atlas
+from utils.data_loader import get_catalog
+
+SMALL_GRID = {
+    'gir': [0.0, 5.0, 7.0],
+    'amino_acid': [0.0, 2.0, 3.0],
+    'na': [0.0, 3.0],
+    'k': [0.0, 2.0],
+    'cl': [0.0, 2.0],
+    'fat': [0.0, 1.0, 3.0],
+}
+
+@pytest.fixture(scope="module")
+def atlas_and_catalog(tmp_path_factory):
+    catalog = get_catalog()
+    atlas = RecipeAtlas(str(tmp_path_factory.mktemp("atlas") / "atlas.db"))
+    summary = build_atlas(atlas, catalog, SMALL_GRID, base_solution_names=[catalog.solutions[0].name])
+    assert summary['base_solutions'][catalog.solutions[0].name]['stored'] > 0
+    return atlas, catalog
+
+def make_patient(**values) -> Patient:
+    return Patient(weight=values.pop('weight', 2.3), twi=120, **values, **{f"{k}_included": True for k in values})
+
+def test_grid_point_snaps_to_nearest_and_zero_for_excluded():
+    patient = Patient(weight=1.0, twi=100, gir=6.6, gir_included=True, na=2.4, na_included=True, k=3.0, k_included=False)
+    assert grid_point(patient, DEFAULT_GRID) == (7.0, 0.0, 2.0, 0.0, 0.0, 0.0)
+
+def test_atlas_hit_matches_full_solve(atlas_and_catalog):
+    atlas, catalog = atlas_and_catalog
+    base_solution = catalog.solutions[0]
+    patient = make_patient(gir=6.2, amino_acid=2.7, na=3.2, k=1.8, fat=1.2)
+    hits = atlas.hits
+    fast = calculate_infusion(patient, base_solution, catalog.additives, catalog_version=catalog.version, atlas=atlas)
+    assert atlas.hits == hits + 1
+    reference = calculate_infusion(patient, base_solution, catalog.additives, catalog_version=catalog.version)
+    assert sum(fast.detailed_mix.values()) == pytest.approx(sum(reference.detailed_mix.values()), rel=1e-7)
+    for nutrient, target in fast.input_amounts.items():
+        if target > 0:
+            assert 0.9 * target - 1e-6 <= fast.nutrient_totals[nutrient] <= 1.1 * target + 1e-6
+
+def test_atlas_misses_fall_back_to_solver(atlas_and_catalog):
+    atlas, catalog = atlas_and_catalog
+    misses = atlas.misses
+    # Caは格子に無く、2つ目のベース製剤は配合表に無い
+    patient = make_patient(gir=6.0, na=3.0, ca=1.0)
+    calculate_infusion(patient, catalog.solutions[0], catalog.additives, catalog_version=catalog.version, atlas=atlas)
+    patient = make_patient(na=3.0, k=2.0)
+    mix = calculate_infusion(patient, catalog.solutions[1], catalog.additives, catalog_version=catalog.version, atlas=atlas)
+    assert atlas.misses == misses + 2
+    assert sum(mix.detailed_mix.values()) > 0
@@ -0,0 +1,65 @@
+# tests/test_regimen_planner.py
+import pytest
+from pydantic import ValidationError
+from models.patient import Patient
+from models.regimen_plan import AdvancementRule
+from calculation.infusion_calculator import calculate_infusion
+from calculation.regimen_planner import plan_regimen, patient_for_day
+
+def test_advancement_rule_is_capped_at_limit():
+    rule = AdvancementRule(field='gir', start=5.0, step=1.0, limit=7.0)
+    assert [rule.value_on(d) for d in range(4)] == [5.0, 6.0, 7.0, 7.0]
+
+def test_phosphorus_cannot_be_scheduled():
+    # Pの目標は最適化で使わないため、スケジュールを受け付けると黙って無視される
+    with pytest.raises(ValidationError):
+        AdvancementRule(field='p', start=1.0, step=0.5)
+
+def test_patient_for_day_enables_scheduled_nutrients():
+    patient = Patient(weight=1.5, twi=80)
+    rules = [AdvancementRule(field='amino_acid', start=1.0, step=0.5, limit=3.0),
+             AdvancementRule(field='twi', start=80.0, step=20.0, limit=150.0)]
+    day2 = patient_for_day(patient, rules, 2, 1.6)
+    assert day2.weight == 1.6
+    assert day2.amino_acid == 2.0
+    assert day2.amino_acid_included
+    assert day2.twi == 120.0
+
+def test_plan_regimen_returns_one_recipe_per_day(catalog):
+    base_solution, additives = catalog
+    patient = Patient(weight=1.5, twi=110, na=2.5, na_included=True, k=1.5, k_included=True)
+    rules = [AdvancementRule(field='gir', start=5.0, step=1.0, limit=8.0),
+             AdvancementRule(field='amino_acid', start=1.0, step=0.5, limit=3.0),
+             AdvancementRule(field='fat', start=0.5, step=0.5, limit=3.0)]
+    weights = [1.50, 1.48, 1.47, 1.49, 1.52]
+
+    plan = plan_regimen(patient, base_solution, additives, rules, weights)
+
+    assert [d.day for d in plan.days] == list(range(5))
+    for recipe, weight in zip(plan.days, weights):
+        mix = recipe.infusion_mix
+        expected_glucose = mix.gir * weight * 1440 / 1000.0
+        assert 0.9 * expected_glucose - 1e-6 <= mix.nutrient_totals['Glucose'] <= 1.1 * expected_glucose + 1e-6
+    assert plan.days[-1].infusion_mix.gir == 8.0
+
+    table = plan.to_dataframe()
+    assert len(table) == sum(len(d.infusion_mix.detailed_mix) for d in plan.days)
+    assert set(table['day']) == {1, 2, 3, 4, 5}
+
+def test_plan_regimen_reuses_previous_basis(catalog):
+    base_solution, additives = catalog
+    patient = Patient(weight=1.5, twi=110, gir=6.0, gir_included=True, amino_acid=2.0, amino_acid_included=True,
+                      na=2.5, na_included=True, k=1.5, k_included=True)
+    # 体重だけが変わる日は目標が定数倍になるだけで、前日の最適基底がそのまま最適
+    weights = [1.50, 1.48, 1.47, 1.49, 1.52]
+    plan = plan_regimen(patient, base_solution, additives, [], weights)
+    assert plan.days[0].infusion_mix.report.solver == 'cbc'
+    assert [d.infusion_mix.report.solver for d in plan.days[1:]] == ['warm_start'] * 4
+    for recipe in plan.days[1:]:
+        expected = calculate_infusion(recipe.patient, base_solution, additives)
+        assert recipe.infusion_mix.report.total_volume == pytest.approx(expected.report.total_volume)
+
+def test_plan_regimen_requires_weights(catalog):
+    base_solution, additives = catalog
+    with pytest.raises(ValueError):
+        plan_regimen(Patient(weight=1.5, twi=110), base_solution, additives, [], [])
@@ -0,0 +1,88 @@
+# tests/test_result_store.py
+import sqlite3
+import pytest
+from datetime import date
+from models.patient import Patient
+from models.infusion_mix import InfusionMix
+from utils.result_store import ResultStore, ResultStoreError
+
+def make_mix(volume: float) -> InfusionMix:
+    return InfusionMix(
+        gir=7.0,
+        detailed_mix={"KCl": volume},
+        nutrient_totals={"K": volume},
+        nutrient_units={"K": "mEq/day"},
+        input_amounts={"K": volume},
+        input_units={"K": "mEq/day"},
+    )
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"))
+    yield store
+    store.close()
+
+def test_record_and_find_by_patient_and_date(store):
+    patient = Patient(weight=1.5, twi=110, gir=7.0, gir_included=True)
+    store.record("A001", date(2024, 12, 7), patient, "ソルデム3AG", make_mix(1.0), 12.5, catalog_version="v1")
+    store.record("A001", date(2024, 12, 8), patient, "ソルデム3AG", make_mix(2.0), 10.0)
+    store.record("B002", date(2024, 12, 8), patient, "ソリタックス", make_mix(3.0), 8.0)
+    store.flush()
+
+    records = store.find("A001")
+    assert [r.order_date for r in records] == [date(2024, 12, 8), date(2024, 12, 7)]
+    assert records[1].catalog_version == "v1"
+    assert records[1].patient == patient
+
+    on_date = store.find("A001", order_date=date(2024, 12, 7))
+    assert len(on_date) == 1
+    assert on_date[0].infusion_mix.detailed_mix == {"KCl": 1.0}
+
+def test_latest_before_date(store):
+    patient = Patient(weight=1.5, twi=110)
+    for day, volume in [(6, 1.0), (7, 2.0), (8, 3.0)]:
+        store.record("A001", date(2024, 12, day), patient, "ソルデム3AG", make_mix(volume), 1.0)
+    store.flush()
+
+    assert store.latest("A001").infusion_mix.detailed_mix["KCl"] == 3.0
+    assert store.latest("A001", before=date(2024, 12, 8)).order_date == date(2024, 12, 7)
+    assert store.latest("Z999") is None
+
+def test_iter_records_by_date_range(store):
+    patient = Patient(weight=1.5, twi=110)
+    for day in range(1, 6):
+        store.record(f"P{day}", date(2024, 12, day), patient, "ソルデム3AG", make_mix(float(day)), 1.0)
+    store.flush()
+
+    records = list(store.iter_records(date(2024, 12, 2), date(2024, 12, 4)))
+    assert [r.patient_id for r in records] == ["P2", "P3", "P4"]
+
+def test_write_failure_is_reported_by_flush(store):
+    patient = Patient(weight=1.5, twi=110)
+    # base_solution_name は NOT NULL のため、この1件だけ書き込みに失敗する
+    store.record("A001", date(2024, 12, 7), patient, None, make_mix(1.0), 1.0)
+    with pytest.raises(ResultStoreError, match="1件"):
+        store.flush(timeout=5.0)
+    store.record("A001", date(2024, 12, 8), patient, "ソルデム3AG", make_mix(2.0), 1.0)
+    store.flush(timeout=5.0)
+    assert [r.order_date for r in store.find("A001")] == [date(2024, 12, 8)]
+
+def test_writer_connection_failure_stops_store(tmp_path, monkeypatch):
+    connect = ResultStore._connect
+    calls = []
+
+    def failing_connect(self):
+        # 初期化時の接続（スキーマの作成）は成功させ、書き込みスレッドの接続だけ失敗させる
+        calls.append(1)
+        if len(calls) > 1:
+            raise sqlite3.OperationalError("unable to open database file")
+        return connect(self)
+
+    monkeypatch.setattr(ResultStore, '_connect', failing_connect)
+    store = ResultStore(str(tmp_path / "results.db"))
+    store._writer.join(timeout=5.0)
+    with pytest.raises(ResultStoreError, match="unable to open"):
+        store.record("A001", date(2024, 12, 7), Patient(weight=1.5, twi=110), "ソルデム3AG", make_mix(1.0), 1.0)
+    with pytest.raises(ResultStoreError):
+        store.flush(timeout=5.0)
+    store.close()
@@ -0,0 +1,82 @@
+# tests/test_shared_catalog.py
+import numpy as np
+import pytest
+from models.patient import Patient
+from models.compatibility import CompatibilityLimits
+from calculation.infusion_calculator import calculate_infusion, compile_composition, compile_osmolarity
+from calculation.parallel import ParallelCalculator
+from calculation.shared_catalog import SharedCatalog, attach_shared_catalog
+from utils.data_loader import get_catalog
+
+def test_attached_view_matches_compiled_composition():
+    catalog = get_catalog()
+    with SharedCatalog(catalog) as shared:
+        view = attach_shared_catalog(shared.handle)
+        for solution in catalog.solutions:
+            names, coefficients = compile_composition(solution, catalog.additives)
+            shared_names, shared_coefficients = view.composition(solution.name)
+            assert list(shared_names) == names
+            assert np.array_equal(shared_coefficients, np.array(coefficients))
+            assert view.osmolarities(solution.name).tolist() == compile_osmolarity(solution, catalog.additives, coefficients)
+        with pytest.raises(ValueError):
+            view.matrix[0, 0, 0] = 1.0
+        view.close()
+
+def test_parallel_calculator_matches_calculate_infusion():
+    catalog = get_catalog()
+    base_solution = catalog.solutions[0]
+    patients = [
+        Patient(weight=w, twi=120, gir=6.0, gir_included=True, na=3.0, na_included=True, k=2.0, k_included=True)
+        for w in [0.8, 1.5, 2.7]
+    ]
+    # 実現できない目標（Zn 100 mmol/kg/day）
+    patients.append(Patient(weight=1.0, twi=120, zn=100.0, zn_included=True))
+    with ParallelCalculator(catalog, jobs=2) as calculator:
+        results = list(calculator.map((patient, base_solution.name) for patient in patients))
+
+    assert [result.index for result in results] == [0, 1, 2, 3]
+    for patient, result in zip(patients[:3], results):
+        expected = calculate_infusion(patient, base_solution, catalog.additives, catalog_version=catalog.version)
+        assert result.error is None
+        assert result.infusion_mix.catalog_version == catalog.version
+        assert sum(result.infusion_mix.detailed_mix.values()) == pytest.approx(sum(expected.detailed_mix.values()))
+    assert results[3].infusion_mix is None and results[3].error
+
+def test_parallel_calculator_uses_catalog_osmolarity_and_limits(make_patient):
+    catalog = get_catalog()
+    patient = make_patient(ca=2.0)
+    limits = CompatibilityLimits(max_osmolarity=600.0, max_ca_p_sum=30.0)
+    names = [solution.name for solution in catalog.solutions[:4]]
+    with ParallelCalculator(catalog, jobs=2) as calculator:
+        free = list(calculator.map((patient, name) for name in names))
+    with ParallelCalculator(catalog, jobs=2, compatibility=limits) as calculator:
+        capped = list(calculator.map((patient, name) for name in names))
+    for name, free_result, capped_result in zip(names, free, capped):
+        base_solution = catalog.solution_by_name(name)
+        if free_result.infusion_mix is None:
+            continue
+        expected = calculate_infusion(patient, base_solution, catalog.additives, catalog_version=catalog.version)
+        assert free_result.infusion_mix.osmolarity == pytest.approx(expected.osmolarity)
+        expected = calculate_infusion(patient, base_solution, catalog.additives, catalog_version=catalog.version,
+                                      compatibility=limits)
+        assert capped_result.infusion_mix.osmolarity == pytest.approx(expected.osmolarity)
+        assert capped_result.infusion_mix.osmolarity <= 600.0 + 1e-4
+
+def test_parallel_calculator_reads_tasks_in_bounded_windows(make_patient):
+    catalog = get_catalog()
+    name = catalog.solutions[0].name
+    read = []
+
+    def endless_tasks():
+        while True:
+            read.append(name)
+            yield make_patient(), name
+
+    with ParallelCalculator(catalog, jobs=2) as calculator:
+        results = calculator.map(endless_tasks(), chunksize=2, max_pending=3)
+        first = [next(results) for _ in range(5)]
+        results.close()
+    assert [result.index for result in first] == list(range(5))
+    assert all(result.error is None for result in first)
+    # 返した3チャンクと、未完了として投入した最大3チャンク分しか読まない
+    assert len(read) <= 2 * (3 + 3)
@@ -0,0 +1,119 @@
+# tools/build_atlas.py
+"""
+配合表（calculation/recipe_atlas.py）の事前計算。
+
+ベース製剤毎に (GIR, アミノ酸, Na, K, Cl, 脂肪) の格子点で最適化を解き、最適基底を
+SQLiteに保存する。カタログが更新された場合は再実行する（カタログバージョン毎に保存）。
+最適基底が一意に定まらない（退化した）格子点は保存せず、計算時は通常の最適化になる。
+
+    python -m tools.build_atlas --jobs 4
+"""
+
+import argparse
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from models.patient import Patient
+from calculation.infusion_calculator import compile_composition, compute_targets
+from calculation.model_template import NUTRIENTS, get_model_template
+from calculation.recipe_atlas import (
+    ATLAS_FIELDS, DEFAULT_ATLAS_PATH, DEFAULT_GRID, RecipeAtlas, extract_basis, solve_basis,
+)
+from calculation.shared_catalog import SharedCatalog, SharedCatalogHandle, SharedCatalogView, attach_shared_catalog
+from utils.data_loader import CatalogVersion, get_catalog
+
+def build_points(catalog_version: str, base_solution_name: str, product_names: Sequence[str],
+                 coefficients: Sequence[Sequence[float]], grid: Dict[str, List[float]]) -> Dict:
+    """
+    1つのベース製剤の全格子点を解き、保存する格子点と件数を返す。
+    """
+    template_key = (catalog_version, base_solution_name, tuple(product_names[1:]))
+    points = []
+    infeasible = degenerate = 0
+    for point in itertools.product(*(grid[field] for field in ATLAS_FIELDS)):
+        values = dict(zip(ATLAS_FIELDS, point))
+        # 基底は体重によらないため1kgで解く
+        patient = Patient(weight=1.0, twi=100.0, **values, **{f"{field}_included": value > 0 for field, value in values.items()})
+        targets = compute_targets(patient)
+        active_nutrients = [n for n in NUTRIENTS if targets[n] > 0]
+        template = get_model_template(product_names, coefficients, active_nutrients, key=template_key)
+        try:
+            solution = template.solve(targets)
+        except ValueError:
+            infeasible += 1
+            continue
+        volumes = [solution[name] for name in product_names]
+        basis = extract_basis(coefficients, targets, active_nutrients, volumes)
+        if solve_basis(coefficients, targets, active_nutrients, basis) is None:
+            degenerate += 1
+            continue
+        points.append((point, basis, sum(volumes)))
+    return {
+        'base_solution_name': base_solution_name,
+        'product_names': product_names,
+        'points': points,
+        'infeasible': infeasible,
+        'degenerate': degenerate,
+    }
+
+_worker_catalog: Optional[SharedCatalogView] = None
+
+def _init_worker(handle: SharedCatalogHandle):
+    global _worker_catalog
+    _worker_catalog = attach_shared_catalog(handle)
+
+def _build_points_worker(args):
+    base_solution_name, grid = args
+    product_names, coefficients = _worker_catalog.composition(base_solution_name)
+    return build_points(_worker_catalog.catalog_version, base_solution_name, product_names, coefficients, grid)
+
+def build_atlas(atlas: RecipeAtlas, catalog: CatalogVersion, grid: Dict[str, List[float]] = DEFAULT_GRID,
+                base_solution_names: Optional[List[str]] = None, jobs: int = 1) -> Dict:
+    """
+    配合表を作成し、ベース製剤毎の件数を返す。
+    jobs>1ではベース製剤毎にプロセスを分けて解く。ワーカーは共有メモリの組成を参照する。
+    """
+    names = base_solution_names or [sol.name for sol in catalog.solutions]
+    start = time.perf_counter()
+    if jobs > 1:
+        with SharedCatalog(catalog) as shared, \
+                ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(shared.handle,)) as pool:
+            results = list(pool.map(_build_points_worker, [(name, grid) for name in names]))
+    else:
+        results = []
+        for name in names:
+            product_names, coefficients = compile_composition(catalog.solution_by_name(name), catalog.additives)
+            results.append(build_points(catalog.version, name, product_names, coefficients, grid))
+
+    summary = {'catalog_version': catalog.version, 'base_solutions': {}}
+    for result in results:
+        atlas.store(catalog.version, result['base_solution_name'], result['product_names'], grid, result['points'])
+        summary['base_solutions'][result['base_solution_name']] = {
+            'stored': len(result['points']),
+            'infeasible': result['infeasible'],
+            'degenerate': result['degenerate'],
+        }
+    summary['elapsed_seconds'] = time.perf_counter() - start
+    return summary
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="配合表（最適基底の事前計算）の作成")
+    parser.add_argument('--db', default=DEFAULT_ATLAS_PATH, help="配合表のパス（既定: data/recipe_atlas.db）")
+    parser.add_argument('--base', action='append', help="対象のベース製剤名（複数指定可。省略時は全て）")
+    parser.add_argument('--jobs', type=int, default=1, help="並列プロセス数")
+    args = parser.parse_args(argv)
+
+    catalog = get_catalog()
+    if catalog is None:
+        print("カタログを読み込めませんでした。", file=sys.stderr)
+        return 1
+    summary = build_atlas(RecipeAtlas(args.db), catalog, base_solution_names=args.base, jobs=args.jobs)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
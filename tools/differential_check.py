@@ -0,0 +1,559 @@
+# tools/differential_check.py
+"""
+最適化の高速化経路が基準のLPと同じ配合を返すかを確認する差分試験。
+
+乱数で生成した患者と、製剤の含量を揺らしたカタログの組み合わせについて、次の経路で配合を計算する。
+
+- reference: 毎回新しく構築した PuLP/CBC のモデル（ModelTemplate を使わず、元の実装と同じ定式化を独立に書いたもの）
+- template: calculate_from_composition()（キャッシュしたモデルの右辺を更新して解く）
+- warm_start: 同じベース製剤の直前の症例の最適基底（report.basis）を渡す。基底で最適性を検証できなければ通常の最適化
+- atlas: 一時ファイルに作成した配合表（最適基底の事前計算）。該当しない場合は通常の最適化
+- two_lines: メインバッグと脂肪乳剤シリンジの2ライン（上限なし）
+- capped: 2ラインにメインバッグのGlucose濃度の上限、脂肪乳剤の投与時間、浸透圧・Ca+Pの上限を加えた条件
+- parallel / parallel_capped: 共有メモリのカタログを参照するプロセスプール（ParallelCalculator）。上限なし / capped と同じ条件
+
+capped の条件はカタログ毎に乱数で決め、同じ条件で構築した基準（reference_capped）と比較する。
+総投与量（目的関数値）が基準と一致し、各栄養素の供給量が目標の90%〜110%に収まることに加え、
+結果の浸透圧・Ca+P・ライン毎の投与量と速度を配合量から計算し直して一致を確認し、上限を満たすことを検証する。
+LPの最適解は一意とは限らないため、製剤毎の配合量の差は件数のみ集計し、--strict の場合に不一致として扱う。
+解なしの症例は比較の意味が薄いため、患者は基準で解が得られるものを優先して引き直す（解なしの件数は別に集計する）。
+--baseline に前回の --json 出力を渡すと、経路毎の所要時間の中央値の悪化も検出する。
+
+    python -m tools.differential_check --cases 2000 --catalogs 3 --jobs 4
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import pulp
+
+from models.patient import Patient, PATIENT_INPUT_LIMITS
+from models.additive import Additive
+from models.compatibility import CompatibilityLimits
+from models.infusion_line import TWO_LINES, LineSpec
+from models.infusion_mix import InfusionMix
+from calculation.infusion_calculator import (
+    calculate_from_composition, compile_composition, compile_osmolarity, compute_targets,
+)
+from calculation.model_template import LOWER_RATIO, UPPER_RATIO, NUTRIENTS, clear_model_templates, compute_nutrient_totals
+from calculation.parallel import ParallelCalculator
+from calculation.recipe_atlas import Basis, RecipeAtlas
+from tools.build_atlas import build_atlas
+from tools.load_test import distribution
+from utils.data_loader import CatalogVersion, get_catalog
+
+ENGINES = ['reference', 'reference_capped', 'template', 'warm_start', 'atlas', 'two_lines', 'capped',
+           'parallel', 'parallel_capped']
+REFERENCES = ('reference', 'reference_capped')
+PARALLEL_ENGINES = ('parallel', 'parallel_capped')
+CAPPED_ENGINES = ('capped', 'parallel_capped')
+
+# 配合表は乱数の患者の範囲を粗く覆う格子で作る（作成時間を抑えるため）
+DIFF_GRID = {
+    'gir': [0.0, 5.0, 8.0],
+    'amino_acid': [0.0, 2.0, 4.0],
+    'na': [0.0, 3.0],
+    'k': [0.0, 2.0],
+    'cl': [0.0, 3.0],
+    'fat': [0.0, 2.0, 4.0],
+}
+
+# 栄養素毎の計算対象にする確率。Ca, Mg, P を含む症例は配合表の対象外
+# Znはカタログに含む製剤が無く常に解なしになるため、計算対象にしない
+INCLUDE_PROBABILITY = {
+    'gir': 0.9, 'amino_acid': 0.8, 'na': 0.7, 'k': 0.7, 'fat': 0.6,
+    'cl': 0.3, 'ca': 0.25, 'p': 0.2, 'mg': 0.15,
+}
+PATIENT_RANGES = {**PATIENT_INPUT_LIMITS, 'p': (0.0, 2.0)}
+
+# 基準で解なしになった患者を引き直す確率と、1症例あたりの引き直しの上限
+REDRAW_PROBABILITY = 0.9
+MAX_DRAWS = 10
+
+# capped の条件の範囲
+GLUCOSE_CONCENTRATION_RANGE = (0.08, 0.2)  # メインバッグのGlucose濃度の上限 (g/mL)
+LIPID_HOURS = [12.0, 16.0, 20.0, 24.0]  # 脂肪乳剤シリンジの投与時間
+OSMOLARITY_RANGE = (600.0, 1200.0)  # mOsm/L
+CA_P_SUM_RANGE = (20.0, 60.0)  # Ca (mEq/L) + P (mmol/L)
+
+SOLUTION_FIELDS = ['glucose_percentage', 'na', 'k', 'cl', 'p', 'mg', 'ca', 'zn', 'fat_concentration']
+ADDITIVE_FIELDS = [field for field in Additive.model_fields if field.endswith('_concentration')]
+SCALE_RANGE = (0.8, 1.25)  # 揺らしたカタログの含量の倍率
+DROP_PROBABILITY = 0.15  # 揺らしたカタログで添加剤を除く確率
+
+MAX_EXAMPLES = 20  # 出力する不一致の例の上限
+SLOWDOWN_FLOOR_MS = 0.5  # これ未満の悪化は計測誤差とみなす
+
+class Constraints(NamedTuple):
+    """
+    経路に渡す投与ラインと配合変化の上限（上限なしの経路は lines=(), compatibility=None）。
+    """
+    lines: Tuple[LineSpec, ...] = ()
+    compatibility: Optional[CompatibilityLimits] = None
+
+def random_patient(rng: random.Random) -> Patient:
+    """
+    入力画面の範囲内で乱数の患者を作る（値は入力と同じく小数第2位まで）。
+    """
+    values = {field: round(rng.uniform(*PATIENT_RANGES[field]), 2) for field in ['weight', 'twi']}
+    for field, probability in INCLUDE_PROBABILITY.items():
+        if rng.random() < probability:
+            values[field] = round(rng.uniform(*PATIENT_RANGES[field]), 2)
+            values[f"{field}_included"] = True
+    return Patient(**values)
+
+def random_constraints(rng: random.Random) -> Constraints:
+    """
+    capped の条件（メインバッグのGlucose濃度の上限、脂肪乳剤の投与時間、浸透圧・Ca+Pの上限）を乱数で作る。
+    """
+    return Constraints(
+        lines=(
+            LineSpec(name='main', label='メインバッグ',
+                     max_concentration={'Glucose': round(rng.uniform(*GLUCOSE_CONCENTRATION_RANGE), 3)}),
+            LineSpec(name='lipid', label='脂肪乳剤シリンジ', lipid=True, hours=rng.choice(LIPID_HOURS)),
+        ),
+        compatibility=CompatibilityLimits(
+            max_osmolarity=round(rng.uniform(*OSMOLARITY_RANGE)),
+            max_ca_p_sum=round(rng.uniform(*CA_P_SUM_RANGE), 1),
+        ),
+    )
+
+def perturb_catalog(catalog: CatalogVersion, rng: random.Random, index: int) -> CatalogVersion:
+    """
+    製剤の含量を揺らし、添加剤の一部を除いたカタログ（バージョンは元のバージョン + -diff{index}）。
+    """
+    def scaled(model, fields):
+        return model.model_copy(update={
+            field: getattr(model, field) * rng.uniform(*SCALE_RANGE) for field in fields if getattr(model, field) > 0
+        })
+
+    return CatalogVersion(
+        version=f"{catalog.version}-diff{index}",
+        solutions=tuple(scaled(sol, SOLUTION_FIELDS) for sol in catalog.solutions),
+        additives={name: scaled(additive, ADDITIVE_FIELDS)
+                   for name, additive in catalog.additives.items() if rng.random() >= DROP_PROBABILITY},
+        loaded_at=catalog.loaded_at,
+    )
+
+def line_members(coefficients: Sequence[Sequence[float]], lines: Sequence[LineSpec]) -> List[List[int]]:
+    """
+    ライン毎の製剤の添字。脂肪を含む製剤は脂肪乳剤のライン（無ければもう一方のライン）に属する。
+    """
+    fats = NUTRIENTS.index('Fats')
+    has_lipid_line = any(line.lipid for line in lines)
+    return [
+        [j for j, row in enumerate(coefficients) if (has_lipid_line and row[fats] > 0) == line.lipid]
+        for line in lines
+    ]
+
+def reference_solve(
+    product_names: Sequence[str],
+    coefficients: Sequence[Sequence[float]],
+    targets: Dict[str, float],
+    constraints: Constraints = Constraints(),
+    osmolarities: Optional[Sequence[float]] = None,
+) -> Optional[Dict[str, float]]:
+    """
+    高速化経路のコード（ModelTemplate, CapRow）を使わずに毎回新しいモデルを構築して解く。解が無い場合はNone。
+    osmolarities（製剤毎のmOsm/L）は constraints に浸透圧の上限がある場合に必要。
+    """
+    problem = pulp.LpProblem("TPN_Infusion_Reference", pulp.LpMinimize)
+    x = [pulp.LpVariable(f"x{j}", lowBound=0, cat='Continuous') for j in range(len(product_names))]
+    problem += pulp.lpSum(x), "Total_Infusion_Volume"
+    for i, nutrient in enumerate(NUTRIENTS):
+        target = targets[nutrient]
+        if target <= 0:
+            continue
+        supply = pulp.lpSum(row[i] * x[j] for j, row in enumerate(coefficients))
+        # 元の実装と同じく目標の90%〜110%
+        problem += supply >= 0.9 * target, f"{nutrient}_lower"
+        problem += supply <= 1.1 * target, f"{nutrient}_upper"
+
+    for k, (line, members) in enumerate(zip(constraints.lines, line_members(coefficients, constraints.lines))):
+        volume = pulp.lpSum(x[j] for j in members)
+        if line.max_volume is not None:
+            problem += volume <= line.max_volume, f"line{k}_max_volume"
+        if line.max_rate is not None:
+            problem += volume <= line.max_rate * line.hours, f"line{k}_max_rate"
+        for nutrient, limit in line.max_concentration.items():
+            i = NUTRIENTS.index(nutrient)
+            problem += pulp.lpSum(coefficients[j][i] * x[j] for j in members) <= limit * volume, f"line{k}_{nutrient}"
+
+    compatibility = constraints.compatibility
+    if compatibility is not None:
+        fats, ca, p = NUTRIENTS.index('Fats'), NUTRIENTS.index('Ca'), NUTRIENTS.index('P')
+        mixed = [j for j, row in enumerate(coefficients) if row[fats] <= 0]
+        volume = pulp.lpSum(x[j] for j in mixed)
+        caps = [
+            ("osmolarity", compatibility.max_osmolarity, lambda j: osmolarities[j]),
+            ("ca", compatibility.max_ca, lambda j: coefficients[j][ca] * 1000.0),
+            ("p", compatibility.max_p, lambda j: coefficients[j][p] * 1000.0),
+            ("ca_p_sum", compatibility.max_ca_p_sum, lambda j: (coefficients[j][ca] + coefficients[j][p]) * 1000.0),
+        ]
+        for name, limit, content in caps:
+            if limit is not None:
+                problem += pulp.lpSum(content(j) * x[j] for j in mixed) <= limit * volume, name
+
+    problem.solve(pulp.PULP_CBC_CMD(msg=False))
+    if pulp.LpStatus[problem.status] != 'Optimal':
+        return None
+    return {name: var.varValue for name, var in zip(product_names, x)}
+
+def compare(
+    reference: Optional[Dict[str, float]],
+    result: Optional[InfusionMix],
+    product_names: Sequence[str],
+    coefficients: Sequence[Sequence[float]],
+    targets: Dict[str, float],
+    osmolarities: Sequence[float],
+    constraints: Constraints = Constraints(),
+    rtol: float = 1e-6,
+    atol: float = 1e-6,
+) -> Tuple[Optional[str], bool]:
+    """
+    基準の配合と比較し、(不一致の理由 / 一致ならNone, 製剤毎の配合量が基準と異なるか) を返す。
+    結果の浸透圧・Ca+P・ライン毎の内訳は配合量から計算し直して照合し、constraints の上限を満たすかも確認する。
+    """
+    if reference is None or result is None:
+        if reference is None and result is None:
+            return None, False
+        return ("基準のみ解なし" if reference is None else "高速経路のみ解なし"), False
+
+    def close(value, expected):
+        return abs(value - expected) <= atol + rtol * abs(expected)
+
+    def within(value, limit):
+        return value <= limit + atol + rtol * abs(limit)
+
+    volumes = [result.detailed_mix.get(name, 0.0) for name in product_names]
+    reference_total = sum(reference.values())
+    total = sum(volumes)
+    if not close(total, reference_total):
+        return f"総投与量 {total:.6f} mL/day（基準 {reference_total:.6f}）", False
+    if any(volume < -atol for volume in volumes):
+        return "負の配合量", False
+    supplies = compute_nutrient_totals(product_names, coefficients, result.detailed_mix)
+    for nutrient in NUTRIENTS:
+        target = targets[nutrient]
+        if target <= 0:
+            continue
+        lower, upper = LOWER_RATIO * target, UPPER_RATIO * target
+        if not lower - atol - rtol * lower <= supplies[nutrient] <= upper + atol + rtol * upper:
+            return f"{nutrient}の供給量 {supplies[nutrient]:.6f} が範囲外（{lower:.6f}〜{upper:.6f}）", False
+
+    # 脂肪乳剤以外の混合液の浸透圧・濃度（mixture_compatibility() を使わずに計算し直す）
+    fats, ca, p = NUTRIENTS.index('Fats'), NUTRIENTS.index('Ca'), NUTRIENTS.index('P')
+    mixed = [j for j, row in enumerate(coefficients) if row[fats] <= 0 and volumes[j]]
+    mixed_volume = sum(volumes[j] for j in mixed)
+    expected = {}
+    if mixed_volume > 0:
+        expected = {
+            'osmolarity': sum(osmolarities[j] * volumes[j] for j in mixed) / mixed_volume,
+            'ca': sum(coefficients[j][ca] * 1000.0 * volumes[j] for j in mixed) / mixed_volume,
+            'p': sum(coefficients[j][p] * 1000.0 * volumes[j] for j in mixed) / mixed_volume,
+        }
+        expected['ca_p_sum'] = expected['ca'] + expected['p']
+    for field in ['osmolarity', 'ca_p_sum']:
+        value = getattr(result, field)
+        if (value is None) != (field not in expected) or (value is not None and not close(value, expected[field])):
+            return f"{field} {value}（配合量からの計算値 {expected.get(field)}）", False
+    compatibility = constraints.compatibility
+    if compatibility is not None and expected:
+        for field, limit in [('osmolarity', compatibility.max_osmolarity), ('ca', compatibility.max_ca),
+                             ('p', compatibility.max_p), ('ca_p_sum', compatibility.max_ca_p_sum)]:
+            if limit is not None and not within(expected[field], limit):
+                return f"{field} {expected[field]:.6f} が上限 {limit} を超える", False
+
+    # ライン毎の投与量・速度（summarize_lines() を使わずに計算し直す）
+    if not constraints.lines:
+        if result.lines is not None:
+            return "1ラインの計算にライン毎の内訳がある", False
+    elif [line.name for line in result.lines or []] != [line.name for line in constraints.lines]:
+        return "ライン毎の内訳がない", False
+    else:
+        members = line_members(coefficients, constraints.lines)
+        for line, line_result, indices in zip(constraints.lines, result.lines, members):
+            line_volume = sum(volumes[j] for j in indices)
+            rate = line_volume / line.hours
+            if not close(line_result.total_volume, line_volume) or not close(line_result.rate, rate):
+                return (f"{line.label}の投与量 {line_result.total_volume:.6f} mL/day・速度 {line_result.rate:.6f} mL/h"
+                        f"（配合量からの計算値 {line_volume:.6f}・{rate:.6f}）"), False
+            if line.max_volume is not None and not within(line_volume, line.max_volume):
+                return f"{line.label}の投与量 {line_volume:.6f} mL/day が上限 {line.max_volume} を超える", False
+            if line.max_rate is not None and not within(rate, line.max_rate):
+                return f"{line.label}の速度 {rate:.6f} mL/h が上限 {line.max_rate} を超える", False
+            for nutrient, limit in line.max_concentration.items():
+                i = NUTRIENTS.index(nutrient)
+                amount = sum(coefficients[j][i] * volumes[j] for j in indices)
+                if not within(amount, limit * line_volume):
+                    return f"{line.label}の{nutrient}濃度 {amount / line_volume:.6f} /mL が上限 {limit} を超える", False
+
+    tolerance = atol + rtol * abs(reference_total)
+    differs = any(abs(volume - reference.get(name, 0.0)) > tolerance for name, volume in zip(product_names, volumes))
+    return None, differs
+
+def engine_constraints(engine: str, capped: Constraints) -> Constraints:
+    """
+    経路に渡す投与ラインと上限（capped はカタログ毎の条件）。
+    """
+    if engine in CAPPED_ENGINES or engine == 'reference_capped':
+        return capped
+    if engine == 'two_lines':
+        return Constraints(lines=TWO_LINES)
+    return Constraints()
+
+def run_engine(engine: str, patient: Patient, base_solution_name: str, product_names: Sequence[str],
+               coefficients: Sequence[Sequence[float]], osmolarities: Sequence[float], catalog_version: str,
+               atlas: RecipeAtlas, warm_start: Optional[Basis],
+               constraints: Constraints) -> Tuple[Optional[InfusionMix], Optional[str]]:
+    """
+    逐次実行する経路で配合を計算し、(計算結果 / 解が無い場合はNone, 使われた解法) を返す。
+    """
+    options = {'catalog_version': catalog_version, 'osmolarities': osmolarities,
+               'lines': constraints.lines or None, 'compatibility': constraints.compatibility}
+    if engine == 'warm_start':
+        options['warm_start'] = warm_start
+    elif engine == 'atlas':
+        options['atlas'] = atlas
+    try:
+        infusion_mix = calculate_from_composition(patient, base_solution_name, product_names, coefficients, **options)
+    except ValueError:
+        return None, None
+    return infusion_mix, infusion_mix.report.solver
+
+def run_differential_check(
+    cases: int = 2000,
+    catalogs: int = 3,
+    seed: int = 0,
+    jobs: int = 2,
+    rtol: float = 1e-6,
+    atol: float = 1e-6,
+    strict: bool = False,
+    base_solution_names: Optional[List[str]] = None,
+    grid: Dict[str, List[float]] = DIFF_GRID,
+    catalog: Optional[CatalogVersion] = None,
+) -> Dict:
+    """
+    差分試験を実行し、経路毎の件数・不一致・所要時間を辞書で返す。
+    catalogs は元のカタログを含むカタログの数（2以上で含量を揺らしたカタログを加える）。jobs=0 では parallel を省略する。
+    """
+    rng = random.Random(seed)
+    catalog = catalog or get_catalog()
+    if catalog is None:
+        raise ValueError("カタログを読み込めませんでした。")
+    variants = [catalog] + [perturb_catalog(catalog, rng, index) for index in range(1, catalogs)]
+    engines = [engine for engine in ENGINES if engine not in PARALLEL_ENGINES or jobs > 0]
+
+    timings: Dict[str, List[float]] = {engine: [] for engine in engines}
+    counts = {
+        engine: {'compared': 0, 'feasible': 0, 'mismatches': 0, 'recipe_differences': 0}
+        for engine in engines if engine not in REFERENCES
+    }
+    mismatches: List[Dict] = []
+    infeasible = redraws = atlas_hits = warm_start_hits = 0
+    atlas_build_seconds = 0.0
+    parallel_wall_seconds = {engine: 0.0 for engine in engines if engine in PARALLEL_ENGINES}
+    capped_constraints = {}
+
+    def record(engine, index, variant, base_solution_name, patient, reference, result, composition, osmolarities,
+               constraints):
+        reason, differs = compare(reference, result, *composition, compute_targets(patient), osmolarities, constraints,
+                                  rtol, atol)
+        if strict and reason is None and differs:
+            reason = "製剤毎の配合量が基準と異なる"
+        counts[engine]['compared'] += 1
+        counts[engine]['feasible'] += reference is not None
+        counts[engine]['recipe_differences'] += differs
+        if reason is not None:
+            counts[engine]['mismatches'] += 1
+            if len(mismatches) < MAX_EXAMPLES:
+                mismatches.append({
+                    'engine': engine, 'case': index, 'catalog_version': variant.version,
+                    'base_solution_name': base_solution_name, 'reason': reason,
+                    'patient': patient.model_dump(exclude_none=True),
+                })
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix='tpn_diff_') as tmp_dir:
+        for number, variant in enumerate(variants):
+            names = base_solution_names or [sol.name for sol in variant.solutions]
+            size = cases // len(variants) + (number < cases % len(variants))
+            offset = number * (cases // len(variants)) + min(number, cases % len(variants))
+            compositions, osmolarities = {}, {}
+            for name in names:
+                solution = variant.solution_by_name(name)
+                compositions[name] = compile_composition(solution, variant.additives)
+                osmolarities[name] = compile_osmolarity(solution, variant.additives, compositions[name][1])
+            capped = random_constraints(rng)
+            capped_constraints[variant.version] = {
+                'lines': [line.model_dump() for line in capped.lines], 'compatibility': capped.compatibility.model_dump(),
+            }
+
+            # 基準で解なしの患者は REDRAW_PROBABILITY で引き直す（基準の所要時間は採用した症例のみ）
+            tasks, references = [], []
+            for _ in range(size):
+                for draw in range(MAX_DRAWS):
+                    patient, base_solution_name = random_patient(rng), rng.choice(names)
+                    lap = time.perf_counter()
+                    reference = reference_solve(*compositions[base_solution_name], compute_targets(patient))
+                    elapsed = (time.perf_counter() - lap) * 1000.0
+                    if reference is not None or draw == MAX_DRAWS - 1 or rng.random() >= REDRAW_PROBABILITY:
+                        break
+                    redraws += 1
+                timings['reference'].append(elapsed)
+                lap = time.perf_counter()
+                reference_capped = reference_solve(*compositions[base_solution_name], compute_targets(patient), capped,
+                                                   osmolarities[base_solution_name])
+                timings['reference_capped'].append((time.perf_counter() - lap) * 1000.0)
+                tasks.append((patient, base_solution_name))
+                references.append({'reference': reference, 'reference_capped': reference_capped})
+                infeasible += reference is None
+
+            atlas = RecipeAtlas(os.path.join(tmp_dir, f"atlas_{number}.db"))
+            lap = time.perf_counter()
+            build_atlas(atlas, variant, grid, base_solution_names=sorted({name for _, name in tasks}), jobs=jobs)
+            atlas_build_seconds += time.perf_counter() - lap
+
+            previous: Dict[str, Basis] = {}
+            for index, ((patient, base_solution_name), reference) in enumerate(zip(tasks, references), start=offset):
+                basis = None
+                for engine in engines:
+                    if engine in REFERENCES or engine in PARALLEL_ENGINES:
+                        continue
+                    constraints = engine_constraints(engine, capped)
+                    lap = time.perf_counter()
+                    result, solver = run_engine(
+                        engine, patient, base_solution_name, *compositions[base_solution_name],
+                        osmolarities[base_solution_name], variant.version, atlas, previous.get(base_solution_name),
+                        constraints,
+                    )
+                    timings[engine].append((time.perf_counter() - lap) * 1000.0)
+                    atlas_hits += engine == 'atlas' and solver == 'atlas'
+                    warm_start_hits += engine == 'warm_start' and solver == 'warm_start'
+                    if engine == 'template' and result is not None and result.report.basis is not None:
+                        basis = result.report.basis
+                    expected = reference['reference_capped' if engine in CAPPED_ENGINES else 'reference']
+                    record(engine, index, variant, base_solution_name, patient, expected, result,
+                           compositions[base_solution_name], osmolarities[base_solution_name], constraints)
+                if basis is not None:
+                    previous[base_solution_name] = basis
+
+            for engine in parallel_wall_seconds:
+                if not tasks:
+                    break
+                constraints = engine_constraints(engine, capped)
+                lap = time.perf_counter()
+                with ParallelCalculator(variant, jobs=jobs, lines=constraints.lines or None,
+                                        compatibility=constraints.compatibility) as calculator:
+                    results = list(calculator.map(tasks))
+                parallel_wall_seconds[engine] += time.perf_counter() - lap
+                for batch, (patient, base_solution_name), reference in zip(results, tasks, references):
+                    if batch.infusion_mix:
+                        # ワーカー内の計算時間（プロセス間の受け渡しは parallel_wall_seconds に含まれる）
+                        timings[engine].append(batch.infusion_mix.report.timings_ms['total'])
+                    expected = reference['reference_capped' if engine in CAPPED_ENGINES else 'reference']
+                    record(engine, offset + batch.index, variant, base_solution_name, patient, expected,
+                           batch.infusion_mix, compositions[base_solution_name], osmolarities[base_solution_name],
+                           constraints)
+
+            clear_model_templates(variant.version)
+
+    return {
+        'cases': cases,
+        'catalogs': [variant.version for variant in variants],
+        'seed': seed,
+        'rtol': rtol,
+        'atol': atol,
+        'strict': strict,
+        'feasible': cases - infeasible,
+        'infeasible': infeasible,
+        'redraws': redraws,
+        'capped_constraints': capped_constraints,
+        'atlas_hits': atlas_hits,
+        'warm_start_hits': warm_start_hits,
+        'atlas_build_seconds': atlas_build_seconds,
+        'parallel_wall_seconds': parallel_wall_seconds,
+        'elapsed_seconds': time.perf_counter() - start,
+        'engines': counts,
+        'timings_ms': {engine: distribution(values) for engine, values in timings.items()},
+        'mismatches': mismatches,
+    }
+
+def find_slowdowns(summary: Dict, baseline: Dict, max_slowdown: float) -> List[Dict]:
+    """
+    前回の結果（--json の出力）と比べ、所要時間の中央値が max_slowdown 倍を超えて悪化した経路を返す。
+    """
+    slowdowns = []
+    for engine, stats in summary['timings_ms'].items():
+        previous = baseline.get('timings_ms', {}).get(engine)
+        if not previous or not previous['count'] or not stats['count']:
+            continue
+        if stats['p50'] > previous['p50'] * max_slowdown and stats['p50'] - previous['p50'] > SLOWDOWN_FLOOR_MS:
+            slowdowns.append({'engine': engine, 'p50_ms': stats['p50'], 'baseline_p50_ms': previous['p50']})
+    return slowdowns
+
+def format_summary(summary: Dict) -> str:
+    lines = [
+        f"症例数: {summary['cases']}  カタログ: {len(summary['catalogs'])}  解あり: {summary['feasible']}  "
+        f"解なし: {summary['infeasible']}  引き直し: {summary['redraws']}  所要時間: {summary['elapsed_seconds']:.1f} s",
+        f"配合表: 作成 {summary['atlas_build_seconds']:.1f} s  該当 {summary['atlas_hits']}件  "
+        f"前回の基底で解けた件数: {summary['warm_start_hits']}",
+        "",
+        f"{'経路':<18}{'件数':>8}{'解あり':>8}{'不一致':>8}{'配合差':>8}{'平均':>10}{'p50':>10}{'p95':>10}{'最大':>10}  (ms)",
+    ]
+    for engine, stats in summary['timings_ms'].items():
+        counts = summary['engines'].get(engine, {
+            'compared': stats['count'], 'feasible': summary['feasible'], 'mismatches': 0, 'recipe_differences': 0,
+        })
+        lines.append(
+            f"{engine:<18}{counts['compared']:>8}{counts['feasible']:>8}{counts['mismatches']:>8}"
+            f"{counts['recipe_differences']:>8}"
+            f"{stats['mean']:>10.2f}{stats['p50']:>10.2f}{stats['p95']:>10.2f}{stats['max']:>10.2f}"
+        )
+    for engine, seconds in summary['parallel_wall_seconds'].items():
+        lines.append(f"{engine} の経過時間: {seconds:.2f} s")
+    for mismatch in summary['mismatches']:
+        lines.append(f"不一致: {mismatch['engine']} 症例{mismatch['case']} {mismatch['base_solution_name']}: {mismatch['reason']}")
+    for slowdown in summary.get('slowdowns', []):
+        lines.append(f"速度低下: {slowdown['engine']} p50 {slowdown['baseline_p50_ms']:.2f} -> {slowdown['p50_ms']:.2f} ms")
+    return "\n".join(lines)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="最適化の高速化経路と基準のLPの差分試験")
+    parser.add_argument('--cases', type=int, default=2000, help="症例数（全カタログの合計）")
+    parser.add_argument('--catalogs', type=int, default=3, help="カタログの数（元のカタログ + 含量を揺らしたカタログ）")
+    parser.add_argument('--base', action='append', help="対象のベース製剤名（複数指定可。省略時は全て）")
+    parser.add_argument('--jobs', type=int, default=2, help="parallel のプロセス数（0で省略）")
+    parser.add_argument('--rtol', type=float, default=1e-6, help="総投与量・供給量の相対許容誤差")
+    parser.add_argument('--atol', type=float, default=1e-6, help="総投与量・供給量の絶対許容誤差")
+    parser.add_argument('--strict', action='store_true', help="製剤毎の配合量の差も不一致とする")
+    parser.add_argument('--baseline', help="比較する前回の結果（--json の出力）")
+    parser.add_argument('--max-slowdown', type=float, default=1.5, help="所要時間の中央値の許容倍率")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="結果をJSONで出力")
+    args = parser.parse_args(argv)
+
+    # 解なしの症例は想定内のため、計算のエラーログは出力しない
+    logging.disable(logging.ERROR)
+    try:
+        summary = run_differential_check(args.cases, args.catalogs, args.seed, args.jobs, args.rtol, args.atol,
+                                         args.strict, base_solution_names=args.base)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            summary['slowdowns'] = find_slowdowns(summary, json.load(f), args.max_slowdown)
+    print(json.dumps(summary, ensure_ascii=False, indent=2) if args.json else format_summary(summary))
+    failed = any(counts['mismatches'] for counts in summary['engines'].values()) or summary.get('slowdowns')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,255 @@
+# tools/load_test.py
+"""
+複数の臨床医の同時利用を模擬する負荷試験。
+
+Streamlitの AppTest で利用者毎に独立したセッションを作り、入力変更と計算を繰り返して
+各操作（スクリプト再実行）の応答時間、スループット、RSS増加を集計する。
+
+AppTest は実行中にプロセス共通の Runtime を差し替えるため、同一プロセス内で
+スクリプトを同時に実行できない。そこで利用者毎に1プロセスを起動し、全員の準備
+（streamlitの読み込み）が済んでから同時に操作を始める。スクリプトは実際に並行して
+実行されるため、応答時間が同時利用者数に応じて伸びる様子から飽和点を読み取る。
+RSSは利用者プロセス毎に計測し、合計と利用者毎の増加量の分布を出力する。
+
+    python -m tools.load_test --users 30 --iterations 20
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import queue
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app.py')
+
+# 利用者が編集する入力欄: (キー, 最小値, 最大値)
+EDITABLE_INPUTS = [
+    ('weight', 0.5, 4.0),
+    ('twi', 60.0, 180.0),
+    ('gir_input', 4.0, 10.0),
+    ('na_input', 2.0, 4.0),
+    ('k_input', 1.0, 3.0),
+]
+
+def current_rss_mb() -> float:
+    """
+    現在のRSS（MB）。/proc が無い環境では最大RSSで代用する。
+    """
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSはbytes、Linuxはkilobytes
+    return maxrss / (1024.0 * 1024.0) if sys.platform == 'darwin' else maxrss / 1024.0
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """
+    最近接順位法によるパーセンタイル（sorted_valuesは昇順）。
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), math.ceil(q * len(sorted_values) / 100.0)))
+    return sorted_values[rank - 1]
+
+def distribution(values: List[float]) -> Dict[str, float]:
+    """
+    件数・平均・パーセンタイル・最大値を返す。
+    """
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'mean': statistics.fmean(values) if values else 0.0,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': values[-1] if values else 0.0,
+    }
+
+# 利用者プロセスの準備（streamlitの読み込み）の待ち時間の上限（秒）
+STARTUP_TIMEOUT = 120.0
+
+class SimulatedUser:
+    """
+    1人分のセッション。入力を数回変更してから計算する、という操作をiterations回繰り返す。
+    """
+
+    def __init__(self, user_id: int, iterations: int, edits_per_calculation: int, think_time: float, seed: int, timeout: float):
+        self.user_id = user_id
+        self.iterations = iterations
+        self.edits_per_calculation = edits_per_calculation
+        self.think_time = think_time
+        self.random = random.Random(seed + user_id)
+        self.timeout = timeout
+        self.latencies: Dict[str, List[float]] = {'load': [], 'edit': [], 'calculate': []}
+        self.errors: List[str] = []
+
+    def _timed_run(self, kind: str, element):
+        started = time.perf_counter()
+        element.run(timeout=self.timeout)
+        self.latencies[kind].append((time.perf_counter() - started) * 1000.0)
+
+    def run(self):
+        from streamlit.testing.v1 import AppTest
+
+        try:
+            at = AppTest.from_file(APP_PATH, default_timeout=self.timeout)
+            self._timed_run('load', at)
+            at.text_input(key="patient_id").set_value(f"LOAD-{self.user_id:03d}")
+            for _ in range(self.iterations):
+                for _ in range(self.edits_per_calculation):
+                    key, low, high = self.random.choice(EDITABLE_INPUTS)
+                    # フォーム内の入力は送信まで再実行されないため、値の設定のみ
+                    at.number_input(key=key).set_value(round(self.random.uniform(low, high), 1))
+                    if self.think_time:
+                        time.sleep(self.random.uniform(0, self.think_time))
+                calculate = next(b for b in at.button if b.label == "配合を計算")
+                self._timed_run('calculate', calculate.click())
+                if at.exception:
+                    self.errors.append(str(at.exception[0].value))
+                # 結果表示後にベース製剤を切り替える（フラグメントのみ再実行）
+                selectbox = at.selectbox(key="base_solution_selectbox")
+                self._timed_run('edit', selectbox.select(self.random.choice(selectbox.options)))
+        except Exception as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+
+def _user_process(user_id: int, iterations: int, edits_per_calculation: int, think_time: float, seed: int,
+                  timeout: float, start_delay: float, barrier, results):
+    """
+    利用者プロセスの本体。準備後に全員で barrier を待ってから操作し、結果を results に入れる。
+    """
+    result = {'user_id': user_id, 'latencies': {}, 'errors': [], 'rss_start_mb': 0.0, 'rss_end_mb': 0.0}
+    try:
+        # streamlit自体の読み込みはRSS増加に含めない
+        import streamlit.testing.v1  # noqa: F401
+
+        result['rss_start_mb'] = current_rss_mb()
+        barrier.wait(STARTUP_TIMEOUT)
+        if start_delay:
+            time.sleep(start_delay)
+        user = SimulatedUser(user_id, iterations, edits_per_calculation, think_time, seed, timeout)
+        user.run()
+        result['latencies'] = user.latencies
+        result['errors'] = user.errors
+    except Exception as e:
+        result['errors'].append(f"{type(e).__name__}: {e}")
+    result['rss_end_mb'] = current_rss_mb()
+    results.put(result)
+
+def run_load_test(users: int, iterations: int, edits_per_calculation: int = 3, think_time: float = 0.0,
+                  seed: int = 0, timeout: float = 60.0, ramp_up: float = 0.0) -> Dict:
+    """
+    負荷試験を実行し、集計結果を辞書で返す。利用者毎に1プロセス（spawn）を起動する。
+    """
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(users + 1)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=_user_process, name=f"user-{i}", daemon=True,
+            args=(i, iterations, edits_per_calculation, think_time, seed, timeout, ramp_up * i / users, barrier, results),
+        )
+        for i in range(users)
+    ]
+    for process in processes:
+        process.start()
+    collected: List[Dict] = []
+    errors: List[str] = []
+    try:
+        barrier.wait(STARTUP_TIMEOUT)
+    except Exception:
+        errors.append("利用者プロセスの準備が時間内に終わりませんでした。")
+    start = time.perf_counter()
+    while len(collected) < users:
+        try:
+            collected.append(results.get(timeout=1.0))
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes) and results.empty():
+                break
+    wall_seconds = time.perf_counter() - start
+    for process in processes:
+        process.join(timeout=5.0)
+        if process.is_alive():
+            process.terminate()
+    reported = {result['user_id'] for result in collected}
+    errors += [
+        f"user-{i}: プロセスが結果を返さずに終了しました (exitcode={process.exitcode})"
+        for i, process in enumerate(processes) if i not in reported
+    ]
+
+    rss_start = sum(result['rss_start_mb'] for result in collected)
+    rss_end = sum(result['rss_end_mb'] for result in collected)
+    summary = {
+        'users': users,
+        'iterations': iterations,
+        'wall_seconds': wall_seconds,
+        'rss_start_mb': rss_start,
+        'rss_end_mb': rss_end,
+        'rss_growth_mb': rss_end - rss_start,
+        'rss_growth_per_user_mb': distribution([r['rss_end_mb'] - r['rss_start_mb'] for r in collected]),
+        'errors': errors + [error for result in collected for error in result['errors']],
+        'latency_ms': {},
+    }
+    total_requests = 0
+    for kind in ['load', 'edit', 'calculate']:
+        summary['latency_ms'][kind] = distribution([v for result in collected for v in result['latencies'].get(kind, [])])
+        total_requests += summary['latency_ms'][kind]['count']
+    summary['requests'] = total_requests
+    summary['throughput_rps'] = total_requests / wall_seconds if wall_seconds > 0 else 0.0
+    calculations = summary['latency_ms']['calculate']['count']
+    summary['calculations_per_second'] = calculations / wall_seconds if wall_seconds > 0 else 0.0
+    return summary
+
+def format_summary(summary: Dict) -> str:
+    lines = [
+        f"同時利用者数: {summary['users']}  繰り返し: {summary['iterations']}  所要時間: {summary['wall_seconds']:.1f} s",
+        f"スループット: {summary['throughput_rps']:.2f} req/s  (計算 {summary['calculations_per_second']:.2f} /s)",
+        f"RSS（利用者プロセスの合計）: {summary['rss_start_mb']:.1f} MB -> {summary['rss_end_mb']:.1f} MB  "
+        f"(+{summary['rss_growth_mb']:.1f} MB、利用者毎 p50 +{summary['rss_growth_per_user_mb']['p50']:.1f} MB"
+        f" / 最大 +{summary['rss_growth_per_user_mb']['max']:.1f} MB)",
+        "",
+        f"{'操作':<12}{'件数':>8}{'平均':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'最大':>10}  (ms)",
+    ]
+    for kind, stats in summary['latency_ms'].items():
+        lines.append(
+            f"{kind:<12}{stats['count']:>8}{stats['mean']:>10.1f}{stats['p50']:>10.1f}"
+            f"{stats['p95']:>10.1f}{stats['p99']:>10.1f}{stats['max']:>10.1f}"
+        )
+    if summary['errors']:
+        lines.append("")
+        lines.append(f"エラー: {len(summary['errors'])}件 (先頭: {summary['errors'][0]})")
+    return "\n".join(lines)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="TPN配合計算アプリの同時利用負荷試験")
+    parser.add_argument('--users', type=int, default=10, help="同時利用者数")
+    parser.add_argument('--iterations', type=int, default=10, help="利用者毎の計算回数")
+    parser.add_argument('--edits', type=int, default=3, help="計算1回あたりの入力変更数")
+    parser.add_argument('--think-time', type=float, default=0.0, help="入力変更間の最大待ち時間（秒）")
+    parser.add_argument('--ramp-up', type=float, default=0.0, help="全利用者が開始するまでの時間（秒）")
+    parser.add_argument('--timeout', type=float, default=60.0, help="1操作あたりのタイムアウト（秒）")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="結果をJSONで出力")
+    parser.add_argument('--result-db', default=None, help="計算結果ストアのパス（省略時は一時ファイル）")
+    args = parser.parse_args(argv)
+
+    # 負荷試験の計算結果で本番のストアを汚さない
+    os.environ['TPN_RESULT_DB'] = args.result_db or os.path.join(tempfile.mkdtemp(prefix='tpn_load_'), 'results.db')
+
+    summary = run_load_test(args.users, args.iterations, args.edits, args.think_time, args.seed, args.timeout, args.ramp_up)
+    print(json.dumps(summary, ensure_ascii=False, indent=2) if args.json else format_summary(summary))
+    return 1 if summary['errors'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,279 @@
+# tools/log_analyzer.py
+"""
+app.log の利用状況・計算時間の集計。
+
+ログを1行ずつ読み（ローテーション済みの app.log.1, app.log.2.gz 等も含む）、
+「計算開始」「計算完了」の対から計算時間の分布を求め、失敗した計算を原因別
+（実行不可能・200%以上の乖離は栄養素別）に数える。計算時間はヒストグラムで保持するため、
+ログの大きさによらずメモリ使用量は一定。
+
+    python -m tools.log_analyzer app.log logs/app.log
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import math
+import os
+import re
+import sys
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, IO, Iterable, List, Optional
+
+START_MESSAGE = "計算開始"
+FINISH_MESSAGE = "計算完了"
+STARTUP_MESSAGE = "アプリケーションの起動"
+INFEASIBLE_MESSAGE = "最適化問題が解けませんでした"
+
+DEVIATION_PATTERNS = [
+    re.compile(r"^(.+?) の供給量が目標と200%以上異なります"),
+    re.compile(r"^(\S+) target=0なのにactual>0で大差"),  # 旧バージョンのメッセージ
+]
+ECHO_PREFIXES = ("ValueError: ", "Exception: ", "計算中にエラーが発生しました: ")
+DATA_ERROR_MARKERS = ("ロードに失敗", "ファイルが見つかりません", "JSON解析", "カタログの読み込みに失敗")
+
+# 計算開始から完了・失敗までの対応待ちを保持する上限（異常終了したプロセスのログで増え続けないように）
+MAX_PENDING = 1000
+
+class LatencyHistogram:
+    """
+    対数目盛りのヒストグラム（相対誤差 約2.5%）。件数によらず一定のメモリでパーセンタイルを近似する。
+    """
+
+    GROWTH = 1.05
+
+    def __init__(self):
+        self.buckets: Counter = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = 0.0
+
+    def add(self, value_ms: float):
+        self.count += 1
+        self.total += value_ms
+        self.minimum = min(self.minimum, value_ms)
+        self.maximum = max(self.maximum, value_ms)
+        # 1ms未満（ログの時刻分解能以下）はバケット-1にまとめる
+        index = -1 if value_ms < 1.0 else int(math.log(value_ms, self.GROWTH))
+        self.buckets[index] += 1
+
+    def percentile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = max(1, math.ceil(q / 100.0 * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                if index < 0:
+                    return 0.0
+                # バケットの幾何中央値（最小・最大の範囲に収める）
+                value = self.GROWTH ** (index + 0.5)
+                return min(max(value, self.minimum), self.maximum)
+        return self.maximum
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'min': self.minimum if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.maximum,
+        }
+
+class LogStats:
+    """
+    ログ行を順に受け取り、集計値を更新する。
+    """
+
+    def __init__(self):
+        self.lines = 0
+        self.records = 0
+        self.startups = 0
+        self.calculations_started = 0
+        self.calculations_finished = 0
+        self.latency = LatencyHistogram()
+        self.infeasible = 0
+        self.deviation_by_nutrient: Counter = Counter()
+        self.other_failures: Counter = Counter()
+        self.validation_errors = 0
+        self.data_errors = 0
+        self.warnings: Counter = Counter()
+        self.calculations_by_day: Counter = Counter()
+        self.first_timestamp: Optional[str] = None
+        self.last_timestamp: Optional[str] = None
+        self._pending: deque = deque(maxlen=MAX_PENDING)
+
+    def start_file(self):
+        """
+        別ファイル（別プロセス）の開始・完了は対応させない。
+        """
+        self._pending.clear()
+
+    def feed(self, line: str):
+        self.lines += 1
+        # 「YYYY-MM-DD HH:MM:SS,mmm - LEVEL - message」以外（複数行ログの続き）は読み飛ばす
+        if len(line) < 27 or line[4] != '-' or line[23:26] != ' - ':
+            return
+        level_end = line.find(' - ', 26)
+        if level_end < 0:
+            return
+        self.records += 1
+        timestamp = line[:23]
+        level = line[26:level_end]
+        message = line[level_end + 3:].rstrip('\n')
+        if self.first_timestamp is None or timestamp < self.first_timestamp:
+            self.first_timestamp = timestamp
+        if self.last_timestamp is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+
+        if level == 'DEBUG':
+            return
+        if level == 'INFO':
+            if message == START_MESSAGE:
+                self.calculations_started += 1
+                self.calculations_by_day[timestamp[:10]] += 1
+                self._pending.append(_parse_timestamp(timestamp))
+            elif message == FINISH_MESSAGE:
+                self.calculations_finished += 1
+                if self._pending:
+                    started = self._pending.popleft()
+                    self.latency.add((_parse_timestamp(timestamp) - started).total_seconds() * 1000.0)
+            elif message == STARTUP_MESSAGE:
+                self.startups += 1
+        elif level == 'WARNING':
+            self.warnings[message] += 1
+        elif level == 'ERROR':
+            self._feed_error(message)
+
+    def _feed_error(self, message: str):
+        if message.startswith("ValidationError"):
+            self.validation_errors += 1
+            return
+        if any(marker in message for marker in DATA_ERROR_MARKERS):
+            self.data_errors += 1
+            return
+        is_echo = message.startswith(ECHO_PREFIXES)
+        if is_echo and not self._pending:
+            # 同じ失敗を上位の例外処理が再度記録したもの
+            return
+        if self._pending:
+            self._pending.popleft()
+
+        cause = message
+        for prefix in ECHO_PREFIXES:
+            if cause.startswith(prefix):
+                cause = cause[len(prefix):]
+        if cause.startswith(INFEASIBLE_MESSAGE):
+            self.infeasible += 1
+            return
+        for pattern in DEVIATION_PATTERNS:
+            match = pattern.match(cause)
+            if match:
+                self.deviation_by_nutrient[match.group(1)] += 1
+                return
+        self.other_failures[cause[:80]] += 1
+
+    @property
+    def failures(self) -> int:
+        return self.infeasible + sum(self.deviation_by_nutrient.values()) + sum(self.other_failures.values())
+
+    def summary(self) -> Dict:
+        return {
+            'lines': self.lines,
+            'records': self.records,
+            'first_timestamp': self.first_timestamp,
+            'last_timestamp': self.last_timestamp,
+            'startups': self.startups,
+            'calculations_started': self.calculations_started,
+            'calculations_finished': self.calculations_finished,
+            'calculations_failed': self.failures,
+            'latency_ms': self.latency.summary(),
+            'infeasible': self.infeasible,
+            'deviation_200_by_nutrient': dict(self.deviation_by_nutrient.most_common()),
+            'other_failures': dict(self.other_failures.most_common()),
+            'validation_errors': self.validation_errors,
+            'data_errors': self.data_errors,
+            'warnings': dict(self.warnings.most_common()),
+            'calculations_by_day': dict(sorted(self.calculations_by_day.items())),
+        }
+
+def _parse_timestamp(timestamp: str) -> datetime:
+    # strptimeより高速な固定位置の解析（YYYY-MM-DD HH:MM:SS,mmm）
+    return datetime(
+        int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+        int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]),
+        int(timestamp[20:23]) * 1000,
+    )
+
+def expand_log_paths(paths: Iterable[str], include_rotated: bool = True) -> List[str]:
+    """
+    ローテーション済みのファイル（app.log.1, app.log.2.gz 等）を古い順に前に並べて返す。
+    """
+    expanded = []
+    for path in paths:
+        rotated = []
+        if include_rotated:
+            for candidate in glob.glob(glob.escape(path) + '.*'):
+                suffix = candidate[len(path) + 1:]
+                number = suffix[:-3] if suffix.endswith('.gz') else suffix
+                if number.isdigit():
+                    rotated.append((int(number), candidate))
+        expanded.extend(candidate for _, candidate in sorted(rotated, reverse=True))
+        if os.path.exists(path):
+            expanded.append(path)
+    return expanded
+
+def open_log(path: str) -> IO[str]:
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, 'r', encoding='utf-8', errors='replace')
+
+def analyze(paths: Iterable[str], include_rotated: bool = True) -> LogStats:
+    stats = LogStats()
+    for path in expand_log_paths(paths, include_rotated):
+        stats.start_file()
+        with open_log(path) as f:
+            for line in f:
+                stats.feed(line)
+    return stats
+
+def format_summary(summary: Dict) -> str:
+    latency = summary['latency_ms']
+    lines = [
+        f"期間: {summary['first_timestamp']} 〜 {summary['last_timestamp']}  ({summary['records']}件 / {summary['lines']}行)",
+        f"起動回数: {summary['startups']}",
+        f"計算: 開始 {summary['calculations_started']} / 完了 {summary['calculations_finished']} / 失敗 {summary['calculations_failed']}",
+        f"計算時間(ms): 平均 {latency['mean']:.1f}  p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f}  "
+        f"p99 {latency['p99']:.1f}  最大 {latency['max']:.1f}  (n={latency['count']})",
+        f"実行不可能（最適化失敗）: {summary['infeasible']}",
+        "200%以上の乖離（栄養素別）: " + (", ".join(f"{k} {v}" for k, v in summary['deviation_200_by_nutrient'].items()) or "なし"),
+        f"入力検証エラー: {summary['validation_errors']}  データ読み込みエラー: {summary['data_errors']}",
+    ]
+    if summary['other_failures']:
+        lines.append("その他の失敗:")
+        lines += [f"  {count:>5}  {cause}" for cause, count in summary['other_failures'].items()]
+    if summary['warnings']:
+        lines.append("警告:")
+        lines += [f"  {count:>5}  {message}" for message, count in summary['warnings'].items()]
+    return "\n".join(lines)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="app.log の利用状況・計算時間の集計")
+    parser.add_argument('paths', nargs='*', default=['app.log'], help="ログファイル（既定: app.log）")
+    parser.add_argument('--no-rotated', action='store_true', help="ローテーション済みのファイルを含めない")
+    parser.add_argument('--json', action='store_true', help="結果をJSONで出力")
+    args = parser.parse_args(argv)
+
+    stats = analyze(args.paths, include_rotated=not args.no_rotated)
+    summary = stats.summary()
+    print(json.dumps(summary, ensure_ascii=False, indent=2) if args.json else format_summary(summary))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
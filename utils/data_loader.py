@@ -1,25 +1,35 @@
-import json
+import hashlib
 import os
+import shutil
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError
 from models.solution import Solution
 from models.additive import Additive
 import logging
 
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+SNAPSHOT_DIR = os.path.join(DATA_DIR, 'catalog_snapshots')
+
+# カタログファイルのスキーマ。JSONの解析と検証・モデル生成を1回で行う
+SOLUTIONS_ADAPTER = TypeAdapter(List[Solution])
+ADDITIVES_ADAPTER = TypeAdapter(Dict[str, Additive])
+
 def load_solutions(file_path='data/base_solutions.json'):
     try:
         script_dir = os.path.dirname(os.path.abspath(__file__))
         full_path = os.path.join(script_dir, '..', file_path)
         
-        with open(full_path, 'r', encoding='utf-8') as f:
-            solutions_data = json.load(f)
-        # solutions_dataがリストである場合、.values()は使わず直接イテレートする
-        solutions = [Solution(**sol) for sol in solutions_data]
+        with open(full_path, 'rb') as f:
+            solutions = SOLUTIONS_ADAPTER.validate_json(f.read())
         logging.debug("ベース製剤データのロードに成功しました。")
         return solutions
     except FileNotFoundError:
         logging.error(f"ベース製剤データファイルが見つかりません: {file_path}")
         return []
-    except json.JSONDecodeError as e:
-        logging.error(f"ベース製剤データファイルのJSON解析エラー: {e}")
+    except ValidationError as e:
+        logging.error(f"ベース製剤データファイルのJSON解析・検証エラー: {e}")
         return []
 
 def load_additives(file_path='data/additives.json'):
@@ -27,15 +37,165 @@ def load_additives(file_path='data/additives.json'):
         script_dir = os.path.dirname(os.path.abspath(__file__))
         full_path = os.path.join(script_dir, '..', file_path)
         
-        with open(full_path, 'r', encoding='utf-8') as f:
-            additives_data = json.load(f)
-        # additives_dataは辞書形式を想定
-        additives = {name: Additive(**props) for name, props in additives_data.items()}
+        with open(full_path, 'rb') as f:
+            additives = ADDITIVES_ADAPTER.validate_json(f.read())
         logging.debug("添加剤データのロードに成功しました。")
         return additives
     except FileNotFoundError:
         logging.error(f"添加剤データファイルが見つかりません: {file_path}")
         return {}
-    except json.JSONDecodeError as e:
-        logging.error(f"添加剤データファイルのJSON解析エラー: {e}")
+    except ValidationError as e:
+        logging.error(f"添加剤データファイルのJSON解析・検証エラー: {e}")
         return {}
+
+class CatalogVersion(BaseModel):
+    """
+    製剤カタログの不変スナップショット。versionは両ファイルの内容ハッシュ。
+    """
+    model_config = ConfigDict(frozen=True)
+
+    version: str
+    solutions: Tuple[Solution, ...]
+    additives: Dict[str, Additive]
+    loaded_at: datetime
+
+    def solution_by_name(self, name: str) -> Optional[Solution]:
+        return next((sol for sol in self.solutions if sol.name == name), None)
+
+_catalog_lock = threading.Lock()
+_current_catalog: Optional[CatalogVersion] = None
+_current_signature: Optional[tuple] = None
+_catalog_versions: Dict[str, CatalogVersion] = {}
+_catalog_listeners: List[Callable[[Optional[CatalogVersion], CatalogVersion], None]] = []
+
+def compute_catalog_hash(solutions_bytes: bytes, additives_bytes: bytes) -> str:
+    """
+    カタログファイルの内容からバージョン文字列（SHA-256の先頭12桁）を計算する。
+    """
+    digest = hashlib.sha256()
+    digest.update(solutions_bytes)
+    digest.update(b'\0')
+    digest.update(additives_bytes)
+    return digest.hexdigest()[:12]
+
+def on_catalog_change(callback: Callable[[Optional[CatalogVersion], CatalogVersion], None]):
+    """
+    カタログが新しいバージョンに切り替わった時に (旧バージョン, 新バージョン) で呼ばれるコールバックを登録する。
+    バージョン単位のキャッシュを破棄する用途を想定。
+    """
+    _catalog_listeners.append(callback)
+
+def get_catalog_version(version: str) -> Optional[CatalogVersion]:
+    """
+    カタログをバージョン文字列で取得する。このプロセスで未ロードの場合（再起動・更新後の過去の計算等）は
+    保存済みのスナップショットから読み込む。内容のハッシュがバージョンと一致しない、または見つからない場合はNone。
+    """
+    catalog = _catalog_versions.get(version)
+    if catalog is not None:
+        return catalog
+    snapshot_dir = os.path.join(SNAPSHOT_DIR, version)
+    try:
+        with open(os.path.join(snapshot_dir, 'base_solutions.json'), 'rb') as f:
+            solutions_bytes = f.read()
+        with open(os.path.join(snapshot_dir, 'additives.json'), 'rb') as f:
+            additives_bytes = f.read()
+    except OSError:
+        logging.warning(f"カタログバージョン {version} のスナップショットが見つかりません。")
+        return None
+    if compute_catalog_hash(solutions_bytes, additives_bytes) != version:
+        logging.error(f"カタログバージョン {version} のスナップショットの内容がバージョンと一致しません。")
+        return None
+    try:
+        catalog = _build_catalog(version, solutions_bytes, additives_bytes)
+    except ValidationError as e:
+        logging.error(f"カタログバージョン {version} のスナップショットを読み込めません: {e}")
+        return None
+    with _catalog_lock:
+        return _catalog_versions.setdefault(version, catalog)
+
+def _file_signature(paths: Tuple[str, ...]) -> tuple:
+    signature = []
+    for path in paths:
+        stat = os.stat(path)
+        signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def _build_catalog(version: str, solutions_bytes: bytes, additives_bytes: bytes) -> CatalogVersion:
+    """
+    バージョン作成時に一度だけスキーマ検証する。以降は同じバージョンのモデルを再利用し、再検証しない。
+    """
+    solutions = tuple(SOLUTIONS_ADAPTER.validate_json(solutions_bytes))
+    additives = ADDITIVES_ADAPTER.validate_json(additives_bytes)
+    return CatalogVersion(version=version, solutions=solutions, additives=additives, loaded_at=datetime.now())
+
+def _archive_snapshot(version: str, solutions_bytes: bytes, additives_bytes: bytes):
+    """
+    過去の計算がどのカタログを使ったか追跡できるよう、バージョン毎の内容を保存する。
+    """
+    target_dir = os.path.join(SNAPSHOT_DIR, version)
+    if os.path.isdir(target_dir):
+        return
+    tmp_dir = f"{target_dir}.tmp{os.getpid()}"
+    try:
+        os.makedirs(tmp_dir, exist_ok=True)
+        with open(os.path.join(tmp_dir, 'base_solutions.json'), 'wb') as f:
+            f.write(solutions_bytes)
+        with open(os.path.join(tmp_dir, 'additives.json'), 'wb') as f:
+            f.write(additives_bytes)
+        os.replace(tmp_dir, target_dir)
+    except OSError as e:
+        # 別のプロセスが同じバージョンを先に保存した場合（内容は同じ）は成功とみなす
+        if not os.path.isdir(target_dir):
+            logging.warning(f"カタログスナップショットの保存に失敗しました: {e}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def get_catalog(solutions_path: str = 'data/base_solutions.json', additives_path: str = 'data/additives.json') -> Optional[CatalogVersion]:
+    """
+    現在のカタログを返す。ファイルが更新されていれば再ロードし、新しいバージョンに切り替える。
+    未変更時はstatの比較のみで、ファイルの読み込み・検証は行わない。
+    読み込みに失敗した場合は直前のバージョンを使い続ける。
+    """
+    global _current_catalog, _current_signature
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    paths = (os.path.join(script_dir, '..', solutions_path), os.path.join(script_dir, '..', additives_path))
+
+    try:
+        signature = _file_signature(paths)
+    except OSError as e:
+        logging.error(f"カタログファイルが見つかりません: {e}")
+        return _current_catalog
+    if _current_catalog is not None and signature == _current_signature:
+        return _current_catalog
+
+    with _catalog_lock:
+        if _current_catalog is not None and signature == _current_signature:
+            return _current_catalog
+        try:
+            with open(paths[0], 'rb') as f:
+                solutions_bytes = f.read()
+            with open(paths[1], 'rb') as f:
+                additives_bytes = f.read()
+            version = compute_catalog_hash(solutions_bytes, additives_bytes)
+            catalog = _catalog_versions.get(version)
+            if catalog is None:
+                catalog = _build_catalog(version, solutions_bytes, additives_bytes)
+                _catalog_versions[version] = catalog
+                _archive_snapshot(version, solutions_bytes, additives_bytes)
+        except (OSError, ValidationError) as e:
+            logging.error(f"カタログの読み込みに失敗しました。現在のバージョンを継続使用します: {e}")
+            return _current_catalog
+
+        previous = _current_catalog
+        _current_signature = signature
+        if previous is not None and previous.version == catalog.version:
+            return previous
+        _current_catalog = catalog
+        logging.info(f"カタログバージョン {catalog.version} を読み込みました。")
+
+    for callback in list(_catalog_listeners):
+        try:
+            callback(previous, catalog)
+        except Exception as e:
+            logging.error(f"カタログ更新コールバックでエラーが発生しました: {e}")
+    return catalog
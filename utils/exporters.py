@@ -0,0 +1,165 @@
+# utils/exporters.py
+
+import csv
+import itertools
+import json
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+from models.infusion_mix import InfusionMix
+
+# 配合量の出力列（1行 = 1結果の1ラインの1製剤。1ラインで計算した結果のlineは空、投与時間は24時間）
+MIX_COLUMNS = [
+    'label', 'catalog_version', 'line', 'product', 'volume_ml_per_day', 'rate_ml_per_hour',
+    'gir', 'amino_acid', 'na', 'k', 'cl', 'ca', 'mg', 'zn', 'fat',
+]
+
+def iter_mix_rows(infusion_mix: InfusionMix, label: str = '') -> Iterator[Dict[str, Any]]:
+    """
+    1つの計算結果を製剤毎の行（辞書）として返す。複数ラインの結果はライン毎に分け、ラインの投与時間で速度を求める。
+    """
+    if infusion_mix.lines:
+        groups = [(line.name, line.hours, line.volumes) for line in infusion_mix.lines]
+    else:
+        groups = [('', 24.0, infusion_mix.detailed_mix)]
+    for line_name, hours, volumes in groups:
+        for product, volume in volumes.items():
+            yield {
+                'label': label,
+                'catalog_version': infusion_mix.catalog_version,
+                'line': line_name,
+                'product': product,
+                'volume_ml_per_day': volume,
+                'rate_ml_per_hour': volume / hours,
+                'gir': infusion_mix.gir,
+                'amino_acid': infusion_mix.amino_acid,
+                'na': infusion_mix.na,
+                'k': infusion_mix.k,
+                'cl': infusion_mix.cl,
+                'ca': infusion_mix.ca,
+                'mg': infusion_mix.mg,
+                'zn': infusion_mix.zn,
+                'fat': infusion_mix.fat,
+            }
+
+def iter_batch_rows(results: Iterable[Tuple[str, InfusionMix]]) -> Iterator[Dict[str, Any]]:
+    """
+    (ラベル, InfusionMix) の列を順に行へ展開する。resultsはジェネレータでよい。
+    """
+    for label, infusion_mix in results:
+        yield from iter_mix_rows(infusion_mix, label)
+
+def _with_columns(rows: Iterable[Dict[str, Any]], columns: Optional[List[str]]) -> Tuple[List[str], Iterator[Dict[str, Any]]]:
+    """
+    列が指定されていなければ先頭行のキーを列とする（先頭行は読み戻す）。
+    """
+    rows = iter(rows)
+    if columns is not None:
+        return columns, rows
+    first = next(rows, None)
+    if first is None:
+        return [], iter(())
+    return list(first.keys()), itertools.chain([first], rows)
+
+def write_csv(rows: Iterable[Dict[str, Any]], fp: IO[str], columns: Optional[List[str]] = None) -> int:
+    """
+    行をCSVとして逐次書き出し、書き出した行数を返す。
+    """
+    columns, rows = _with_columns(rows, columns)
+    writer = csv.DictWriter(fp, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+def write_jsonl(rows: Iterable[Dict[str, Any]], fp: IO[str]) -> int:
+    """
+    行をJSON Lines（1行1オブジェクト）として逐次書き出し、書き出した行数を返す。
+    """
+    count = 0
+    for row in rows:
+        fp.write(json.dumps(row, ensure_ascii=False, default=str))
+        fp.write('\n')
+        count += 1
+    return count
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def write_parquet(rows: Iterable[Dict[str, Any]], where, columns: Optional[List[str]] = None, batch_size: int = 1000) -> int:
+    """
+    行をbatch_size行ずつParquetに書き出す（pyarrowが必要）。メモリ使用量はバッチ1つ分に収まる。
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet出力には pyarrow が必要です。") from e
+
+    columns, rows = _with_columns(rows, columns)
+    writer = None
+    count = 0
+    try:
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            table = pa.Table.from_pylist(batch).select(columns)
+            if writer is None:
+                # 先頭バッチで全てNoneの列は型が決まらないため、数値列として扱う
+                schema = pa.schema([
+                    field.with_type(pa.float64()) if pa.types.is_null(field.type) else field
+                    for field in table.schema
+                ])
+                table = table.cast(schema)
+                writer = pq.ParquetWriter(where, schema)
+            else:
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+            count += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+def _worksheet_block(label: str, infusion_mix: InfusionMix) -> Iterator[str]:
+    yield "=" * 48
+    yield f"調製指示書  {label}"
+    if infusion_mix.catalog_version:
+        yield f"カタログバージョン: {infusion_mix.catalog_version}"
+    # 複数ラインで計算した場合はライン毎に、各ラインの投与時間で速度を求める
+    groups = [(line.label, line.volumes, line.hours) for line in infusion_mix.lines] if infusion_mix.lines \
+        else [(None, infusion_mix.detailed_mix, 24.0)]
+    for line_label, volumes, hours in groups:
+        yield "-" * 48
+        if line_label:
+            yield f"[{line_label}]  投与時間 {hours:g} h"
+        yield f"{'製剤名':<20}{'mL/day':>10}{'mL/h':>10}  確認"
+        total = 0.0
+        for product, volume in volumes.items():
+            if volume <= 0:
+                continue
+            total += volume
+            yield f"{product:<20}{volume:>10.2f}{volume / hours:>10.2f}  □"
+        yield "-" * 48
+        yield f"{'合計':<20}{total:>10.2f}{total / hours:>10.2f}"
+    yield ""
+    yield "調製者: ____________    監査者: ____________"
+    yield ""
+
+def write_worksheet(results: Iterable[Tuple[str, InfusionMix]], fp: IO[str]) -> int:
+    """
+    印刷用の調製指示書を逐次書き出し、出力した結果の件数を返す。使用量0の製剤は省略する。
+    """
+    count = 0
+    for label, infusion_mix in results:
+        for line in _worksheet_block(label, infusion_mix):
+            fp.write(line)
+            fp.write('\n')
+        count += 1
+    return count
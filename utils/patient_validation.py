@@ -0,0 +1,113 @@
+# utils/patient_validation.py
+
+from typing import Any, Dict, Iterable, List, Union
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel, TypeAdapter
+
+from models.patient import Patient, PATIENT_INPUT_LIMITS
+
+REQUIRED_FIELDS = ['weight', 'twi']
+# 目標値の項目（*_included と対になる）
+TARGET_FIELDS = ['gir', 'amino_acid', 'na', 'k', 'p', 'fat', 'ca', 'mg', 'zn', 'cl']
+
+_PATIENTS_ADAPTER = TypeAdapter(List[Patient])
+
+class RowError(BaseModel):
+    row: int  # 入力の行番号（0始まり）
+    field: str
+    value: Any = None
+    message: str
+
+class PatientValidationResult(BaseModel):
+    patients: List[Patient]
+    rows: List[int]  # patients[i] が何行目から作られたか
+    errors: List[RowError]
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+def _is_truthy(values: pd.Series) -> np.ndarray:
+    if values.dtype == bool:
+        return values.to_numpy()
+    text = values.astype(str).str.strip().str.lower()
+    return text.isin(['true', '1', '1.0', 'yes', 'y']).to_numpy()
+
+def validate_patient_rows(rows: Union[pd.DataFrame, Iterable[Dict[str, Any]]]) -> PatientValidationResult:
+    """
+    一括入力（センサス等）の患者データを列単位でまとめて検証する。
+    範囲は入力画面と同じ PATIENT_INPUT_LIMITS。全行のエラーを1回で返し、エラーの無い行だけPatientにする。
+    *_included 列が無い項目は、値があれば計算対象とみなす。
+    """
+    frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame.from_records(list(rows))
+    frame = frame.reset_index(drop=True)
+    row_count = len(frame)
+    invalid = np.zeros(row_count, dtype=bool)
+    errors: List[RowError] = []
+    columns: Dict[str, Any] = {}
+
+    def report(mask: np.ndarray, field: str, message: str, raw=None):
+        nonlocal invalid
+        for row in np.flatnonzero(mask):
+            value = None if raw is None else raw.iloc[row]
+            errors.append(RowError(row=int(row), field=field, value=None if pd.isna(value) else value, message=message))
+        invalid |= mask
+
+    for field in REQUIRED_FIELDS + TARGET_FIELDS:
+        if field not in frame:
+            if field in REQUIRED_FIELDS:
+                report(np.ones(row_count, dtype=bool), field, "必須項目がありません")
+            else:
+                columns[field] = np.full(row_count, np.nan)
+                columns[f"{field}_included"] = np.zeros(row_count, dtype=bool)
+            continue
+
+        raw = frame[field]
+        values = pd.to_numeric(raw, errors='coerce').to_numpy(dtype=float)
+        missing = raw.isna().to_numpy()
+        report(np.isnan(values) & ~missing, field, "数値ではありません", raw)
+
+        if field in REQUIRED_FIELDS:
+            included = np.ones(row_count, dtype=bool)
+            report(missing, field, "値がありません")
+        else:
+            included_column = f"{field}_included"
+            if included_column in frame:
+                included = _is_truthy(frame[included_column])
+                report(included & missing, field, "計算対象ですが値がありません")
+            else:
+                included = ~np.isnan(values)
+            columns[f"{field}_included"] = included
+
+        if field in PATIENT_INPUT_LIMITS:
+            low, high = PATIENT_INPUT_LIMITS[field]
+            with np.errstate(invalid='ignore'):
+                out_of_range = included & ~np.isnan(values) & ((values < low) | (values > high))
+            report(out_of_range, field, f"範囲外です（{low}〜{high}）", raw)
+        elif field in TARGET_FIELDS:
+            with np.errstate(invalid='ignore'):
+                report(included & (values < 0), field, "負の値は入力できません", raw)
+
+        # 計算対象外の値はPatientに渡さない（入力画面と同じ扱い）
+        columns[field] = np.where(included, values, np.nan)
+
+    errors.sort(key=lambda e: e.row)
+    valid_rows = np.flatnonzero(~invalid)
+    records = []
+    for row in valid_rows:
+        record = {}
+        for name, values in columns.items():
+            value = values[row]
+            if name.endswith('_included'):
+                record[name] = bool(value)
+            else:
+                record[name] = None if np.isnan(value) else float(value)
+        records.append(record)
+
+    return PatientValidationResult(
+        patients=_PATIENTS_ADAPTER.validate_python(records),
+        rows=[int(row) for row in valid_rows],
+        errors=errors,
+    )
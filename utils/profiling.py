@@ -0,0 +1,171 @@
+# utils/profiling.py
+
+import cProfile
+import io
+import logging
+import marshal
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+PROFILE_ENV_VAR = 'TPN_PROFILE'
+DEFAULT_TOP_N = 20
+
+class Hotspot(BaseModel):
+    function: str  # ファイル:行(関数名)
+    calls: int
+    total_time_ms: float  # 関数自体の時間
+    cumulative_time_ms: float  # 呼び出し先を含む時間
+
+class AllocationSite(BaseModel):
+    location: str  # ファイル:行
+    size_kb: float
+    count: int
+
+class ProfileReport(BaseModel):
+    label: str
+    elapsed_ms: float
+    peak_memory_kb: float
+    hotspots: List[Hotspot]
+    allocations: List[AllocationSite]
+    prof_data: bytes  # pstatsで読めるcProfileの生データ（.prof）
+
+    def summary_text(self) -> str:
+        """
+        ホットスポットと割り当て箇所の要約をテキストで返す。
+        """
+        lines = [
+            f"[{self.label}] 所要時間 {self.elapsed_ms:.1f} ms / ピークメモリ {self.peak_memory_kb:.1f} KB",
+            "",
+            f"{'累積(ms)':>10}{'自身(ms)':>10}{'呼出数':>8}  関数",
+        ]
+        for hotspot in self.hotspots:
+            lines.append(f"{hotspot.cumulative_time_ms:>10.2f}{hotspot.total_time_ms:>10.2f}{hotspot.calls:>8}  {hotspot.function}")
+        lines += ["", f"{'KB':>10}{'個数':>8}  割り当て箇所"]
+        for site in self.allocations:
+            lines.append(f"{site.size_kb:>10.1f}{site.count:>8}  {site.location}")
+        return "\n".join(lines)
+
+class ProfileResult:
+    """
+    profile_section() の結果の受け皿。ブロックを抜けた時点で report が設定される。
+    """
+    report: Optional[ProfileReport] = None
+
+def profiling_enabled() -> bool:
+    """
+    環境変数 TPN_PROFILE が 1/true/yes ならプロファイルを有効にする。
+    """
+    return os.environ.get(PROFILE_ENV_VAR, '').lower() in ('1', 'true', 'yes')
+
+# tracemallocはプロセス共通のため、計測区間はロックで直列化する（他の区間のピークや割り当てを混ぜない）。
+# 入れ子の区間ではトレースの開始・停止とピークのリセットを最も外側の区間だけが行う
+_profile_lock = threading.RLock()
+_tracing_depth = 0
+_owns_tracing = False
+
+def _enter_tracing():
+    global _tracing_depth, _owns_tracing
+    if _tracing_depth == 0:
+        _owns_tracing = not tracemalloc.is_tracing()
+        if _owns_tracing:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+    _tracing_depth += 1
+
+def _exit_tracing():
+    global _tracing_depth, _owns_tracing
+    _tracing_depth -= 1
+    if _tracing_depth == 0 and _owns_tracing:
+        _owns_tracing = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+@contextmanager
+def profile_section(label: str, top_n: int = DEFAULT_TOP_N):
+    """
+    ブロック内の処理をcProfileとtracemallocで計測する。
+    計測に失敗しても例外は送出せず（ブロック内の処理を妨げない）、report はNoneのままになる。
+    """
+    result = ProfileResult()
+    with _profile_lock:
+        profiler = None
+        try:
+            _enter_tracing()
+        except Exception as e:
+            logging.warning(f"メモリの計測を開始できませんでした: {e}")
+            yield result
+            return
+        try:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        except Exception as e:
+            # 別のプロファイラが有効な場合など
+            logging.warning(f"プロファイルを開始できませんでした: {e}")
+            profiler = None
+        start = time.perf_counter()
+        try:
+            yield result
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            try:
+                if profiler is not None:
+                    profiler.disable()
+                    snapshot = tracemalloc.take_snapshot()
+                    _, peak = tracemalloc.get_traced_memory()
+                    result.report = _build_report(label, profiler, snapshot, elapsed_ms, peak, top_n)
+            except Exception as e:
+                logging.warning(f"プロファイル結果を作成できませんでした: {e}")
+            finally:
+                _exit_tracing()
+
+def maybe_profile(enabled: bool, label: str, top_n: int = DEFAULT_TOP_N):
+    """
+    enabledの時だけ profile_section() を返す。無効時は何もしないコンテキスト（オーバーヘッドなし）で、値はNone。
+    """
+    return profile_section(label, top_n) if enabled else nullcontext()
+
+def _build_report(label: str, profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot,
+                  elapsed_ms: float, peak_bytes: int, top_n: int) -> ProfileReport:
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    stats.sort_stats(pstats.SortKey.CUMULATIVE)
+    hotspots = []
+    for func in stats.fcn_list[:top_n]:
+        calls, _, total_time, cumulative_time, _ = stats.stats[func]
+        filename, line, name = func
+        hotspots.append(Hotspot(
+            function=f"{filename}:{line}({name})",
+            calls=calls,
+            total_time_ms=total_time * 1000.0,
+            cumulative_time_ms=cumulative_time * 1000.0,
+        ))
+
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    allocations = [
+        AllocationSite(
+            location=f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            size_kb=stat.size / 1024.0,
+            count=stat.count,
+        )
+        for stat in snapshot.statistics('lineno')[:top_n]
+    ]
+
+    profiler.create_stats()
+    return ProfileReport(
+        label=label,
+        elapsed_ms=elapsed_ms,
+        peak_memory_kb=peak_bytes / 1024.0,
+        hotspots=hotspots,
+        allocations=allocations,
+        prof_data=marshal.dumps(profiler.stats),
+    )
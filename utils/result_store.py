@@ -0,0 +1,211 @@
+# utils/result_store.py
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import date, datetime
+from typing import Iterator, List, Optional
+
+from models.patient import Patient
+from models.infusion_mix import InfusionMix
+from models.stored_calculation import StoredCalculation
+
+DEFAULT_DB_PATH = os.environ.get(
+    'TPN_RESULT_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'results.db'),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calculations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id TEXT NOT NULL,
+    order_date TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    catalog_version TEXT,
+    base_solution_name TEXT NOT NULL,
+    patient_json TEXT NOT NULL,
+    infusion_mix_json TEXT NOT NULL,
+    elapsed_ms REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_calculations_patient_date
+    ON calculations (patient_id, order_date, id);
+CREATE INDEX IF NOT EXISTS idx_calculations_date
+    ON calculations (order_date, id);
+"""
+
+_INSERT_COLUMNS = "patient_id, order_date, created_at, catalog_version, base_solution_name, patient_json, infusion_mix_json, elapsed_ms"
+_COLUMNS = f"id, {_INSERT_COLUMNS}"
+
+_STOP = object()
+
+class ResultStoreError(RuntimeError):
+    """
+    計算結果を保存できない（書き込みスレッドの停止、書き込みの失敗、flush() のタイムアウト）。
+    """
+
+class ResultStore:
+    """
+    計算結果の追記専用ストア（SQLite, WALモード）。
+    書き込みはバックグラウンドスレッドで行い、計算のリクエスト処理を待たせない。
+    書き込みスレッドが接続できずに停止した場合、以降の record() / flush() は ResultStoreError を送出する。
+    個別の書き込みの失敗は次の flush() で ResultStoreError として報告する。
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._error: Optional[BaseException] = None  # 書き込みスレッドを停止させた例外
+        self._write_failures = 0  # 前回の flush() 以降に保存できなかった件数
+        self._last_write_error: Optional[BaseException] = None
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="ResultStoreWriter", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10.0)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _write_loop(self):
+        try:
+            conn = self._connect()
+        except Exception as e:
+            logging.error(f"計算結果ストアに接続できません。保存を停止します: {e}")
+            self._error = e
+            return
+        try:
+            while True:
+                item = self._queue.get()
+                try:
+                    if item is _STOP:
+                        return
+                    conn.execute(f"INSERT INTO calculations ({_INSERT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", item)
+                    conn.commit()
+                except Exception as e:
+                    logging.error(f"計算結果の保存に失敗しました: {e}")
+                    self._write_failures += 1
+                    self._last_write_error = e
+                finally:
+                    self._queue.task_done()
+        except Exception as e:
+            logging.error(f"計算結果の書き込みスレッドが停止しました: {e}")
+            self._error = e
+        finally:
+            conn.close()
+
+    def _check_writer(self):
+        if self._error is not None:
+            raise ResultStoreError(f"計算結果ストアが停止しています: {self._error}") from self._error
+        if not self._closed and not self._writer.is_alive():
+            raise ResultStoreError("計算結果の書き込みスレッドが停止しています。")
+
+    def record(
+        self,
+        patient_id: str,
+        order_date: date,
+        patient: Patient,
+        base_solution_name: str,
+        infusion_mix: InfusionMix,
+        elapsed_ms: float,
+        catalog_version: Optional[str] = None,
+    ):
+        """
+        計算結果を書き込みキューに追加する（ブロックしない）。
+        """
+        self._check_writer()
+        self._queue.put((
+            patient_id,
+            order_date.isoformat(),
+            datetime.now().isoformat(timespec='seconds'),
+            catalog_version,
+            base_solution_name,
+            patient.model_dump_json(),
+            infusion_mix.model_dump_json(),
+            elapsed_ms,
+        ))
+
+    def flush(self, timeout: Optional[float] = None):
+        """
+        キュー内の書き込みが全て完了するまで待つ（timeout秒で打ち切る）。
+        書き込みスレッドが停止した場合は待たずに、保存できなかった計算があった場合は完了後に ResultStoreError を送出する。
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                self._check_writer()
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    raise ResultStoreError(f"計算結果の保存が{timeout}秒以内に終わりませんでした。")
+                # 書き込みスレッドの停止を検知できるよう、短い間隔で確認する
+                self._queue.all_tasks_done.wait(min(remaining, 0.5) if remaining is not None else 0.5)
+        self._check_writer()
+        if self._write_failures:
+            failures, error = self._write_failures, self._last_write_error
+            self._write_failures, self._last_write_error = 0, None
+            raise ResultStoreError(f"{failures}件の計算結果を保存できませんでした: {error}")
+
+    def close(self):
+        self._closed = True
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+
+    def find(self, patient_id: str, order_date: Optional[date] = None, limit: int = 20) -> List[StoredCalculation]:
+        """
+        患者IDで保存済みの計算を新しい順に返す。order_dateを指定するとその日のオーダーに絞る。
+        """
+        sql = f"SELECT {_COLUMNS} FROM calculations WHERE patient_id = ?"
+        params = [patient_id]
+        if order_date is not None:
+            sql += " AND order_date = ?"
+            params.append(order_date.isoformat())
+        sql += " ORDER BY order_date DESC, id DESC LIMIT ?"
+        params.append(limit)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [_row_to_record(row) for row in rows]
+
+    def latest(self, patient_id: str, before: Optional[date] = None) -> Optional[StoredCalculation]:
+        """
+        患者の最新の計算を返す。beforeを指定するとその日より前のオーダーから探す。
+        """
+        sql = f"SELECT {_COLUMNS} FROM calculations WHERE patient_id = ?"
+        params = [patient_id]
+        if before is not None:
+            sql += " AND order_date < ?"
+            params.append(before.isoformat())
+        sql += " ORDER BY order_date DESC, id DESC LIMIT 1"
+        with closing(self._connect()) as conn:
+            row = conn.execute(sql, params).fetchone()
+        return _row_to_record(row) if row else None
+
+    def iter_records(self, start: date, end: date) -> Iterator[StoredCalculation]:
+        """
+        オーダー日が start〜end（両端含む）の計算を古い順に1件ずつ返す。全件をメモリに載せない。
+        """
+        sql = (f"SELECT {_COLUMNS} FROM calculations WHERE order_date BETWEEN ? AND ? "
+               "ORDER BY order_date, id")
+        with closing(self._connect()) as conn:
+            for row in conn.execute(sql, (start.isoformat(), end.isoformat())):
+                yield _row_to_record(row)
+
+def _row_to_record(row) -> StoredCalculation:
+    return StoredCalculation(
+        id=row[0],
+        patient_id=row[1],
+        order_date=date.fromisoformat(row[2]),
+        created_at=datetime.fromisoformat(row[3]),
+        catalog_version=row[4],
+        base_solution_name=row[5],
+        patient=Patient.model_validate_json(row[6]),
+        infusion_mix=InfusionMix.model_validate_json(row[7]),
+        elapsed_ms=row[8],
+    )